@@ -0,0 +1,167 @@
+# activity.py
+# activity_log için asenkron, batch'li yazıcı.
+# log_event() satırı kuyruğa atar ve hemen döner; arka plandaki thread satırları
+# execute_values ile toplu INSERT eder (boyut veya süre dolunca, kapanışta da flush).
+#
+# Env:
+#   ACTIVITY_BATCH_SIZE (100), ACTIVITY_FLUSH_SECONDS (1.0), ACTIVITY_QUEUE_MAX (10000)
+#   ACTIVITY_DROP_POLICY: drop_new (varsayılan) | drop_oldest | block
+
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+
+import psycopg2.extras
+
+from db import get_conn
+
+INSERT_SQL = ("INSERT INTO activity_log (id, user_id, username, action, report_id, title, ip, user_agent, extra) "
+              "VALUES %s;")
+DROP_POLICIES = {"drop_new", "drop_oldest", "block"}
+_WAKE = object()  # flush(): kuyrukta bekleyen yazıcıyı flush_seconds dolmadan uyandırır
+
+
+class ActivityWriter:
+    """Bounded kuyruk + tek arka plan yazıcı thread."""
+
+    def __init__(self, batch_size=100, flush_seconds=1.0, max_queue=10000, drop_policy="drop_new",
+                 block_timeout=0.5):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {sorted(DROP_POLICIES)}")
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self._q = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+    def _bump(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                # fork sonrası ebeveynin kuyruğu/thread'i bu süreçte geçersiz
+                self._q = queue.Queue(maxsize=self._q.maxsize)
+            self._stop.clear()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, row):
+        """row: INSERT_SQL sütun sırasıyla tuple. Kuyruk doluysa drop_policy uygulanır."""
+        self._ensure_started()
+        try:
+            if self.drop_policy == "block":
+                self._q.put(row, timeout=self.block_timeout)
+            else:
+                self._q.put_nowait(row)
+        except queue.Full:
+            if self.drop_policy == "drop_oldest":
+                try:
+                    self._q.get_nowait()
+                    self._bump("dropped")
+                    self._q.put_nowait(row)
+                except (queue.Empty, queue.Full):
+                    self._bump("dropped")
+                    return False
+            else:
+                self._bump("dropped")
+                return False
+        self._bump("enqueued")
+        return True
+
+    def _drain(self, first=None, limit=None):
+        batch = [] if first is None else [first]
+        limit = limit or self.batch_size
+        while len(batch) < limit:
+            try:
+                row = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if row is not _WAKE:
+                batch.append(row)
+        return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    psycopg2.extras.execute_values(cur, INSERT_SQL, batch, page_size=len(batch))
+                conn.commit()
+            self._bump("written", len(batch))
+            self._bump("batches")
+        except Exception as e:
+            self._bump("failed", len(batch))
+            print(f"[activity] {len(batch)} satır yazılamadı: {e}", file=sys.stderr, flush=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_seconds
+            batch = []
+            while len(batch) < self.batch_size and not self._stop.is_set():
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is _WAKE:
+                    break
+                batch.extend(self._drain(row, self.batch_size - len(batch)))
+            self._write(batch)
+        # kapanış: kuyrukta kalanları yaz
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._write(batch)
+
+    def flush(self, timeout=5.0):
+        """Thread'i durdurur, kuyrukta kalanları yazar (atexit)."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        try:
+            self._q.put_nowait(_WAKE)
+        except queue.Full:
+            pass  # kuyruk doluysa get() zaten beklemeden döner
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["queued"] = self._q.qsize()
+        s["max_queue"] = self._q.maxsize
+        s["drop_policy"] = self.drop_policy
+        return s
+
+
+_WRITER = ActivityWriter(
+    batch_size=int(os.getenv("ACTIVITY_BATCH_SIZE", "100")),
+    flush_seconds=float(os.getenv("ACTIVITY_FLUSH_SECONDS", "1.0")),
+    max_queue=int(os.getenv("ACTIVITY_QUEUE_MAX", "10000")),
+    drop_policy=os.getenv("ACTIVITY_DROP_POLICY", "drop_new"),
+)
+atexit.register(_WRITER.flush)
+
+
+def get_writer():
+    return _WRITER
@@ -1,5 +1,5 @@
-from flask import Flask, render_template_string, request, redirect, url_for, session, send_file
-import fitz  # PyMuPDF
+from flask import Flask, render_template_string, request, redirect, url_for, session, send_file, jsonify, Response, stream_with_context
+from markupsafe import escape
 import openai
 import datetime
 import os
@@ -8,8 +8,30 @@ import uuid
 import json
 import psycopg2
 import psycopg2.extras
-import numpy as np
-import re
+import sys
+import threading
+import time
+
+from activity import get_writer as get_activity_writer
+from db import get_conn, get_pool
+from embeddings import get_cache as get_embedding_cache, get_embedding
+from chunking import (condense, count_tokens, document_embedding, report_budget, truncate_tokens,
+                      PROMPT_FEEDBACK_TOKENS, PROMPT_SIMILAR_TOKENS)
+from jobs import get_queue as get_job_queue
+import passages
+import report_fields
+import quantize
+import report_meta
+import lexical
+import watermark
+from report_fields import top_keywords, incident_summary_from_markdown
+from pdftext import extract_text as extract_pdf_text, size_of as pdf_size_of, PDF_MAX_BYTES
+from similar_cache import get_cache as get_similar_cache, FUSED
+import pdf_store
+from pdfrender import generate_pdf_report, generate_pdf_full, PDF_COMPACT
+from sharedcache import get_backend as get_shared_cache
+from pdf_store import get_store as get_pdf_store
+from vector_index import EmbeddingIndex
 
 # ---------- OpenAI (0.28.x) ----------
 from config import API_KEY
@@ -17,108 +39,153 @@ openai.api_key = API_KEY
 
 # ---------- DB ----------
 DB_URL = os.getenv("DATABASE_URL")
+# "memory" (varsayılan) ya da "pgvector" (scripts/migrate_pgvector.py çalıştırıldıktan sonra)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "memory").lower()
+PGVECTOR_EF_SEARCH = int(os.getenv("PGVECTOR_EF_SEARCH", "100"))
+PGVECTOR_PROBES = int(os.getenv("PGVECTOR_PROBES", "10"))
+# Filtreli (scope / meta) sorgu: HNSW ~ef_search komşu bulup WHERE'i sonra uygular, seçici filtrede liste boşalır.
+# pgvector >= 0.8 ise iterative scan (relaxed_order) açılır; her sürümde k'dan az satır dönerse sorgu
+# index'siz (exact, filtre btree index'leriyle) tekrarlanır. Sürüm init_db'de okunur.
+PGVECTOR_ITERATIVE = False
+# Parça düzeyinde benzer arama (passages.py); pgvector'de sreport_passages.embedding_vec gerekir
+PASSAGE_SEARCH = os.getenv("PASSAGE_SEARCH", "1") == "1"
+# Hibrit arama (lexical.py): full-text (sreports.report_tsv, GIN) adayları vektör adaylarıyla RRF ile tek listede
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+LEXICAL_K = int(os.getenv("LEXICAL_K", "30"))                   # sözcüksel aday sayısı
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "1.0"))      # RRF'de sözcüksel listenin ağırlığı (vektör: 1)
+LEXICAL_MIN_SIM = float(os.getenv("LEXICAL_MIN_SIM", "0.40"))   # sadece sözcüksel gelen adayın en düşük kosinüsü
+LEXICAL_TIMEOUT_MS = int(os.getenv("LEXICAL_TIMEOUT_MS", "500"))  # aşılırsa liste sadece vektör adaylarından
+SEARCH_MIN_SIM = float(os.getenv("SEARCH_MIN_SIM", "0.30"))     # /search: kısa sorgu-belge kosinüsü düşük olur
+# analiz modeli; rapor bütçesi bağlamdan (chunking.ANALYSIS_CONTEXT_TOKENS) bununla hesaplanır
+ANALYSIS_MODEL, ANALYSIS_MAX_TOKENS = "gpt-4", 1200
+# GPT çıktısını SSE ile token token göster (0: iş bitene kadar poll)
+ANALYZE_STREAM = os.getenv("ANALYZE_STREAM", "1") == "1"
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "300"))
 
 def init_db():
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor()
-
-    # Raporlar
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS sreports (
-        id UUID PRIMARY KEY,
-        method TEXT,
-        lang TEXT,
-        report_text TEXT,
-        result_text TEXT,
-        embedding JSONB,
-        created_at TIMESTAMP DEFAULT NOW()
-    );
-    """)
-
-    # Kullanıcılar
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS susers (
-        id UUID PRIMARY KEY,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        can_see_similar BOOLEAN DEFAULT TRUE,
-        is_active BOOLEAN DEFAULT TRUE,
-        created_at TIMESTAMP DEFAULT NOW()
-    );
-    """)
-    cur.execute("ALTER TABLE susers ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE;")
-
-    # Activity log
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS activity_log (
-        id UUID PRIMARY KEY,
-        user_id UUID,
-        username TEXT,
-        action TEXT NOT NULL,
-        report_id UUID,
-        title TEXT,
-        ip TEXT,
-        user_agent TEXT,
-        extra JSONB,
-        created_at TIMESTAMP DEFAULT NOW()
-    );
-    """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_created ON activity_log(created_at DESC);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_user ON activity_log(username);")
-
-    conn.commit()
-    cur.close()
-    conn.close()
-
-init_db()
+    get_pool(DB_URL)  # süreç başına havuz (DB_POOL_MIN / DB_POOL_MAX)
+    with get_conn() as conn:
+        cur = conn.cursor()
 
-# ---------- Helpers ----------
-STOP = set("""
-the and for with that this from into over under across about above below between during after before while would could
-have has had were was are is been being also only more most less least very much many such those these then than
-shall will may might can cannot not nor but yet though although because since due therefore however hence
-""".split())
+        # Raporlar
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS sreports (
+            id UUID PRIMARY KEY,
+            method TEXT,
+            lang TEXT,
+            report_text TEXT,
+            result_text TEXT,
+            embedding JSONB,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """)
 
+        # Kullanıcılar
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS susers (
+            id UUID PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            can_see_similar BOOLEAN DEFAULT TRUE,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """)
+        cur.execute("ALTER TABLE susers ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE;")
+
+        # Activity log
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS activity_log (
+            id UUID PRIMARY KEY,
+            user_id UUID,
+            username TEXT,
+            action TEXT NOT NULL,
+            report_id UUID,
+            title TEXT,
+            ip TEXT,
+            user_agent TEXT,
+            extra JSONB,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_created ON activity_log(created_at DESC);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_user ON activity_log(username);")
+
+        conn.commit()
+
+        # /analyze iş kuyruğu
+        get_job_queue().ensure_schema(conn)
+        # parça (passage) embedding'leri
+        passages.ensure_schema(conn)
+        # türetilmiş alanlar (keywords / incident_summary / snippet)
+        report_fields.ensure_columns(conn)
+        # sıkıştırılmış embedding kopyası (quantize.py; sreports + sreport_passages)
+        quantize.ensure_columns(conn)
+        # yapısal meta (olay tarihi, meydan, eyalet, hava aracı, safha) -> filtreli benzer arama
+        report_meta.ensure_columns(conn)
+        # index senkronu için embedding yazılma damgası (trigger); meta kolonlarından sonra
+        watermark.ensure_schema(conn)
+
+        # full-text kolonu + GIN index (lexical.py); GENERATED kolon Postgres 12+ ister
+        global HYBRID_SEARCH
+        if HYBRID_SEARCH:
+            try:
+                lexical.ensure_columns(conn)
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"[init_db] sreports.report_tsv kurulamadı ({e}), hibrit arama kapalı.", flush=True)
+                HYBRID_SEARCH = False
+
+        # pgvector backend seçildiyse migration yapılmış olmalı; değilse in-process index'e düş
+        global VECTOR_BACKEND
+        if VECTOR_BACKEND == "pgvector":
+            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name='sreports' AND column_name='embedding_vec';")
+            if not cur.fetchone():
+                print("[init_db] sreports.embedding_vec yok (scripts/migrate_pgvector.py?), VECTOR_BACKEND=memory kullanılıyor.", flush=True)
+                VECTOR_BACKEND = "memory"
+        global PGVECTOR_ITERATIVE
+        if VECTOR_BACKEND == "pgvector":
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname='vector';")
+            ver = cur.fetchone()
+            try:
+                PGVECTOR_ITERATIVE = bool(ver) and tuple(int(x) for x in ver[0].split(".")[:2]) >= (0, 8)
+            except ValueError:
+                PGVECTOR_ITERATIVE = False
+            if not PGVECTOR_ITERATIVE:
+                print(f"[init_db] pgvector {ver[0] if ver else '?'} < 0.8: filtreli aramada iterative scan yok, "
+                      "eksik sonuçta exact taramaya düşülür.", flush=True)
+        global PASSAGE_SEARCH
+        if VECTOR_BACKEND == "pgvector" and PASSAGE_SEARCH:
+            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name='sreport_passages' AND column_name='embedding_vec';")
+            if not cur.fetchone():
+                print("[init_db] sreport_passages.embedding_vec yok (scripts/migrate_pgvector.py), parça araması kapalı.", flush=True)
+                PASSAGE_SEARCH = False
+
+        cur.close()
+
+# `python app.py` ile çalışınca pdftext'in spawn process pool'u bu modülü her çocukta __mp_main__ olarak
+# yeniden import eder; orada DB'ye bağlanılmaz ve job worker başlatılmaz (çocuk sadece sayfa metni çıkarır).
+_POOL_CHILD = __name__ == "__mp_main__"
+if not _POOL_CHILD:
+    init_db()
+
+# ---------- Helpers ----------
 def extract_text_from_pdf(pdf_file) -> str:
-    text = ""
-    with fitz.open(stream=pdf_file.read(), filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text()
-    return text.strip()
-
-def get_embedding(text: str):
-    emb = openai.Embedding.create(model="text-embedding-3-small", input=text)
-    return emb["data"][0]["embedding"]
-
-def cosine_similarity(v1, v2) -> float:
-    a, b = np.array(v1, dtype=float), np.array(v2, dtype=float)
-    denom = (np.linalg.norm(a) * np.linalg.norm(b)) or 1e-9
-    return float(np.dot(a, b) / denom)
-
-def top_keywords(text: str, k=10):
-    words = re.findall(r"[A-Za-z]{4,}", text.lower())
-    words = [w for w in words if w not in STOP]
-    freq = {}
-    for w in words:
-        freq[w] = freq.get(w, 0) + 1
-    return [w for w, _ in sorted(freq.items(), key=lambda x: -x[1])[:k]]
-
-def incident_summary_from_markdown(md: str) -> str:
-    m = re.search(r"(?im)^###\s*Incident Summary\s*\n(.+?)(?:\n###|\Z)", md, re.S)
-    if not m:
-        return "\n".join(md.strip().splitlines()[:4])
-    return m.group(1).strip()
-
-def build_why_similar(curr_text: str, past_text: str, overlap_terms, sim_score: float) -> str:
-    """İnsan gibi kısa açıklama."""
+    """bytes / dosya / FileStorage; sayfa ve bayt limitleri, büyük belgede process pool (pdftext.py)."""
+    return extract_pdf_text(pdf_file)
+
+def build_why_similar(overlap_terms, sim_score) -> str:
+    """İnsan gibi kısa açıklama; sim_score None ise sadece full-text eşleşmesi (kod araması)."""
     if overlap_terms:
-        because = f"they both center on {', '.join(overlap_terms[:3])} and show a comparable pattern of contributing factors"
+        because = f"they both center on {', '.join(str(escape(t)) for t in overlap_terms[:3])} and show a comparable pattern of contributing factors"
     else:
         because = "they share a comparable sequence of contributing factors during a similar operational phase"
     warn = ("Contexts may differ (aircraft, airport, crew, weather); use these parallels to inspire mitigations, "
             "not as one-to-one prescriptions.")
-    return (f"These two reports are similar because {because}. "
-            f"Approximate similarity score: {sim_score:.2f}. {warn}")
+    score = (f"Approximate similarity score: {sim_score:.2f}." if sim_score is not None
+             else "Matched by exact terms (full-text search).")
+    return f"These two reports are similar because {because}. {score} {warn}"
 
 def _client_ip():
     fwd = request.headers.get("X-Forwarded-For", "")
@@ -126,23 +193,22 @@ def _client_ip():
         return fwd.split(",")[0].strip()
     return request.remote_addr or ""
 
-def log_event(action, report_id=None, title=None, extra=None, username=None):
+def log_event(action, report_id=None, title=None, extra=None, username=None, ctx=None):
+    """Satırı activity.py kuyruğuna atar; INSERT arka planda batch'li yapılır.
+    ctx: request dışında (job worker) {"user_id", "username", "ip", "user_agent"}."""
     try:
-        uid = session.get("user_id")
-        uname = username or session.get("username")
-        ua = (request.headers.get("User-Agent") or "")[:300]
-        ip = _client_ip()
-        conn = psycopg2.connect(DB_URL, sslmode="require")
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO activity_log (id, user_id, username, action, report_id, title, ip, user_agent, extra) "
-            "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s);",
+        if ctx is None:
+            ctx = {"user_id": session.get("user_id"), "username": session.get("username"),
+                   "ip": _client_ip(), "user_agent": (request.headers.get("User-Agent") or "")[:300]}
+        uid = ctx.get("user_id")
+        uname = username or ctx.get("username")
+        ua, ip = ctx.get("user_agent"), ctx.get("ip")
+        get_activity_writer().submit(
             (str(uuid.uuid4()), uid, uname, action, report_id, title, ip, ua, json.dumps(extra or {}))
         )
-        conn.commit()
-        cur.close(); conn.close()
-    except Exception:
-        pass
+    except Exception as e:
+        print(f"[log_event] {action}: {e}", file=sys.stderr, flush=True)
+
 def build_prompt(text, method, out_lang, feedback=None, similar_cases=None):
     lang_map = {
         "English": "Write the full analysis in clear, professional English.",
@@ -153,11 +219,17 @@ def build_prompt(text, method, out_lang, feedback=None, similar_cases=None):
     extra = ""
     if similar_cases:
         extra += "\n\n📌 The AI has detected similar past safety reports:\n"
+        used = 0
         for c in similar_cases:
-            extra += (
-                f"- (Similarity {c['sim']:.2f}) {c['snippet']}\n"
+            # benzer vakalar toplamda PROMPT_SIMILAR_TOKENS'ı aşmasın (en benzerler önce)
+            item = (
+                f"- (Similarity {c['sim']:.2f}) {c['snippet'][:600]}\n"
                 f"    Why similar: {c['why']}\n"
             )
+            used += count_tokens(item)
+            if used > PROMPT_SIMILAR_TOKENS:
+                break
+            extra += item
 
     base_prompt = f"""
 You are an aviation safety analyst AI. Analyze the following safety report using the "{method}" method.
@@ -186,127 +258,38 @@ Here is the full report text:
 {extra}
 """
     if feedback:
+        feedback = truncate_tokens(feedback, PROMPT_FEEDBACK_TOKENS)
         base_prompt += f"\n\n*** Additional Reviewer Feedback to incorporate: ***\n{feedback}\n"
     return base_prompt
 
-def analyze_with_gpt(text, method="Five Whys", out_lang="English", feedback=None, similar_cases=None):
-    resp = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": build_prompt(text, method, out_lang, feedback, similar_cases)}],
-        max_tokens=1200
-    )
-    return resp.choices[0].message.content.strip()
-
-# ---------- PDF ----------
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem, HRFlowable
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.lib import colors
-
-def _header_footer(canvas, doc):
-    canvas.saveState()
-    canvas.setFont("Helvetica-Bold", 10)
-    canvas.setFillColor(colors.HexColor("#06b6d4"))
-    canvas.drawString(doc.leftMargin, doc.height + doc.topMargin - 10, "✈ AI Safety Report Analyzer")
-    canvas.setFont("Helvetica", 9)
-    canvas.setFillColor(colors.grey)
-    canvas.drawRightString(doc.leftMargin + doc.width, 12, f"Page {doc.page}")
-    canvas.restoreState()
-
-def _mk_styles():
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle("Title2", parent=styles["Heading1"], alignment=TA_CENTER,
-                                 fontName="Helvetica-Bold", fontSize=18,
-                                 textColor=colors.HexColor("#22d3ee"), spaceAfter=10)
-    h2 = ParagraphStyle("H2", parent=styles["Heading2"], fontName="Helvetica-Bold",
-                        fontSize=14, textColor=colors.HexColor("#38bdf8"),
-                        spaceBefore=10, spaceAfter=6)
-    body = ParagraphStyle("Body", parent=styles["BodyText"], fontName="Helvetica",
-                          fontSize=10.5, leading=14.5, spaceAfter=6)
-    return title_style, h2, body
-
-def _render_simple_markdown(elements, markdown_text, h2, body):
-    lines = [ln.rstrip() for ln in markdown_text.splitlines()]
-    i, para_buf = 0, []
-
-    def flush_p():
-        nonlocal para_buf
-        if para_buf:
-            elements.append(Paragraph(" ".join(para_buf).strip(), body))
-            para_buf = []
-
-    bullet_re = re.compile(r"^\s*[-•]\s+")
-    numbered_re = re.compile(r"^\s*\d+\.\s+")
-    while i < len(lines):
-        ln = lines[i]
-        if not ln.strip():
-            flush_p(); elements.append(Spacer(1,4)); i += 1; continue
-        if ln.startswith("### "):
-            flush_p(); elements.append(Spacer(1,2))
-            elements.append(HRFlowable(width="100%", thickness=0.4, color=colors.HexColor("#0ea5e9"), spaceAfter=4))
-            elements.append(Paragraph(ln[4:].strip(), h2)); i += 1; continue
-        if bullet_re.match(ln):
-            flush_p(); items=[]
-            while i < len(lines) and bullet_re.match(lines[i]):
-                txt = bullet_re.sub("", lines[i]).strip()
-                items.append(ListItem(Paragraph(txt, body), leftIndent=6)); i += 1
-            elements.append(ListFlowable(items, bulletType="bullet", leftPadding=12)); elements.append(Spacer(1,4)); continue
-        if numbered_re.match(ln):
-            flush_p(); items=[]
-            while i < len(lines) and numbered_re.match(lines[i]):
-                txt = numbered_re.sub("", lines[i]).strip()
-                items.append(ListItem(Paragraph(txt, body), leftIndent=6)); i += 1
-            elements.append(ListFlowable(items, bulletType="1", leftPadding=12)); elements.append(Spacer(1,4)); continue
-        para_buf.append(ln); i += 1
-    flush_p()
-
-def generate_pdf_report(markdown_text: str, title="Safety Report"):
-    buf = io.BytesIO()
-    doc = SimpleDocTemplate(buf, pagesize=A4,
-                            leftMargin=18*mm, rightMargin=18*mm,
-                            topMargin=20*mm, bottomMargin=16*mm, title=title)
-    title_style, h2, body = _mk_styles()
-    elements = [Paragraph(title, title_style),
-                HRFlowable(width="100%", thickness=0.6, color=colors.HexColor("#0ea5e9"), spaceAfter=8)]
-    _render_simple_markdown(elements, markdown_text, h2, body)
-    doc.build(elements, onFirstPage=_header_footer, onLaterPages=_header_footer)
-    buf.seek(0)
-    return buf
-
-def generate_pdf_full(current_markdown, similar_list, title="Safety Report (with similar)"):
-    buf = io.BytesIO()
-    doc = SimpleDocTemplate(buf, pagesize=A4,
-                            leftMargin=18*mm, rightMargin=18*mm,
-                            topMargin=20*mm, bottomMargin=16*mm, title=title)
-    title_style, h2, body = _mk_styles()
-    els = [Paragraph(title, title_style),
-           HRFlowable(width="100%", thickness=0.6, color=colors.HexColor("#0ea5e9"), spaceAfter=8)]
-
-    els.append(Paragraph("Current Report", h2))
-    els.append(Paragraph(current_markdown.replace("\n", "<br/>"), body))
-    els.append(Spacer(1,10))
-
-    if similar_list:
-        els.append(Paragraph("Similar Cases", h2))
-        for i, c in enumerate(similar_list, 1):
-            els.append(Paragraph(f"Case {i} — Similarity: {c['sim']:.2f}", body))
-            els.append(Paragraph(f"Why similar: {c['why']}", body))
-            els.append(Paragraph(f"Snippet:", body))
-            els.append(Paragraph(c["snippet"].replace("\n", "<br/>"), body))
-            els.append(Spacer(1,6))
-            if c.get("full_markdown"):
-                els.append(Paragraph("<b>Full Case Report</b>", body))
-                els.append(Paragraph(c["full_markdown"].replace("\n", "<br/>"), body))
-                els.append(Spacer(1,10))
-
-    doc.build(els, onFirstPage=_header_footer, onLaterPages=_header_footer)
-    buf.seek(0)
-    return buf
+def analysis_messages(text, method, out_lang, feedback=None, similar_cases=None):
+    """Rapor, modelin bağlamına sığacak kadar özetlenir (chunking.condense): bütçe = ANALYSIS_CONTEXT_TOKENS
+    - ANALYSIS_MAX_TOKENS - raporsuz prompt (şablon + kullanılan benzer vakalar + kırpılmış feedback)."""
+    overhead = count_tokens(build_prompt("", method, out_lang, feedback, similar_cases))
+    budget = report_budget(overhead, ANALYSIS_MAX_TOKENS)
+    return [{"role": "user", "content": build_prompt(condense(text, budget), method, out_lang, feedback, similar_cases)}]
+
+def analyze_with_gpt(text, method="Five Whys", out_lang="English", feedback=None, similar_cases=None, on_token=None):
+    """on_token verilirse stream=True: her parçada o ana kadarki metinle çağrılır.
+    Uzun rapor önce map-reduce ile bağlama sığdırılır (analysis_messages)."""
+    messages = analysis_messages(text, method, out_lang, feedback, similar_cases)
+    if on_token is None:
+        resp = openai.ChatCompletion.create(model=ANALYSIS_MODEL, messages=messages, max_tokens=ANALYSIS_MAX_TOKENS)
+        return resp.choices[0].message.content.strip()
+
+    parts = []
+    for chunk in openai.ChatCompletion.create(model=ANALYSIS_MODEL, messages=messages, max_tokens=ANALYSIS_MAX_TOKENS,
+                                              stream=True):
+        delta = chunk.choices[0].get("delta", {}).get("content")
+        if delta:
+            parts.append(delta)
+            on_token("".join(parts))
+    return "".join(parts).strip()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "change-this-secret")
+# PDF limiti + form alanları için pay; üstü werkzeug tarafından 413
+app.config["MAX_CONTENT_LENGTH"] = PDF_MAX_BYTES + 1024 * 1024
 PAGE = """
 <!doctype html>
 <html lang="en">
@@ -316,6 +299,7 @@ PAGE = """
   <title>Safety Analyzer</title>
   <script src="https://cdn.tailwindcss.com"></script>
   <script src="https://unpkg.com/htmx.org@2.0.3"></script>
+  <script src="https://unpkg.com/htmx-ext-sse@2.2.2/sse.js"></script>
   <style>
     button:active { transform: scale(0.97); }
     button[disabled] { opacity: .6; cursor: not-allowed; }
@@ -383,6 +367,21 @@ PAGE = """
         </div>
       </form>
 
+      {% if session.get('can_see_similar', True) %}
+      <form hx-get="{{ url_for('search_cases') }}" hx-target="#search-results" hx-swap="innerHTML"
+            class="bg-white/10 p-6 rounded-3xl mb-4 flex flex-wrap gap-3 items-center">
+        <input name="q" required placeholder="Search reports: C-GABC, CYOW, PW127, bird strike on approach…"
+               class="flex-1 p-2 bg-slate-800/70 rounded-lg"/>
+        <select name="scope" class="p-2 bg-slate-800/70 rounded-lg">
+          <option value="all">Local DB + CADORS</option>
+          <option value="internal">Local DB</option>
+          <option value="cadors">only CADORS</option>
+        </select>
+        <button class="px-6 py-2 bg-gradient-to-r from-emerald-400 via-cyan-500 to-blue-500 rounded-xl">🔎 Search</button>
+      </form>
+      <div id="search-results" class="mb-12"></div>
+      {% endif %}
+
       <div id="reports" class="space-y-10"></div>
     {% endif %}
   </div>
@@ -495,14 +494,401 @@ ADMIN_PAGE = """
 </body>
 </html>
 """
-def _fetch_all_reports():
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    # method'i da alalım ki scope filtreleyelim
-    cur.execute("SELECT id, method, report_text, result_text, embedding FROM sreports ORDER BY created_at DESC LIMIT 1000;")
+# index yüklemesi: embedding_q (BYTEA, ~1.5 KB) varsa JSONB (~25 KB) hiç okunmaz
+_EMB_COLS = "embedding_q, CASE WHEN embedding_q IS NULL THEN embedding END AS embedding"
+
+def _iter_embedded_reports(since=None):
+    """Embedding'i olan tüm satırları server-side cursor ile akıtır (LIMIT yok).
+    since: embedded_at alt sınırı (watermark.py; embedding'i sonradan yazılan satırlar da gelir)."""
+    with get_conn() as conn:
+        cur = conn.cursor(name=f"emb_{uuid.uuid4().hex}", cursor_factory=psycopg2.extras.DictCursor)
+        cur.itersize = 2000
+        cols = f"id, method, {_EMB_COLS}, created_at, embedded_at, {report_meta.META_COLS}"
+        if since is None:
+            cur.execute(f"SELECT {cols} FROM sreports WHERE embedding IS NOT NULL ORDER BY embedded_at;")
+        else:
+            cur.execute(f"SELECT {cols} FROM sreports WHERE embedding IS NOT NULL AND embedded_at > %s "
+                        "ORDER BY embedded_at;", (since,))
+        try:
+            for r in cur:
+                yield r
+        finally:
+            cur.close()
+
+# ---------- Embedding index (process-wide) ----------
+INDEX_REFRESH_SECONDS = float(os.getenv("INDEX_REFRESH_SECONDS", "60"))
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ann_index.npz"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))          # recall/latency ayarı (0 = tam tarama)
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "5000"))   # bunun altında IVF kurulmaz
+# RAM'deki matris: float32 | float16 | int8 (quantize.py); kuantize ise en iyi k*INDEX_RERANK aday exact ile sıralanır.
+# Exact kopya: snapshot'tan (embedding_snapshot.py --dtype int8) açılınca diskteki exact.npy, DB'den kurulunca RAM'de
+# (INDEX_RERANK=0 ile tutulmaz; int8'de recall@10 ~0.99, bkz. scripts/bench_quant.py).
+INDEX_QUANT = os.getenv("INDEX_QUANT", "float32").lower()
+INDEX_RERANK = int(os.getenv("INDEX_RERANK", "4"))
+# scripts/embedding_snapshot.py ile üretilen memmap snapshot (varsa npz'den önce denenir)
+EMB_SNAPSHOT_DIR = os.getenv("EMB_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "emb_snapshot"))
+_INDEX = EmbeddingIndex(quant=INDEX_QUANT, rerank=INDEX_RERANK)
+_INDEX_STATE = {"watermark": None, "recent": {}, "synced_at": 0.0, "lock": threading.Lock(), "snapshot": EMB_SNAPSHOT_DIR}
+
+# Parça (passage) index'i: id'ler "<report_id>:<ord>" (passages.py)
+PASSAGE_FANOUT = int(os.getenv("PASSAGE_FANOUT", "5"))   # belge başına k için taranacak parça sayısı çarpanı
+PASSAGE_INDEX_PATH = os.getenv("PASSAGE_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "passage_index.npz"))
+PASSAGE_SNAPSHOT_DIR = os.getenv("PASSAGE_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "passage_snapshot"))
+_PASSAGES = EmbeddingIndex(quant=INDEX_QUANT, rerank=INDEX_RERANK)
+_PASSAGE_STATE = {"watermark": None, "recent": {}, "synced_at": 0.0, "lock": threading.Lock(),
+                  "snapshot": PASSAGE_SNAPSHOT_DIR}
+
+# Benzer-liste cache'i (similar_cache.py) için corpus sürümü. memory: index sürümleri;
+# pgvector: bu süreçteki ekleme sayacı (başka süreçlerin eklediklerini TTL sınırlar).
+_CORPUS = {"gen": 0, "lock": threading.RLock()}
+
+def _track_watermark(rows, state, dedupe=False):
+    """(id, method, emb, meta) üretir; watermark = en büyük embedded_at. dedupe: OVERLAP penceresinde
+    aynı (id, embedded_at) ikinci kez gelirse atlanır (tam yüklemede kapalı, recent şişmesin)."""
+    recent = state["recent"]
+    for r in rows:
+        ts = r["embedded_at"]
+        if dedupe and ts is not None:
+            rid = str(r["id"])
+            if recent.get(rid) == ts:
+                continue
+            recent[rid] = ts
+        if ts and (state["watermark"] is None or ts > state["watermark"]):
+            state["watermark"] = ts
+        emb = r["embedding_q"] if r["embedding_q"] is not None else r["embedding"]
+        yield r["id"], r["method"], emb, report_meta.row_meta(r)
+
+def _index_load(index, state, path, iter_rows):
+    """Önce memmap snapshot'ı, sonra diskteki ANN index'i dener; yoksa tüm corpus'tan kurar ve diske yazar."""
+    sources = []
+    if state.get("snapshot") and EmbeddingIndex.snapshot_path(state["snapshot"]):
+        sources.append((state["snapshot"], index.load_snapshot))
+    if path and os.path.exists(path):
+        sources.append((path, index.load_file))
+    for src, load in sources:
+        try:
+            info = load(src)
+            if info.get("watermark_kind") != watermark.KIND:
+                # created_at watermark'lı eski dosya: sonradan embed edilen satırları kaçırmış olabilir
+                raise ValueError("watermark embedded_at değil, yeniden kurulacak")
+            wm = info.get("watermark")
+            state["watermark"] = datetime.datetime.fromisoformat(wm) if wm else None
+            rows = _track_watermark(iter_rows(watermark.since(state["watermark"])), state, dedupe=True)
+            for rid, method, emb, meta in rows:
+                index.add(rid, method, emb, meta)
+            return
+        except Exception as e:
+            print(f"[index] {src} okunamadı: {e}", flush=True)
+    state["watermark"] = None
+    index.load(_track_watermark(iter_rows(None), state))
+    if len(index) >= ANN_MIN_ROWS:
+        index.train()
+    if path:
+        try:
+            index.save(path, meta={"watermark": state["watermark"], "watermark_kind": watermark.KIND})
+        except OSError as e:
+            print(f"[index] {path} yazılamadı: {e}", flush=True)
+
+def _sync(index, state, path, iter_rows):
+    """İlk çağrıda index'i yükler; sonra başka süreçlerin eklediği / embed ettiği satırları
+    (embedded_at > watermark - OVERLAP, watermark.py) çeker."""
+    now = time.time()
+    if index.loaded and now - state["synced_at"] < INDEX_REFRESH_SECONDS:
+        return index
+    with state["lock"]:
+        if index.loaded and now - state["synced_at"] < INDEX_REFRESH_SECONDS:
+            return index
+        if not index.loaded:
+            _index_load(index, state, path, iter_rows)
+        else:
+            with _CORPUS["lock"]:
+                old = _version_now()
+                rows = list(_track_watermark(iter_rows(watermark.since(state["watermark"])), state, dedupe=True))
+                state["recent"] = watermark.prune(state["recent"], state["watermark"])
+                for rid, method, emb, meta in rows:
+                    index.add(rid, method, emb, meta)
+                get_similar_cache().note_added(old, _version_now(),
+                                               [(passages.report_of(rid), method, emb) for rid, method, emb, _ in rows])
+        state["synced_at"] = now
+    return index
+
+def _index_sync():
+    return _sync(_INDEX, _INDEX_STATE, ANN_INDEX_PATH, _iter_embedded_reports)
+
+def _passage_sync():
+    return _sync(_PASSAGES, _PASSAGE_STATE, PASSAGE_INDEX_PATH, passages.iter_passage_rows)
+
+def _version_now():
+    if VECTOR_BACKEND == "pgvector":
+        return _CORPUS["gen"]
+    return (_INDEX.version, _PASSAGES.version)
+
+def _corpus_version():
+    """Index'ler güncellendikten sonraki sürüm; benzer listesi bu sürümle cache'lenir."""
+    if VECTOR_BACKEND != "pgvector":
+        _index_sync()
+        if PASSAGE_SEARCH:
+            _passage_sync()
+    return _version_now()
+
+def _to_pgvector(vec):
+    if isinstance(vec, str):
+        vec = json.loads(vec)
+    return "[" + ",".join(f"{float(x):.7g}" for x in vec) + "]"
+
+# Benzer vaka kartı için okunan kolonlar: türetilmiş alanlar kayıtlıysa rapor metni okunmaz
+_SIMILAR_COLS = ("result_text, keywords, incident_summary, snippet, "
+                 "CASE WHEN keywords IS NULL THEN report_text END AS report_text")
+
+def _pg_knn(cur, sql, params, k, filtered):
+    """pgvector k-NN sorgusu -> satırlar (sim'e göre azalan). filtered ise iterative scan (>= 0.8) açılır ve
+    k'dan az satır dönerse index kapalı (exact) yeniden çalıştırılır; seçici filtrede bu, btree ile süzülmüş
+    az sayıda satırın taranmasıdır."""
+    if filtered and PGVECTOR_ITERATIVE:
+        cur.execute("SET LOCAL hnsw.iterative_scan = relaxed_order;")
+        cur.execute("SET LOCAL ivfflat.iterative_scan = relaxed_order;")
+    cur.execute(sql, params)
     rows = cur.fetchall()
-    cur.close(); conn.close()
-    return rows
+    if filtered and len(rows) < k:
+        cur.execute("SET LOCAL enable_indexscan = off;")
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    # relaxed_order sırayı hafifçe bozabilir
+    return sorted(rows, key=lambda r: -r[-1])
+
+def _pg_top_k(q_emb, scope="all", exclude_id=None, k=10, min_sim=0.60, filters=None):
+    """pgvector: scope / meta filtresi + cosine top-k tamamen Postgres içinde (HNSW/IVFFlat index)."""
+    where = ["embedding_vec IS NOT NULL"]
+    params = []
+    if scope == "internal":
+        where.append("method IS DISTINCT FROM 'Imported (CADORS)'")
+    elif scope == "cadors":
+        where.append("method = 'Imported (CADORS)'")
+    if exclude_id is not None:
+        where.append("id <> %s")
+        params.append(exclude_id)
+    meta_where, meta_params = report_meta.sql_where(filters)
+    where += meta_where
+    params += meta_params
+    qv = _to_pgvector(q_emb)
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SET LOCAL hnsw.ef_search = %s;", (PGVECTOR_EF_SEARCH,))
+        cur.execute("SET LOCAL ivfflat.probes = %s;", (PGVECTOR_PROBES,))
+        rows = _pg_knn(cur, f"""
+            SELECT id, {_SIMILAR_COLS}, 1 - (embedding_vec <=> %s::vector) AS sim
+            FROM sreports
+            WHERE {" AND ".join(where)}
+            ORDER BY embedding_vec <=> %s::vector
+            LIMIT %s;
+        """, [qv] + params + [qv, k], k, filtered=scope != "all" or bool(filters))
+        rows = [r for r in rows if r["sim"] >= min_sim]
+        cur.close()
+    return [(str(r["id"]), float(r["sim"]), r) for r in rows]
+
+def _memory_top_k(q_emb, scope="all", exclude_id=None, k=10, min_sim=0.60, filters=None):
+    """In-process index: top-k id'leri bulur, sadece eşleşen satırların metnini DB'den okur."""
+    hits = _index_sync().search(q_emb, k=k, min_sim=min_sim, scope=scope, exclude_id=exclude_id, nprobe=ANN_NPROBE,
+                                filters=filters)
+    if not hits:
+        return []
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute(f"SELECT id, {_SIMILAR_COLS} FROM sreports WHERE id = ANY(%s::uuid[]);",
+                    ([cid for cid, _ in hits],))
+        by_id = {str(r["id"]): r for r in cur.fetchall()}
+        cur.close()
+    return [(cid, sim, by_id[cid]) for cid, sim in hits if cid in by_id]
+
+def _scope_sql(scope, col="method"):
+    if scope == "internal":
+        return f"{col} IS DISTINCT FROM 'Imported (CADORS)'"
+    if scope == "cadors":
+        return f"{col} = 'Imported (CADORS)'"
+    return None
+
+def _passage_top_k(q_emb, scope="all", exclude_id=None, k=10, min_sim=0.60, filters=None):
+    """Parça araması -> {report_id: (skor, en iyi passage_id, en iyi parça benzerliği)}."""
+    n = k * PASSAGE_FANOUT
+    if VECTOR_BACKEND == "pgvector":
+        where = ["p.embedding_vec IS NOT NULL"]
+        params = []
+        if _scope_sql(scope, "s.method"):
+            where.append(_scope_sql(scope, "s.method"))
+        if exclude_id is not None:
+            where.append("p.report_id <> %s")
+            params.append(exclude_id)
+        meta_where, meta_params = report_meta.sql_where(filters, "s.")
+        where += meta_where
+        params += meta_params
+        qv = _to_pgvector(q_emb)
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SET LOCAL hnsw.ef_search = %s;", (max(PGVECTOR_EF_SEARCH, n),))
+            cur.execute("SET LOCAL ivfflat.probes = %s;", (PGVECTOR_PROBES,))
+            rows = _pg_knn(cur, f"""
+                SELECT p.report_id::text || ':' || p.ord, 1 - (p.embedding_vec <=> %s::vector) AS sim
+                FROM sreport_passages p JOIN sreports s ON s.id = p.report_id
+                WHERE {" AND ".join(where)}
+                ORDER BY p.embedding_vec <=> %s::vector
+                LIMIT %s;
+            """, [qv] + params + [qv, n], n, filtered=scope != "all" or bool(filters))
+            hits = [(pid, float(sim)) for pid, sim in rows if sim >= min_sim]
+            cur.close()
+    else:
+        hits = _passage_sync().search(q_emb, k=n, min_sim=min_sim, scope=scope, nprobe=ANN_NPROBE, filters=filters)
+        if exclude_id is not None:
+            hits = [(pid, sim) for pid, sim in hits if passages.report_of(pid) != str(exclude_id)]
+    return passages.score_documents(hits)
+
+def _fetch_reports(ids):
+    if not ids:
+        return {}
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute(f"SELECT id, {_SIMILAR_COLS} FROM sreports WHERE id = ANY(%s::uuid[]);", (list(ids),))
+        by_id = {str(r["id"]): r for r in cur.fetchall()}
+        cur.close()
+    return by_id
+
+def _lexical_top_k(q_emb, terms, scope="all", exclude_id=None, k=30, filters=None):
+    """Full-text adaylar (lexical.py) -> [(id, sim|None, eşleşen terimler)], ts_rank sırasıyla.
+    sim: adayın sorguya kosinüsü (pgvector'de aynı sorguda, memory'de index'ten); q_emb None ise hep None."""
+    where, params = [], []
+    if _scope_sql(scope, "s.method"):
+        where.append(_scope_sql(scope, "s.method"))
+    if exclude_id is not None:
+        where.append("s.id <> %s")
+        params.append(exclude_id)
+    meta_where, meta_params = report_meta.sql_where(filters, "s.")
+    where += meta_where
+    params += meta_params
+    pg = VECTOR_BACKEND == "pgvector" and q_emb is not None
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SET LOCAL statement_timeout = %s;", (LEXICAL_TIMEOUT_MS,))
+        rows = lexical.top_k(cur, terms, where, params, k=k, qvec=_to_pgvector(q_emb) if pg else None)
+        cur.close()
+    if q_emb is not None and not pg:
+        sims = _index_sync().similarity(q_emb, [rid for rid, _, _, _ in rows])
+        return [(rid, sims.get(rid), matched) for rid, _, matched, _ in rows]
+    return [(rid, sim, matched) for rid, _, matched, sim in rows]
+
+def find_similar(q_emb, text, scope="all", exclude_id=None, k=10, min_sim=0.60, terms=None, filters=None,
+                 lexical_terms=None):
+    """Scope'a göre top-k benzer rapor; VECTOR_BACKEND'e göre pgvector ya da in-process index.
+    PASSAGE_SEARCH açıksa belge skoru = max(belge benzerliği, parça skoru) ve eşleşen parça döner.
+    HYBRID_SEARCH açıksa full-text adayları (kodlar + anahtar kelimeler) vektör listesiyle RRF ile birleşir;
+    sadece full-text'ten gelen aday da en az min(min_sim, LEXICAL_MIN_SIM) kosinüs ister.
+    terms: sorgu raporunun kayıtlı anahtar kelimeleri (yoksa text'ten çıkarılır).
+    filters: report_meta.parse_filters çıktısı; skorlamadan önce uygulanır (top-k filtreli corpus'tan).
+    lexical_terms: full-text sorgusu [(terim, ağırlık)] (varsayılan lexical.query_terms(text, terms)).
+    q_emb None ise sadece full-text (kod araması; sim None)."""
+    if q_emb is None:
+        hits = []
+    elif VECTOR_BACKEND == "pgvector":
+        hits = _pg_top_k(q_emb, scope=scope, exclude_id=exclude_id, k=k, min_sim=min_sim, filters=filters)
+    else:
+        hits = _memory_top_k(q_emb, scope=scope, exclude_id=exclude_id, k=k, min_sim=min_sim, filters=filters)
+
+    best_pid = {}
+    if PASSAGE_SEARCH and q_emb is not None:
+        try:
+            doc_scores = _passage_top_k(q_emb, scope=scope, exclude_id=exclude_id, k=k, min_sim=min_sim, filters=filters)
+        except Exception as e:
+            print(f"[find_similar] parça araması: {e}", file=sys.stderr, flush=True)
+            doc_scores = {}
+        if doc_scores:
+            scores = {cid: sim for cid, sim, _ in hits}
+            rows = {cid: r for cid, _, r in hits}
+            for rid, (score, pid, _) in doc_scores.items():
+                best_pid[rid] = pid
+                scores[rid] = max(scores.get(rid, -1.0), score)
+            top = sorted(scores.items(), key=lambda x: -x[1])[:k]
+            rows.update(_fetch_reports([cid for cid, _ in top if cid not in rows]))
+            hits = [(cid, sim, rows[cid]) for cid, sim in top if cid in rows]
+
+    matched = {}
+    if HYBRID_SEARCH or q_emb is None:
+        try:
+            lex = _lexical_top_k(q_emb, lexical_terms if lexical_terms is not None else lexical.query_terms(text, terms),
+                                 scope=scope, exclude_id=exclude_id, k=LEXICAL_K if q_emb is not None else k,
+                                 filters=filters)
+        except Exception as e:
+            print(f"[find_similar] full-text araması: {e}", file=sys.stderr, flush=True)
+            lex = []
+        if q_emb is not None:
+            floor = min(min_sim, LEXICAL_MIN_SIM)
+            lex = [(cid, sim, m) for cid, sim, m in lex if sim is not None and sim >= floor]
+        if lex:
+            sims = {cid: sim for cid, sim, _ in hits}
+            rows = {cid: r for cid, _, r in hits}
+            for cid, sim, m in lex:
+                matched[cid] = m
+                sims.setdefault(cid, sim)
+            top = lexical.rrf([[cid for cid, _, _ in hits], [cid for cid, _, _ in lex]],
+                              k=RRF_K, weights=[1.0, LEXICAL_WEIGHT])[:k]
+            rows.update(_fetch_reports([cid for cid, _ in top if cid not in rows]))
+            hits = [(cid, sims[cid], rows[cid]) for cid, _ in top if cid in rows]
+    passage_texts = passages.fetch_texts([best_pid[cid] for cid, _, _ in hits if cid in best_pid]) if best_pid else {}
+
+    curr_terms = set(terms if terms is not None else top_keywords(text))
+    out = []
+    for cid, sim, r in hits:
+        keywords, _, snippet = report_fields.row_fields(r)
+        overlap = [w for w in keywords if w in curr_terms]
+        # full-text'te eşleşen terimler (kodlar önce) açıklamada anahtar kelimelerden önce gelir
+        overlap = matched.get(cid, []) + [w for w in overlap if w not in matched.get(cid, [])]
+        why = build_why_similar(overlap, sim)
+        passage = passage_texts.get(best_pid.get(cid), "")
+        if passage:
+            short = passage if len(passage) <= 240 else passage[:240].rsplit(" ", 1)[0] + "…"
+            why += f' Closest matching passage: "{" ".join(short.split())}"'
+        out.append({
+            "id": cid,
+            "sim": sim,
+            "snippet": snippet,
+            "why": why,
+            "passage": passage,
+            "passage_html": passages.highlight(passage, overlap) if passage else "",
+            "full_markdown": r["result_text"] or ""
+        })
+    return out
+
+SIMILAR_K, SIMILAR_MIN_SIM = 10, 0.60
+
+def _similar_key(report_id, scope="all", filters=None):
+    """similar_cache anahtarı; hibrit listede eşik sözcüksel adaylarınki (sıra kosinüse göre değil)."""
+    if HYBRID_SEARCH:
+        head = (str(report_id), scope, SIMILAR_K, min(SIMILAR_MIN_SIM, LEXICAL_MIN_SIM), FUSED)
+    else:
+        head = (str(report_id), scope, SIMILAR_K, SIMILAR_MIN_SIM)
+    return head + report_meta.filters_key(filters)
+
+def similar_for_report(report_id, scope="all", row=None, filters=None):
+    """Kayıtlı raporun benzer listesi: önce cache, yoksa find_similar (sonuç cache'e yazılır).
+    row (embedding, keywords, report_text) verilmezse gerektiğinde DB'den okunur; rapor yoksa None."""
+    cache = get_similar_cache()
+    version = _corpus_version()
+    gen = cache.shared_gen()
+    key = _similar_key(report_id, scope, filters)
+    items = cache.get(key, version, gen)
+    if items is not None:
+        return items
+    if row is None:
+        with get_conn() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            # hibrit aramada kodlar (tescil, meydan, parça no) rapor metninden çıkarılır
+            text_col = "report_text" if HYBRID_SEARCH else "CASE WHEN keywords IS NULL THEN report_text END AS report_text"
+            cur.execute(f"SELECT embedding, keywords, {text_col} FROM sreports WHERE id=%s;", (report_id,))
+            row = cur.fetchone()
+            cur.close()
+        if not row:
+            return None
+    items = find_similar(row["embedding"], row["report_text"] or "", scope=scope, exclude_id=report_id,
+                         k=SIMILAR_K, min_sim=SIMILAR_MIN_SIM, terms=row["keywords"], filters=filters)
+    cache.put(key, items, row["embedding"], version, gen)
+    return items
 
 @app.route("/", methods=["GET"])
 def index():
@@ -513,11 +899,11 @@ def login():
     username = request.form.get("username","").strip()
     password = request.form.get("password","").strip()
 
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT id, password, can_see_similar, is_active, is_admin FROM susers WHERE username=%s;", (username,))
-    row = cur.fetchone()
-    cur.close(); conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT id, password, can_see_similar, is_active, is_admin FROM susers WHERE username=%s;", (username,))
+        row = cur.fetchone()
+        cur.close()
 
     ok = bool(row and row["is_active"] and row["password"] == password)
     if ok:
@@ -546,56 +932,56 @@ def admin():
     if not session.get("logged_in") or not session.get("is_admin"):
         return "Forbidden", 403
 
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT id, username, can_see_similar, is_active, is_admin, created_at FROM susers ORDER BY created_at;")
-    users = cur.fetchall()
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT id, username, can_see_similar, is_active, is_admin, created_at FROM susers ORDER BY created_at;")
+        users = cur.fetchall()
+
+        q_user = request.args.get("user", "").strip() or None
+        if q_user:
+            cur.execute("""
+                SELECT id, username, action, report_id, title, ip, created_at
+                FROM activity_log
+                WHERE username=%s
+                ORDER BY created_at DESC
+                LIMIT 300;
+            """, (q_user,))
+        else:
+            cur.execute("""
+                SELECT id, username, action, report_id, title, ip, created_at
+                FROM activity_log
+                ORDER BY created_at DESC
+                LIMIT 300;
+            """)
+        activities = cur.fetchall()
+
+        cur.execute("SELECT COUNT(1) FROM sreports;")
+        total_reports = cur.fetchone()[0]
 
-    q_user = request.args.get("user", "").strip() or None
-    if q_user:
         cur.execute("""
-            SELECT id, username, action, report_id, title, ip, created_at
+            SELECT
+              SUM(CASE WHEN action='analyze' THEN 1 ELSE 0 END) AS analyzes,
+              SUM(CASE WHEN action LIKE 'download%%' THEN 1 ELSE 0 END) AS downloads
             FROM activity_log
-            WHERE username=%s
-            ORDER BY created_at DESC
-            LIMIT 300;
-        """, (q_user,))
-    else:
-        cur.execute("""
-            SELECT id, username, action, report_id, title, ip, created_at
-            FROM activity_log
-            ORDER BY created_at DESC
-            LIMIT 300;
+            WHERE created_at >= NOW() - INTERVAL '24 hours';
         """)
-    activities = cur.fetchall()
-
-    cur.execute("SELECT COUNT(1) FROM sreports;")
-    total_reports = cur.fetchone()[0]
-
-    cur.execute("""
-        SELECT
-          SUM(CASE WHEN action='analyze' THEN 1 ELSE 0 END) AS analyzes,
-          SUM(CASE WHEN action LIKE 'download%%' THEN 1 ELSE 0 END) AS downloads
-        FROM activity_log
-        WHERE created_at >= NOW() - INTERVAL '24 hours';
-    """)
-    r = cur.fetchone()
-    kpi_analyses_24h = r[0] or 0
-    kpi_downloads_24h = r[1] or 0
-
-    stats = {}
-    for u in users:
-        stats[u["username"]] = {"login":0,"analyze":0,"download_report":0,"download_full":0}
-    cur.execute("SELECT username, action, COUNT(1) AS c FROM activity_log GROUP BY username, action;")
-    for row in cur.fetchall():
-        uname = row["username"] or ""
-        if uname not in stats:
-            stats[uname] = {"login":0,"analyze":0,"download_report":0,"download_full":0}
-        act = row["action"]
-        if act in stats[uname]:
-            stats[uname][act] = row["c"]
-
-    cur.close(); conn.close()
+        r = cur.fetchone()
+        kpi_analyses_24h = r[0] or 0
+        kpi_downloads_24h = r[1] or 0
+
+        stats = {}
+        for u in users:
+            stats[u["username"]] = {"login":0,"analyze":0,"download_report":0,"download_full":0}
+        cur.execute("SELECT username, action, COUNT(1) AS c FROM activity_log GROUP BY username, action;")
+        for row in cur.fetchall():
+            uname = row["username"] or ""
+            if uname not in stats:
+                stats[uname] = {"login":0,"analyze":0,"download_report":0,"download_full":0}
+            act = row["action"]
+            if act in stats[uname]:
+                stats[uname][act] = row["c"]
+
+        cur.close()
 
     return render_template_string(
         ADMIN_PAGE,
@@ -607,54 +993,193 @@ def admin():
         kpi_downloads_24h=kpi_downloads_24h,
         q_user=q_user
     )
+@app.route("/admin/metrics")
+def admin_metrics():
+    if not session.get("logged_in") or not session.get("is_admin"):
+        return "Forbidden", 403
+    return jsonify({"db_pool": get_pool().stats(), "activity_log": get_activity_writer().stats(),
+                    "embedding_cache": get_embedding_cache().stats(), "jobs": get_job_queue().stats(),
+                    "similar_cache": get_similar_cache().stats(), "pdf_store": get_pdf_store().stats(),
+                    "shared_cache": get_shared_cache().stats()})
+
+def _store_passages(rid, text):
+    """Raporun parçalarını embed edip yazar -> [(passage_id, emb)]; analiz sonucu bundan etkilenmez."""
+    if not PASSAGE_SEARCH:
+        return []
+    try:
+        return passages.store_passages(rid, text)
+    except Exception as e:
+        print(f"[passages] {rid}: {e}", file=sys.stderr, flush=True)
+        return []
+
+def _report_added(rid, method, text, q_emb, similar=None, version=None):
+    """Yeni rapor yazıldıktan sonra: parçaları yaz, index'lere ekle, benzer-liste cache'ini güncelle.
+    similar/version: analiz sırasında hesaplanan liste (rapor henüz yokken) ve o anki corpus sürümü;
+    verilirse raporun kendi "all" listesi cache'e konur, böylece ilk tıklama/indirme hesaplama yapmaz."""
+    added = _store_passages(rid, text)
+    cache = get_similar_cache()
+    if similar is not None and version is not None:
+        cache.put(_similar_key(rid), similar, q_emb, version)
+    with _CORPUS["lock"]:
+        old = _version_now()
+        if VECTOR_BACKEND == "pgvector":
+            _CORPUS["gen"] += 1
+        else:
+            # kurum içi rapor: meta alanları boş, tarih filtresi için kayıt günü
+            meta = {"day": datetime.date.today()}
+            _INDEX.add(rid, method, q_emb, meta)
+            if _PASSAGES.loaded:
+                for pid, emb in added:
+                    _PASSAGES.add(pid, method, emb, meta)
+        cache.note_added(old, _version_now(), [(rid, method, q_emb)] + [(rid, method, emb) for _, emb in added])
+    # diğer worker'ların paylaşılan listeleri
+    cache.bump_shared()
+
+def run_analysis_job(job):
+    """Worker: PDF -> metin -> embedding -> benzerler -> GPT -> sreports. Sonuç job.result'a yazılır."""
+    p = job["payload"]
+    method, lang = p.get("method", "Five Whys"), p.get("lang", "English")
+    text = extract_text_from_pdf(job["input"] or b"")
+
+    # Benzer adaylar (varsayılan: tüm corpus; UI'da scope butonları ayrı)
+    q_emb = document_embedding(text)
+    version = _corpus_version()
+    similar_cases = find_similar(q_emb, text, k=SIMILAR_K, min_sim=SIMILAR_MIN_SIM)
+    on_token = (lambda partial: get_job_queue().progress(job["id"], partial)) if p.get("stream") else None
+    result = analyze_with_gpt(text, method, lang, similar_cases=similar_cases, on_token=on_token)
+
+    # akış bittikten sonra tam metin kalıcı olarak yazılır
+    rid = str(uuid.uuid4())
+    with get_conn() as conn:
+        cur = conn.cursor()
+        keywords, summary, snippet = report_fields.derive(text, result)
+        cur.execute("INSERT INTO sreports (id, method, lang, report_text, result_text, embedding, embedding_q, "
+                    "keywords, incident_summary, snippet) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s);",
+                    (rid, method, lang, text, result, json.dumps(q_emb), psycopg2.Binary(quantize.encode(q_emb)),
+                     keywords, summary, snippet))
+        conn.commit(); cur.close()
+    _report_added(rid, method, text, q_emb, similar_cases, version)
+
+    title = f"Safety Report — {method} — {lang}"
+    log_event("analyze", report_id=rid, title=title, ctx=p.get("ctx") or {},
+              extra={"method": method, "lang": lang, "similar_count": len(similar_cases), "job_id": str(job["id"])})
+    return {"report_id": rid, "method": method, "lang": lang, "similar_count": len(similar_cases)}
+
+get_job_queue().register("analyze", run_analysis_job)
+# JOB_WORKERS > 0: worker'lar ilk /analyze'ı beklemeden başlar (restart sonrası kuyrukta kalan işler hemen alınır).
+# JOB_AUTOSTART=0: fork'tan önce başlatılmaz — gunicorn --preload post_fork'ta (gunicorn.conf.py), asgi hiç başlatmaz.
+if os.getenv("JOB_AUTOSTART", "1") == "1" and not _POOL_CHILD:
+    get_job_queue().start()
+
 @app.route("/analyze", methods=["POST"])
 def analyze():
+    """İşi kuyruğa yazar ve hemen döner; sonuç /jobs/<id> poll'u ile gelir."""
     if not session.get("logged_in"):
         return "Unauthorized", 401
 
     pdf_file = request.files["pdf"]
     method   = request.form.get("method","Five Whys")
     lang     = request.form.get("lang","English")
-    text     = extract_text_from_pdf(pdf_file)
+    if pdf_size_of(pdf_file) > PDF_MAX_BYTES:
+        return f"<div class='text-rose-400'>PDF is larger than {PDF_MAX_BYTES // (1024 * 1024)} MB.</div>", 413
+    ctx = {"user_id": session.get("user_id"), "username": session.get("username"),
+           "ip": _client_ip(), "user_agent": (request.headers.get("User-Agent") or "")[:300]}
+    job_id = get_job_queue().submit("analyze", payload={"method": method, "lang": lang, "ctx": ctx, "stream": ANALYZE_STREAM},
+                                    data=pdf_file.read(), user_id=ctx["user_id"], username=ctx["username"])
+    if ANALYZE_STREAM:
+        return _job_stream_block(job_id, method, lang)
+    return _job_pending_block(job_id, "queued", method, lang)
+
+def _job_stream_block(job_id, method, lang):
+    # "token" olayları <pre>'nin sonuna eklenir; "done" olayı tüm kutuyu rapor bloğuyla değiştirir
+    return f"""
+    <div id="job-{job_id}" class="bg-slate-800/60 p-6 rounded-2xl border border-white/10"
+         hx-ext="sse" sse-connect="{url_for('job_stream', job_id=job_id)}" sse-close="done">
+      <h2 class="text-xl font-bold text-cyan-300">✍️ Report ({method}, {lang})</h2>
+      <pre class="whitespace-pre-wrap text-sm bg-slate-900/60 p-3 rounded border border-slate-700 mt-3"
+           sse-swap="token" hx-swap="beforeend"></pre>
+      <div sse-swap="done" hx-target="#job-{job_id}" hx-swap="outerHTML"></div>
+    </div>
+    """
 
-    # Benzer adaylar (varsayılan: tüm corpus; UI'da scope butonları ayrı)
-    q_emb = get_embedding(text)
-    curr_terms = top_keywords(text)
-    candidates = []
-    for r in _fetch_all_reports():
-        if r["embedding"]:
-            try:
-                vec = json.loads(r["embedding"]) if isinstance(r["embedding"], str) else r["embedding"]
-                sim = cosine_similarity(q_emb, vec)
-                if sim >= 0.60:
-                    past_text = r["report_text"] or ""
-                    overlap = list(set(curr_terms) & set(top_keywords(past_text)))
-                    why = build_why_similar(text, past_text, overlap, sim)
-                    summ = incident_summary_from_markdown(r["result_text"] or r["report_text"] or "")
-                    candidates.append({
-                        "id": str(r["id"]),
-                        "sim": sim,
-                        "snippet": (summ or past_text[:220]).strip(),
-                        "why": why,
-                        "full_markdown": r["result_text"] or ""
-                    })
-            except Exception:
-                pass
-
-    similar_cases = sorted(candidates, key=lambda x: -x["sim"])[:10]
-    result = analyze_with_gpt(text, method, lang, similar_cases=similar_cases)
+def _sse(event, data):
+    # çok satırlı veri: her satır ayrı "data:" alanı, istemci "\n" ile birleştirir
+    return f"event: {event}\n" + "".join(f"data: {line}\n" for line in data.split("\n")) + "\n"
+
+def _job_pending_block(job_id, status, method, lang):
+    # hx-swap=outerHTML: iş bitince bu kutu rapor bloğuyla yer değiştirir
+    return f"""
+    <div id="job-{job_id}" class="bg-slate-800/60 p-6 rounded-2xl border border-white/10 animate-pulse"
+         hx-get="{url_for('job_status', job_id=job_id)}" hx-trigger="load delay:2s" hx-swap="outerHTML">
+      <h2 class="text-xl font-bold text-cyan-300">⏳ Report ({method}, {lang})</h2>
+      <p class="text-sm text-slate-400 mt-2">Analysis {status}… this box updates automatically.</p>
+    </div>
+    """
 
-    rid = str(uuid.uuid4())
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor()
-    cur.execute("INSERT INTO sreports (id, method, lang, report_text, result_text, embedding) VALUES (%s,%s,%s,%s,%s,%s);",
-                (rid, method, lang, text, result, json.dumps(q_emb)))
-    conn.commit(); cur.close(); conn.close()
+@app.route("/jobs/<job_id>/stream")
+def job_stream(job_id):
+    """SSE: GPT çıktısı geldikçe "token" (HTML-escape edilmiş fark), bitince "done" (rapor bloğu)."""
+    if not session.get("logged_in"):
+        return "Unauthorized", 401
+    try:
+        job = get_job_queue().get(str(uuid.UUID(job_id)))
+    except ValueError:
+        job = None
+    if not job or (str(job["user_id"]) != session.get("user_id") and not session.get("is_admin")):
+        return "Not found", 404
 
-    title = f"Safety Report — {method} — {lang}"
-    log_event("analyze", report_id=rid, title=title, extra={"method": method, "lang": lang, "similar_count": len(similar_cases)})
+    def events():
+        seen, started = 0, time.monotonic()
+        finished = False
+        while not finished and time.monotonic() - started < STREAM_MAX_SECONDS:
+            text, finished = get_job_queue().watch(job_id, seen, timeout=15.0)
+            if len(text) > seen:
+                yield _sse("token", str(escape(text[seen:])))
+                seen = len(text)
+            elif not finished:
+                yield ": keepalive\n\n"
+        # son hal: rapor bloğu (süre dolduysa /jobs/<id> poll'una devam eden kutu)
+        yield _sse("done", job_status(job_id))
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    if not session.get("logged_in"):
+        return "Unauthorized", 401
+    try:
+        job = get_job_queue().get(str(uuid.UUID(job_id)))
+    except ValueError:
+        job = None
+    if not job or (str(job["user_id"]) != session.get("user_id") and not session.get("is_admin")):
+        return "<div class='text-rose-400'>Job not found.</div>"
+
+    p = job["payload"] or {}
+    method, lang = p.get("method", "Five Whys"), p.get("lang", "English")
+    if job["status"] in ("queued", "running"):
+        return _job_pending_block(job_id, job["status"], method, lang)
+    if job["status"] == "failed":
+        return f"""
+        <div class="bg-rose-900/40 p-6 rounded-2xl border border-rose-400/30">
+          <h2 class="text-xl font-bold text-rose-300">⚠️ Analysis failed ({escape(method)}, {escape(lang)})</h2>
+          <p class="text-sm text-slate-300 mt-2">{escape(job["error"] or "Unknown error")}</p>
+        </div>
+        """
 
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    rid = job["result"]["report_id"]
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT report_text, result_text FROM sreports WHERE id=%s;", (rid,))
+        row = cur.fetchone()
+        cur.close()
+    if not row:
+        return "<div class='text-rose-400'>Not found.</div>"
+    return _report_block(rid, method, lang, row["report_text"] or "", row["result_text"] or "",
+                         job["finished_at"] or datetime.datetime.now())
+
+def _report_block(rid, method, lang, text, result, finished_at):
+    now = finished_at.strftime("%Y-%m-%d %H:%M")
     sim_target = f"sim-{rid}"
     can_see = session.get("can_see_similar", True)
 
@@ -673,6 +1198,20 @@ def analyze():
                   hx-get="{url_for('similar_cases', report_id=rid)}?scope=cadors"
                   hx-target="#{sim_target}" hx-swap="innerHTML">🔎 Find Similar — only CADORS</button>
         </div>
+        <form class="flex flex-wrap items-end gap-2 mt-2 text-xs text-slate-300"
+              hx-get="{url_for('similar_cases', report_id=rid)}" hx-target="#{sim_target}" hx-swap="innerHTML">
+          <select name="scope" class="px-2 py-1 rounded bg-slate-900/60 border border-slate-700">
+            <option value="all">Local DB + CADORS</option>
+            <option value="internal">Local DB</option>
+            <option value="cadors">only CADORS</option>
+          </select>
+          <label>From <input type="date" name="date_from" class="px-2 py-1 rounded bg-slate-900/60 border border-slate-700"/></label>
+          <label>To <input type="date" name="date_to" class="px-2 py-1 rounded bg-slate-900/60 border border-slate-700"/></label>
+          <input name="aircraft" placeholder="Aircraft (e.g. Cessna 172)" class="px-2 py-1 rounded bg-slate-900/60 border border-slate-700"/>
+          <input name="phase" placeholder="Phase (e.g. Landing)" class="px-2 py-1 rounded bg-slate-900/60 border border-slate-700"/>
+          <input name="province" placeholder="Province" class="px-2 py-1 rounded bg-slate-900/60 border border-slate-700"/>
+          <button class="px-3 py-1 rounded-lg bg-slate-700 hover:bg-slate-600 text-slate-200">🔎 Filtered search</button>
+        </form>
         """
 
     block = f"""
@@ -716,62 +1255,40 @@ def similar_cases(report_id):
     if scope not in {"internal", "all", "cadors"}:
         scope = "all"
 
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT report_text, result_text, embedding FROM sreports WHERE id=%s;", (report_id,))
-    row = cur.fetchone()
-    cur.close(); conn.close()
-    if not row:
-        return "<div class='text-rose-400'>Not found.</div>"
+    # meta filtreleri (report_meta.py): date_from, date_to, aircraft, phase, province
+    filters = report_meta.parse_filters(request.args)
+    filter_label = escape(report_meta.describe(filters))
 
-    text = row["report_text"] or ""
-    q_emb = json.loads(row["embedding"]) if isinstance(row["embedding"], str) else row["embedding"]
-    curr_terms = top_keywords(text)
-
-    items = []
-    for r in _fetch_all_reports():
-        if str(r["id"]) == report_id:
-            continue
-        # scope filtresi
-        is_cadors = (str(r.get("method") or "") == "Imported (CADORS)")
-        if scope == "internal" and is_cadors:
-            continue
-        if scope == "cadors" and not is_cadors:
-            continue
-
-        if r["embedding"]:
-            try:
-                vec = json.loads(r["embedding"]) if isinstance(r["embedding"], str) else r["embedding"]
-                sim = cosine_similarity(q_emb, vec)
-                if sim >= 0.60:
-                    past_txt = r["report_text"] or ""
-                    overlap = list(set(curr_terms) & set(top_keywords(past_txt)))
-                    why = build_why_similar(text, past_txt, overlap, sim)
-                    summ = incident_summary_from_markdown(r["result_text"] or r["report_text"] or "")
-                    items.append((sim, str(r["id"]), summ, why))
-            except Exception:
-                pass
-
-    items.sort(key=lambda x: -x[0])
-    items = items[:10]
+    items = similar_for_report(report_id, scope=scope, filters=filters)
+    if items is None:
+        return "<div class='text-rose-400'>Not found.</div>"
 
     if not items:
-        return f"<div class='text-slate-300'>No close matches found for scope: {scope}.</div>"
+        suffix = f" ({filter_label})" if filter_label else ""
+        return f"<div class='text-slate-300'>No close matches found for scope: {scope}{suffix}.</div>"
 
     scope_label = {
         "internal": "Kurum içi",
         "all": "Kurum içi + CADORS",
         "cadors": "Sadece CADORS"
     }[scope]
+    if filter_label:
+        scope_label += f" · {filter_label}"
+    return _case_list_html(items, f"Similar Cases (Top 5) — <span class='text-slate-200'>{scope_label}</span>")
 
+def _case_list_html(items, title):
+    """Benzer vaka / arama sonucu kartları (similar_cases, search_cases)."""
     html = [f"<div class='bg-slate-900/40 p-3 rounded-lg border border-white/10'>",
-            f"<div class='font-semibold text-cyan-300 mb-2'>Similar Cases (Top 5) — <span class='text-slate-200'>{scope_label}</span></div>"]
-    for sim, cid, summ, why in items:
+            f"<div class='font-semibold text-cyan-300 mb-2'>{title}</div>"]
+    for c in items:
+        sim, cid, summ, why = c["sim"], c["id"], c["snippet"], c["why"]
+        score = f"Similarity: {sim:.2f}" if sim is not None else "Full-text match"
         html.append(f"""
         <div class="mb-3 p-3 rounded-lg bg-slate-800/50 border border-slate-700">
-          <div class="text-emerald-300 font-semibold">Similarity: {sim:.2f}</div>
-          <div class="text-emerald-200 text-sm mb-1"><b>Why similar:</b> {why}</div>
-          <div class="text-slate-300 text-sm"><b>Snippet:</b> {summ[:500]}</div>
+          <div class="text-emerald-300 font-semibold">{score}</div>
+          <div class="text-emerald-200 text-sm mb-1"><b>Why similar:</b> {escape(why)}</div>
+          <div class="text-slate-300 text-sm"><b>Snippet:</b> {escape(summ[:500])}</div>
+          {f'<div class="text-slate-300 text-sm mt-1"><b>Matched passage:</b> {c["passage_html"]}</div>' if c.get("passage_html") else ""}
           <div class="mt-2">
             <a href="{url_for('case_fullpage', case_id=cid)}" target="_blank" class="text-sky-300 underline">Open full case in new tab</a>
             <button class="ml-3 px-2 py-1 text-xs rounded bg-slate-700 hover:bg-slate-600"
@@ -784,35 +1301,64 @@ def similar_cases(report_id):
     html.append("</div>")
     return "\n".join(html)
 
+@app.route("/search")
+def search_cases():
+    """Serbest metin / kod araması. Sadece kodlardan oluşan sorgu (C-GABC, CYOW, PW127) embedding ve
+    vektör taraması yapmadan full-text index'ten döner; diğerleri hibrit (find_similar)."""
+    if not session.get("logged_in"):
+        return "Unauthorized", 401
+    if not session.get("can_see_similar", True) and not session.get("is_admin", False):
+        return "<div class='text-rose-400'>Forbidden.</div>", 403
+    q = " ".join((request.args.get("q") or "").split())[:200]
+    scope = (request.args.get("scope") or "all").lower()
+    if scope not in {"internal", "all", "cadors"}:
+        scope = "all"
+    filters = report_meta.parse_filters(request.args)
+    if not q:
+        return "<div class='text-slate-300'>Enter a search term.</div>"
+
+    # kod sorgusu: GIN index yeterli (report_tsv yoksa HYBRID_SEARCH kapalıdır)
+    exact = HYBRID_SEARCH and lexical.is_exact_query(q)
+    q_emb = None if exact else get_embedding(q)
+    items = find_similar(q_emb, q, scope=scope, k=SIMILAR_K, min_sim=SEARCH_MIN_SIM, filters=filters,
+                         lexical_terms=lexical.search_terms(q))
+    log_event("search", extra={"q": q, "scope": scope, "exact": exact, "results": len(items)})
+    if not items:
+        return f"<div class='text-slate-300'>No matches for: {escape(q)}.</div>"
+    mode = "exact terms" if exact else "hybrid"
+    return _case_list_html(items, f"Search — <span class='text-slate-200'>{escape(q)} ({mode})</span>")
+
 @app.route("/case/preview/<case_id>")
 def case_preview(case_id):
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT report_text, result_text FROM sreports WHERE id=%s;", (case_id,))
-    row = cur.fetchone()
-    cur.close(); conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT result_text, incident_summary, CASE WHEN incident_summary IS NULL THEN report_text END AS report_text "
+                    "FROM sreports WHERE id=%s;", (case_id,))
+        row = cur.fetchone()
+        cur.close()
     if not row:
         return "<div class='text-rose-400'>Not found.</div>"
 
     # CADORS için fallback özet
     content = row["result_text"] or ""
     if not content:
-        content = "### Incident Summary\n" + (incident_summary_from_markdown(row["report_text"] or "") or "")
+        content = "### Incident Summary\n" + (row["incident_summary"] or incident_summary_from_markdown(row["report_text"] or ""))
     return f"<pre class='whitespace-pre-wrap text-sm bg-slate-900/60 p-3 rounded border border-slate-700'>{content}</pre>"
 
 @app.route("/case/<case_id>")
 def case_fullpage(case_id):
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT report_text, result_text FROM sreports WHERE id=%s;", (case_id,))
-    row = cur.fetchone()
-    cur.close(); conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT result_text, incident_summary, CASE WHEN incident_summary IS NULL THEN report_text END AS report_text "
+                    "FROM sreports WHERE id=%s;", (case_id,))
+        row = cur.fetchone()
+        cur.close()
     if not row:
         return "Not found", 404
 
     content = row["result_text"] or ""
     if not content:
-        content = "### Incident Summary\n" + (incident_summary_from_markdown(row["report_text"] or "") or "")
+        content = "### Incident Summary\n" + (row["incident_summary"] or incident_summary_from_markdown(row["report_text"] or ""))
     return f"<html><body style='background:#0f172a;color:#e2e8f0;font-family:ui-sans-serif;padding:20px'><h2>Case {case_id}</h2><pre style='white-space:pre-wrap;background:#0b1220;padding:12px;border-radius:8px'>{content}</pre></body></html>"
 @app.route("/feedback", methods=["POST"])
 def feedback():
@@ -827,47 +1373,21 @@ def feedback():
 
     updated = analyze_with_gpt(text, method, lang, feedback=fb)
 
-    # Similar listesi (updated + similar PDF için)
-    q_emb = get_embedding(text)
-    curr_terms = top_keywords(text)
-    sims = []
-    for r in _fetch_all_reports():
-        if str(r["id"]) == rid:
-            continue
-        if r["embedding"]:
-            try:
-                vec = json.loads(r["embedding"]) if isinstance(r["embedding"], str) else r["embedding"]
-                sim = cosine_similarity(q_emb, vec)
-                if sim >= 0.60:
-                    past_txt = r["report_text"] or ""
-                    overlap = list(set(curr_terms) & set(top_keywords(past_txt)))
-                    why = build_why_similar(text, past_txt, overlap, sim)
-                    summ = incident_summary_from_markdown(r["result_text"] or r["report_text"] or "")
-                    sims.append({
-                        "id": str(r["id"]),
-                        "sim": sim,
-                        "snippet": summ or past_txt[:220],
-                        "why": why,
-                        "full_markdown": r["result_text"] or ""
-                    })
-            except Exception:
-                pass
-    sims.sort(key=lambda x: -x["sim"])
-    sims = sims[:10]
-
-    # PDF'leri hazırla (in-memory store)
+    # Similar listesi (updated + similar PDF için); kayıtlı raporun listesi cache'ten gelir
+    sims = similar_for_report(rid) if rid else None
+    if sims is None:
+        sims = find_similar(document_embedding(text), text, exclude_id=rid)
+
+    # PDF'leri hazırla (pdf_store; anahtar indirme linkinde, tüm worker'larda çözülür)
     now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-    pdf_only = generate_pdf_report(updated, title=f"Updated Safety Report — {method} — {lang}")
-    file_id_only = uuid.uuid4().hex
-    _PDF_STORE[file_id_only] = {"filename": f"updated_report_{file_id_only}.pdf",
-                                "bytes": pdf_only.getvalue(),
-                                "requires_similar_permission": False}
-
-    pdf_full = generate_pdf_full(updated, sims, title="Updated Safety Report (with Similar Cases)")
-    file_id_full = uuid.uuid4().hex
-    _PDF_STORE[file_id_full] = {"filename": f"updated_report_with_similar_{file_id_full}.pdf",
-                                "bytes": pdf_full.getvalue(),
-                                "requires_similar_permission": True}
+    store = get_pdf_store()
+    title_only = f"Updated Safety Report — {method} — {lang}"
+    file_id_only = pdf_store.make_key(rid, "updated", pdf_store.content_hash(updated, title_only))
+    store.get_or_render(file_id_only, lambda: generate_pdf_report(updated, title=title_only))
+
+    title_full = "Updated Safety Report (with Similar Cases)"
+    file_id_full = pdf_store.make_key(rid, "updated_full", pdf_store.content_hash(updated, title_full, sims))
+    store.get_or_render(file_id_full, lambda: generate_pdf_full(updated, sims, title=title_full))
 
     log_event("updated_report", report_id=rid, title=f"Updated — {method}/{lang}", extra={"similar_count": len(sims)})
 
@@ -894,24 +1414,22 @@ def feedback():
     """
     return block
 
-# In-memory store
-_PDF_STORE = {}  # file_id -> {"filename": str, "bytes": bytes, "requires_similar_permission": bool}
-
 @app.route("/download/report/<report_id>")
 def download_report(report_id):
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT result_text, method, lang FROM sreports WHERE id=%s;", (report_id,))
-    row = cur.fetchone()
-    cur.close(); conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT result_text, method, lang FROM sreports WHERE id=%s;", (report_id,))
+        row = cur.fetchone()
+        cur.close()
     if not row:
         return "Not found", 404
 
     title = f"Safety Report — {row['method']} — {row['lang']}"
     log_event("download_report", report_id=report_id, title=title)
 
-    pdf = generate_pdf_report(row["result_text"], title=title)
-    return send_file(pdf, as_attachment=True, download_name="report.pdf")
+    key = pdf_store.make_key(report_id, "report", pdf_store.content_hash(row["result_text"] or "", title))
+    data = get_pdf_store().get_or_render(key, lambda: generate_pdf_report(row["result_text"], title=title))
+    return send_file(io.BytesIO(data), mimetype="application/pdf", as_attachment=True, download_name="report.pdf")
 
 @app.route("/download/full/<report_id>")
 def download_full(report_id):
@@ -919,60 +1437,38 @@ def download_full(report_id):
         log_event("download_full_denied", report_id=report_id, extra={"reason":"permission"})
         return "Forbidden", 403
 
-    conn = psycopg2.connect(DB_URL, sslmode="require")
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("SELECT report_text, result_text, embedding, method, lang FROM sreports WHERE id=%s;", (report_id,))
-    row = cur.fetchone()
-    cur.close(); conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cur.execute("SELECT report_text, result_text, embedding, keywords, method, lang FROM sreports WHERE id=%s;", (report_id,))
+        row = cur.fetchone()
+        cur.close()
     if not row:
         return "Not found", 404
 
     current_md = row["result_text"] or ""
-    text = row["report_text"] or ""
-    q_emb = json.loads(row["embedding"]) if isinstance(row["embedding"], str) else row["embedding"]
-    curr_terms = top_keywords(text)
-
-    sims = []
-    for r in _fetch_all_reports():
-        if str(r["id"]) == report_id:
-            continue
-        if r["embedding"]:
-            try:
-                vec = json.loads(r["embedding"]) if isinstance(r["embedding"], str) else r["embedding"]
-                sim = cosine_similarity(q_emb, vec)
-                if sim >= 0.60:
-                    past_txt = r["report_text"] or ""
-                    overlap = list(set(curr_terms) & set(top_keywords(past_txt)))
-                    why = build_why_similar(text, past_txt, overlap, sim)
-                    summ = incident_summary_from_markdown(r["result_text"] or r["report_text"] or "")
-                    sims.append({
-                        "id": str(r["id"]),
-                        "sim": sim,
-                        "snippet": summ or past_txt[:220],
-                        "why": why,
-                        "full_markdown": r["result_text"] or ""
-                    })
-            except Exception:
-                pass
-    sims.sort(key=lambda x: -x["sim"])
-    sims = sims[:10]
+    sims = similar_for_report(report_id, row=row)
 
     title = f"Safety Report — {row['method']} — {row['lang']}"
     log_event("download_full", report_id=report_id, title=title, extra={"similar_count": len(sims)})
 
-    pdf = generate_pdf_full(current_md, sims, title="Safety Report (with Similar Cases)")
-    return send_file(pdf, as_attachment=True, download_name="report_with_similar.pdf")
+    pdf_title = "Safety Report (with Similar Cases)"
+    # ?compact=1: benzer vaka başına kırpılmış içerik (pdfrender.PDF_CASE_MAX_CHARS)
+    compact = request.args.get("compact", "1" if PDF_COMPACT else "0") == "1"
+    key = pdf_store.make_key(report_id, "full", pdf_store.content_hash(current_md, pdf_title, sims, compact))
+    data = get_pdf_store().get_or_render(key, lambda: generate_pdf_full(current_md, sims, title=pdf_title, compact=compact))
+    return send_file(io.BytesIO(data), mimetype="application/pdf", as_attachment=True, download_name="report_with_similar.pdf")
 
 @app.route("/download/memory/<file_id>")
 def download_memory_pdf(file_id):
-    rec = _PDF_STORE.get(file_id)
-    if not rec:
+    parsed = pdf_store.parse_key(file_id)
+    data = get_pdf_store().get(file_id) if parsed else None
+    if data is None:
         return "Not found", 404
-    if rec.get("requires_similar_permission") and not (session.get("can_see_similar", True) or session.get("is_admin", False)):
+    fname, requires_similar_permission = pdf_store.VARIANTS[parsed[1]]
+    if requires_similar_permission and not (session.get("can_see_similar", True) or session.get("is_admin", False)):
         log_event("download_updated_denied", extra={"reason": "permission"})
         return "Forbidden", 403
 
-    fname, data = rec["filename"], rec["bytes"]
     log_event("download_updated", title=fname)
     return send_file(io.BytesIO(data), mimetype="application/pdf", as_attachment=True, download_name=fname)
 
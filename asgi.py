@@ -0,0 +1,291 @@
+# asgi.py
+# Opsiyonel ASGI dağıtımı: `uvicorn asgi:app` (app:app gthread kurulumunun yanında).
+# Uzun bekleyen yollar asyncio üzerinde çalışır; geri kalan her şey aynı Flask uygulamasına
+# WSGI köprüsüyle gider, yani route'lar ve HTML birebir aynıdır:
+#   POST /analyze             -> analysis_jobs'a asyncpg ile yazar, aynı SSE kutusunu döner
+#   GET  /jobs/<id>/stream    -> async SSE (thread tutmaz)
+#   analyze işleri            -> AsyncAnalysisRunner: openai acreate (aiohttp) + asyncpg, tek süreçte yüzlerce iş
+# PDF çıkarma ve benzer arama (CPU + psycopg2) asyncio.to_thread ile çalışır.
+#
+# Kurulum (requirements.txt'e dahil değil):
+#   pip install -r requirements.txt -r requirements-asgi.txt
+# Çalıştırma:
+#   uvicorn asgi:app --host 0.0.0.0 --port $PORT
+#
+# Env:
+#   ASGI_JOB_CONCURRENCY (200; aynı anda işlenen analiz), ASGI_DB_POOL_MIN (2), ASGI_DB_POOL_MAX (20)
+#   DB_SSLMODE ("require"), JOB_POLL_SECONDS, JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS (jobs.py ile aynı)
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import asyncio
+import contextlib
+
+import asyncpg
+import openai
+from markupsafe import escape
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+# thread worker'lar yerine AsyncAnalysisRunner çalışır: app import'u worker thread başlatmasın
+os.environ["JOB_AUTOSTART"] = "0"
+import app as flask_module
+from chunking import EMBED_DOC_TOKENS, count_tokens, document_embedding
+from embeddings import aget_embedding
+from jobs import CLAIM_SQL
+import report_fields
+import quantize
+
+flask_app = flask_module.app
+ASGI_JOB_CONCURRENCY = int(os.getenv("ASGI_JOB_CONCURRENCY", "200"))
+
+_QUEUE = flask_module.get_job_queue()
+_QUEUE.workers = 0
+
+
+def _dollar(sql):
+    """psycopg2 %s -> asyncpg $1, $2, ..."""
+    n = iter(range(1, 1000))
+    return re.sub(r"%s", lambda _: f"${next(n)}", sql)
+
+
+@contextlib.contextmanager
+def flask_context(request):
+    """Flask session (imzalı cookie) ve url_for için istek bağlamı."""
+    with flask_app.test_request_context(request.url.path, headers={
+        "Cookie": request.headers.get("cookie", ""),
+        "User-Agent": request.headers.get("user-agent", ""),
+        "X-Forwarded-For": request.headers.get("x-forwarded-for", request.client.host if request.client else ""),
+    }) as ctx:
+        yield ctx
+
+
+def _flask_call(request, fn, *args):
+    with flask_context(request):
+        return fn(*args)
+
+
+# ---------- Canlı çıktı (aynı event loop'taki okuyucular) ----------
+_LIVE = {}  # job_id -> {"text", "done", "event": asyncio.Event}
+
+
+def _publish(job_id, text=None, done=False):
+    live = _LIVE.setdefault(job_id, {"text": "", "done": False, "event": asyncio.Event()})
+    if text is not None:
+        live["text"] = text
+    live["done"] = live["done"] or done
+    # bekleyen tüm okuyucuları uyandır, yenileri yeni event'i bekler
+    old, live["event"] = live["event"], asyncio.Event()
+    old.set()
+
+
+class AsyncAnalysisRunner:
+    """analysis_jobs'tan 'analyze' işlerini alır; eşzamanlılık semaphore ile sınırlı."""
+
+    def __init__(self, pool, concurrency=200):
+        self.pool = pool
+        self._sem = asyncio.Semaphore(concurrency)
+        self._wake = asyncio.Event()
+        self._tasks = set()
+        self._claim_sql = _dollar(CLAIM_SQL)
+
+    def wake(self):
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            await self._sem.acquire()
+            try:
+                job = await self.pool.fetchrow(self._claim_sql, ["analyze"], float(_QUEUE.stale_seconds),
+                                               _QUEUE.max_attempts)
+            except Exception as e:
+                print(f"[asgi] claim: {e}", file=sys.stderr, flush=True)
+                job = None
+            if job is None:
+                self._sem.release()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), _QUEUE.poll_seconds)
+                self._wake.clear()
+                continue
+            task = asyncio.create_task(self._run_job(dict(job)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_job(self, job):
+        jid = str(job["id"])
+        try:
+            result = await self._analyze(job)
+            await self.pool.execute("UPDATE analysis_jobs SET status='done', result=$1::jsonb, input=NULL, partial=NULL, "
+                                    "finished_at=NOW() WHERE id=$2;", json.dumps(result), job["id"])
+        except Exception as e:
+            print(f"[asgi] analyze {jid} başarısız: {e}", file=sys.stderr, flush=True)
+            with contextlib.suppress(Exception):
+                await self.pool.execute("UPDATE analysis_jobs SET status='failed', error=$1, input=NULL, partial=NULL, "
+                                        "finished_at=NOW() WHERE id=$2;", str(e)[:1000] or e.__class__.__name__, job["id"])
+        finally:
+            _publish(jid, done=True)
+            self._sem.release()
+            # geç bağlanan okuyucular DB'ye düşer
+            asyncio.get_running_loop().call_later(30, _LIVE.pop, jid, None)
+
+    async def _analyze(self, job):
+        """app.run_analysis_job ile aynı adımlar; ağ beklemeleri async, CPU/psycopg2 kısmı thread'de."""
+        p = json.loads(job["payload"]) if isinstance(job["payload"], str) else (job["payload"] or {})
+        method, lang = p.get("method", "Five Whys"), p.get("lang", "English")
+        jid = str(job["id"])
+
+        text = await asyncio.to_thread(flask_module.extract_text_from_pdf, bytes(job["input"] or b""))
+        if count_tokens(text) <= EMBED_DOC_TOKENS:
+            q_emb = await aget_embedding(text)
+        else:  # parçalı + havuzlanmış belge vektörü
+            q_emb = await asyncio.to_thread(document_embedding, text)
+        version = await asyncio.to_thread(flask_module._corpus_version)
+        similar_cases = await asyncio.to_thread(flask_module.find_similar, q_emb, text,
+                                                k=flask_module.SIMILAR_K, min_sim=flask_module.SIMILAR_MIN_SIM)
+
+        messages = await asyncio.to_thread(flask_module.analysis_messages, text, method, lang, None, similar_cases)
+        parts, flushed_at = [], 0.0
+        async for chunk in await openai.ChatCompletion.acreate(model=flask_module.ANALYSIS_MODEL, messages=messages,
+                                                                max_tokens=flask_module.ANALYSIS_MAX_TOKENS, stream=True):
+            delta = chunk.choices[0].get("delta", {}).get("content")
+            if not delta:
+                continue
+            parts.append(delta)
+            _publish(jid, "".join(parts))
+            # başka süreçteki okuyucular için (Flask /jobs/<id>/stream)
+            if time.monotonic() - flushed_at >= _QUEUE.partial_flush_seconds:
+                flushed_at = time.monotonic()
+                await self.pool.execute("UPDATE analysis_jobs SET partial=$1 WHERE id=$2;", "".join(parts), job["id"])
+        result = "".join(parts).strip()
+
+        rid = str(uuid.uuid4())
+        keywords, summary, snippet = report_fields.derive(text, result)
+        await self.pool.execute("INSERT INTO sreports (id, method, lang, report_text, result_text, embedding, embedding_q, "
+                                "keywords, incident_summary, snippet) VALUES ($1,$2,$3,$4,$5,$6::jsonb,$7,$8::text[],$9,$10);",
+                                uuid.UUID(rid), method, lang, text, result, json.dumps(q_emb), quantize.encode(q_emb),
+                                keywords, summary, snippet)
+        await asyncio.to_thread(flask_module._report_added, rid, method, text, q_emb, similar_cases, version)
+
+        title = f"Safety Report — {method} — {lang}"
+        flask_module.log_event("analyze", report_id=rid, title=title, ctx=p.get("ctx") or {},
+                               extra={"method": method, "lang": lang, "similar_count": len(similar_cases), "job_id": jid})
+        return {"report_id": rid, "method": method, "lang": lang, "similar_count": len(similar_cases)}
+
+
+# ---------- Route'lar ----------
+async def analyze(request):
+    with flask_context(request):
+        sess = dict(flask_module.session)
+        ip = flask_module._client_ip()
+    if not sess.get("logged_in"):
+        return PlainTextResponse("Unauthorized", 401)
+
+    form = await request.form()
+    pdf = form.get("pdf")
+    # Flask'taki request.files["pdf"] gibi: dosya alanı yoksa 400
+    if not isinstance(pdf, UploadFile):
+        return PlainTextResponse("Bad Request: missing 'pdf' file", 400)
+    if (pdf.size or 0) > flask_module.PDF_MAX_BYTES:
+        return HTMLResponse(f"<div class='text-rose-400'>PDF is larger than {flask_module.PDF_MAX_BYTES // (1024 * 1024)} MB.</div>", 413)
+    data = await pdf.read()
+    method = form.get("method") or "Five Whys"
+    lang = form.get("lang") or "English"
+    ctx = {"user_id": sess.get("user_id"), "username": sess.get("username"),
+           "ip": ip, "user_agent": (request.headers.get("user-agent") or "")[:300]}
+    payload = {"method": method, "lang": lang, "ctx": ctx, "stream": flask_module.ANALYZE_STREAM}
+
+    job_id = uuid.uuid4()
+    await request.app.state.pool.execute(
+        "INSERT INTO analysis_jobs (id, kind, payload, input, user_id, username) VALUES ($1,'analyze',$2::jsonb,$3,$4,$5);",
+        job_id, json.dumps(payload), data, uuid.UUID(ctx["user_id"]) if ctx["user_id"] else None, ctx["username"])
+    request.app.state.runner.wake()
+
+    with flask_context(request):
+        if flask_module.ANALYZE_STREAM:
+            html = flask_module._job_stream_block(str(job_id), method, lang)
+        else:
+            html = flask_module._job_pending_block(str(job_id), "queued", method, lang)
+    return HTMLResponse(html)
+
+
+async def job_stream(request):
+    job_id = request.path_params["job_id"]
+    with flask_context(request):
+        sess = dict(flask_module.session)
+    if not sess.get("logged_in"):
+        return PlainTextResponse("Unauthorized", 401)
+    try:
+        row = await request.app.state.pool.fetchrow("SELECT user_id FROM analysis_jobs WHERE id=$1;", uuid.UUID(job_id))
+    except ValueError:
+        row = None
+    if not row or (str(row["user_id"]) != sess.get("user_id") and not sess.get("is_admin")):
+        return PlainTextResponse("Not found", 404)
+
+    pool = request.app.state.pool
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        seen, started, finished = 0, loop.time(), False
+        while not finished and loop.time() - started < flask_module.STREAM_MAX_SECONDS:
+            live = _LIVE.get(job_id)
+            if live is not None:
+                event = live["event"]
+                text, finished = live["text"], live["done"]
+                if len(text) <= seen and not finished:
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(event.wait(), 15.0)
+                    text, finished = live["text"], live["done"]
+            else:
+                # iş başka süreçte ya da henüz alınmadı
+                await asyncio.sleep(_QUEUE.partial_flush_seconds)
+                r = await pool.fetchrow("SELECT status, partial FROM analysis_jobs WHERE id=$1;", uuid.UUID(job_id))
+                text, finished = (r["partial"] or "", r["status"] in ("done", "failed")) if r else ("", True)
+            if len(text) > seen:
+                yield flask_module._sse("token", str(escape(text[seen:])))
+                seen = len(text)
+            elif not finished:
+                yield ": keepalive\n\n"
+        # son blok Flask view'ı ile (aynı HTML)
+        html = await asyncio.to_thread(_flask_call, request, flask_module.job_status, job_id)
+        yield flask_module._sse("done", html if isinstance(html, str) else html[0])
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(asgi_app):
+    sslmode = os.getenv("DB_SSLMODE", "require") or None
+    asgi_app.state.pool = await asyncpg.create_pool(
+        flask_module.DB_URL, ssl=sslmode,
+        min_size=int(os.getenv("ASGI_DB_POOL_MIN", "2")), max_size=int(os.getenv("ASGI_DB_POOL_MAX", "20")))
+    asgi_app.state.runner = AsyncAnalysisRunner(asgi_app.state.pool, ASGI_JOB_CONCURRENCY)
+    task = asyncio.create_task(asgi_app.state.runner.run())
+    try:
+        yield
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        await asgi_app.state.pool.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/analyze", analyze, methods=["POST"]),
+        Route("/jobs/{job_id}/stream", job_stream),
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
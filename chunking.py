@@ -0,0 +1,233 @@
+# chunking.py
+# Uzun raporlar için token bazlı parçalama.
+#   - split_chunks(): paragraf/cümle sınırlarında, token bütçeli ve örtüşmeli parçalar
+#   - embed_documents(): limiti aşan belgeleri parçalara böler, parça embedding'lerini
+#     token ağırlıklı ortalama ile tek belge vektörüne indirger (kısa belgeler eskisi gibi tek çağrı)
+#   - condense(): GPT prompt'una sığmayan rapor için map-reduce özet (parça özetleri paralel)
+# Böylece hem embedding hem analiz prompt'u için maliyet/gecikme üst sınırlı olur.
+#
+# Env:
+#   EMBED_DOC_TOKENS (6000; bunun üstü parçalanır), CHUNK_TOKENS (1000), CHUNK_OVERLAP (100)
+#   PROMPT_REPORT_TOKENS (6000; prompt'a giren rapor metni), PROMPT_SIMILAR_TOKENS (1500; benzer vakalar)
+#   PROMPT_FEEDBACK_TOKENS (800; reviewer feedback), ANALYSIS_CONTEXT_TOKENS (8192; analiz modelinin bağlamı)
+#     -> rapor bütçesi = min(PROMPT_REPORT_TOKENS, bağlam - max_tokens - şablon/benzer vaka/feedback tokenları)
+#   MAP_CHUNK_TOKENS (3000), MAP_MAX_PARTS (24; tek turdaki özet çağrısı, gerekirse parçalar büyür)
+#   SUMMARY_MODEL ("gpt-3.5-turbo"), SUMMARY_CONTEXT_TOKENS (16385; özet modelinin bağlamı), SUMMARY_WORKERS (4)
+#     -> parça üst sınırı = özet bağlamı - SUMMARY_MAX_TOKENS - MAP_PROMPT; MAP_MAX_PARTS parça metni
+#        kapsamıyorsa metin bölümlere ayrılıp her bölüm ayrı yoğunlaştırılır (kuyruk atılmaz)
+
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import openai
+except Exception:
+    openai = None
+
+from embeddings import DEFAULT_MODEL, embed_batch, estimate_tokens, tiktoken
+
+EMBED_DOC_TOKENS = int(os.getenv("EMBED_DOC_TOKENS", "6000"))
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
+PROMPT_REPORT_TOKENS = int(os.getenv("PROMPT_REPORT_TOKENS", "6000"))
+PROMPT_SIMILAR_TOKENS = int(os.getenv("PROMPT_SIMILAR_TOKENS", "1500"))
+PROMPT_FEEDBACK_TOKENS = int(os.getenv("PROMPT_FEEDBACK_TOKENS", "800"))
+ANALYSIS_CONTEXT_TOKENS = int(os.getenv("ANALYSIS_CONTEXT_TOKENS", "8192"))
+# chat mesaj çerçevesi + sayım farkları için pay
+PROMPT_MARGIN_TOKENS = 64
+MAP_CHUNK_TOKENS = int(os.getenv("MAP_CHUNK_TOKENS", "3000"))
+MAP_MAX_PARTS = int(os.getenv("MAP_MAX_PARTS", "24"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "16385"))
+# parça özeti başına yanıt üst sınırı (max_tokens)
+SUMMARY_MAX_TOKENS = 800
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))
+
+count_tokens = estimate_tokens
+
+_SENT_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    if tiktoken is not None:
+        try:
+            enc = tiktoken.get_encoding("cl100k_base")
+            return enc.decode(enc.encode(text, disallowed_special=())[:max_tokens])
+        except Exception:
+            pass
+    return text[:max_tokens * 4]
+
+
+def report_budget(prompt_tokens, max_tokens, context=None):
+    """Rapor metnine kalan token: bağlam - yanıt (max_tokens) - rapor hariç prompt, PROMPT_REPORT_TOKENS ile sınırlı."""
+    left = (context or ANALYSIS_CONTEXT_TOKENS) - max_tokens - prompt_tokens - PROMPT_MARGIN_TOKENS
+    return max(0, min(PROMPT_REPORT_TOKENS, left))
+
+
+def _units(text, max_tokens):
+    """Paragraf -> cümle -> kelime; her birim max_tokens'a sığar."""
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        if count_tokens(para) <= max_tokens:
+            yield para
+            continue
+        for sent in _SENT_RE.split(para):
+            if count_tokens(sent) <= max_tokens:
+                yield sent
+                continue
+            buf, used = [], 0
+            for w in sent.split():
+                n = count_tokens(" " + w)
+                if n > max_tokens:  # tek "kelime" bütçeden büyük (base64, tablo artığı): karakterle böl
+                    if buf:
+                        yield " ".join(buf)
+                        buf, used = [], 0
+                    # her token >= 1 karakter: max_tokens karakter bütçeyi aşamaz
+                    for i in range(0, len(w), max_tokens):
+                        yield w[i:i + max_tokens]
+                    continue
+                if buf and used + n > max_tokens:
+                    yield " ".join(buf)
+                    buf, used = [], 0
+                buf.append(w)
+                used += n
+            if buf:
+                yield " ".join(buf)
+
+
+def split_chunks(text: str, max_tokens=None, overlap=None):
+    """Token bütçeli parçalar; ardışık parçalar ~overlap token örtüşür (son birimler tekrar edilir)."""
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    chunks, cur, cur_tok = [], [], 0
+    for unit in _units(text or "", max_tokens):
+        n = count_tokens(unit)
+        if cur and cur_tok + n > max_tokens:
+            chunks.append("\n\n".join(cur))
+            # örtüşme: son birimleri overlap bütçesi kadar taşı
+            keep, kept = [], 0
+            for u in reversed(cur):
+                t = count_tokens(u)
+                if kept + t > overlap:
+                    break
+                keep.insert(0, u)
+                kept += t
+            cur, cur_tok = keep, kept
+        cur.append(unit)
+        cur_tok += n
+    if cur:
+        chunks.append("\n\n".join(cur))
+    return chunks
+
+
+def pool_vectors(vecs, weights=None):
+    """Ağırlıklı ortalama + L2 normalize; vecs boşsa None."""
+    pairs = [(v, w) for v, w in zip(vecs, weights or [1.0] * len(vecs)) if v is not None]
+    if not pairs:
+        return None
+    mat = np.asarray([v for v, _ in pairs], dtype=np.float32)
+    w = np.asarray([w for _, w in pairs], dtype=np.float32)
+    mean = (mat * w[:, None]).sum(axis=0) / (w.sum() or 1.0)
+    norm = float(np.linalg.norm(mean)) or 1.0
+    return (mean / norm).tolist()
+
+
+def doc_chunks(text: str):
+    """Embedding için parçalar: limitin altındaki belge tek parça (eski davranış, cache uyumlu)."""
+    if count_tokens(text or "") <= EMBED_DOC_TOKENS:
+        return [text or ""]
+    return split_chunks(text)
+
+
+def embed_documents(texts, model=DEFAULT_MODEL, limiter=None):
+    """texts ile aynı sırada belge vektörleri (alınamayan None). Tüm parçalar tek embed_batch'te."""
+    per_doc = [doc_chunks(t) for t in texts]
+    flat = [c for chunks in per_doc for c in chunks]
+    embs = embed_batch(flat, model=model, limiter=limiter) if flat else []
+    out, pos = [], 0
+    for chunks in per_doc:
+        part = embs[pos:pos + len(chunks)]
+        pos += len(chunks)
+        if len(chunks) == 1:
+            out.append(part[0])
+        else:
+            out.append(pool_vectors(part, [count_tokens(c) for c in chunks]))
+    return out
+
+
+def document_embedding(text: str, model=DEFAULT_MODEL):
+    emb = embed_documents([text], model=model)[0]
+    if emb is None:
+        raise RuntimeError("embedding failed")
+    return emb
+
+
+# ---------- Map-reduce özet ----------
+MAP_PROMPT = """You are condensing one part ({i} of {n}) of a long aviation safety / investigation report.
+Keep every fact relevant to a root-cause analysis: sequence of events, aircraft and operator, flight phase,
+location, weather, crew and ATC actions, technical findings, contributing factors and recommendations.
+Drop boilerplate, tables of contents and repeated text. Use at most {words} words.
+
+Report part:
+{chunk}
+"""
+
+
+def _summarize(chunk, i, n, max_tokens):
+    resp = openai.ChatCompletion.create(
+        model=SUMMARY_MODEL,
+        messages=[{"role": "user", "content": MAP_PROMPT.format(i=i, n=n, words=int(max_tokens * 0.7), chunk=chunk)}],
+        max_tokens=max_tokens,
+    )
+    return resp.choices[0].message.content.strip()
+
+
+def summary_chunk_tokens():
+    """Bir özet çağrısına giren parçanın üst sınırı: özet bağlamı - yanıt - MAP_PROMPT şablonu."""
+    overhead = count_tokens(MAP_PROMPT.format(i=MAP_MAX_PARTS, n=MAP_MAX_PARTS, words=SUMMARY_MAX_TOKENS, chunk=""))
+    return max(256, SUMMARY_CONTEXT_TOKENS - SUMMARY_MAX_TOKENS - overhead - PROMPT_MARGIN_TOKENS)
+
+
+def condense(text: str, budget_tokens=None, _depth=0):
+    """Metin bütçeye sığıyorsa aynen; sığmıyorsa parça özetleri (map) birleştirilir (reduce)."""
+    budget_tokens = PROMPT_REPORT_TOKENS if budget_tokens is None else budget_tokens
+    if budget_tokens <= 0:
+        return ""
+    if count_tokens(text or "") <= budget_tokens:
+        return text
+    if openai is None or _depth >= 2:
+        return truncate_tokens(text, budget_tokens)
+
+    total = count_tokens(text)
+    limit = summary_chunk_tokens()
+    # paketleme boşluk bırakır: %15 pay
+    size = min(max(MAP_CHUNK_TOKENS, -(-total * 115 // (100 * MAP_MAX_PARTS))), limit)
+    chunks = split_chunks(text, size, overlap=0)
+    if len(chunks) > MAP_MAX_PARTS:
+        # özet bağlamı MAP_MAX_PARTS parçayla tüm metni kapsamaya yetmiyor: ardışık bölümlere ayır,
+        # her bölümü payına düşen bütçeye yoğunlaştır, sonuçları birleştirip tekrar indir
+        per = -(-len(chunks) // MAP_MAX_PARTS)
+        sections = ["\n\n".join(chunks[i:i + per]) for i in range(0, len(chunks), per)]
+        share = max(1, budget_tokens // len(sections))
+        joined = "\n\n".join(condense(sec, share, _depth) for sec in sections)
+        return condense(joined, budget_tokens, _depth + 1)
+    n = len(chunks)
+    per_part = max(150, min(SUMMARY_MAX_TOKENS, budget_tokens // n))
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_WORKERS, n))) as ex:
+            summaries = list(ex.map(lambda a: _summarize(a[1], a[0] + 1, n, per_part), enumerate(chunks)))
+    except Exception as e:
+        print(f"[chunking] map-reduce özet başarısız, metin kırpılıyor: {e}", file=sys.stderr, flush=True)
+        return truncate_tokens(text, budget_tokens)
+
+    joined = f"[Condensed from a {total}-token report in {n} parts]\n\n" + \
+             "\n\n".join(f"[Part {i + 1}/{n}]\n{s}" for i, s in enumerate(summaries))
+    return condense(joined, budget_tokens, _depth + 1)
@@ -0,0 +1,178 @@
+# db.py
+# Paylaşılan, thread-safe Postgres bağlantı havuzu (app.py + scripts).
+# Her istekte yeni TLS bağlantısı açmak yerine bağlantılar havuzdan alınır/iade edilir.
+#
+# Env:
+#   DATABASE_URL
+#   DB_POOL_MIN (1), DB_POOL_MAX (10), DB_POOL_TIMEOUT (30 sn, havuz doluyken bekleme)
+#   DB_POOL_CHECK_IDLE (30 sn; bu kadar boşta kalan bağlantı checkout'ta SELECT 1 ile kontrol edilir)
+#   DB_SSLMODE ("require"; script_conn() için libpq varsayılanı)
+
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """ThreadedConnectionPool + bloklayan checkout, health check ve metrikler."""
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=30.0, check_idle=30.0, **connect_kwargs):
+        self.dsn = dsn
+        self.minconn, self.maxconn = minconn, maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}  # id(conn) -> time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {"checkouts": 0, "waits": 0, "wait_ms_total": 0.0, "timeouts": 0,
+                       "health_checks": 0, "discarded": 0, "in_use": 0, "max_in_use": 0}
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        last = self._last_used.get(id(conn))
+        if last is None or time.monotonic() - last < self.check_idle:
+            return True
+        with self._lock:
+            self._stats["health_checks"] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        t0 = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["waits"] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise PoolTimeout(f"no DB connection available within {self.timeout}s")
+            with self._lock:
+                self._stats["wait_ms_total"] += (time.monotonic() - t0) * 1000
+        try:
+            conn = self._pool.getconn()
+            # boşta kalırken kopmuş bağlantıları at; havuz yenisini açar
+            for _ in range(self.maxconn):
+                if self._healthy(conn):
+                    break
+                with self._lock:
+                    self._stats["discarded"] += 1
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["max_in_use"] = max(self._stats["max_in_use"], self._stats["in_use"])
+        return conn
+
+    def putconn(self, conn):
+        close = bool(conn.closed)
+        if not close:
+            try:
+                # yarım kalan transaction'ı havuza geri taşımayalım
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                close = True
+        if close:
+            self._last_used.pop(id(conn), None)
+            with self._lock:
+                self._stats["discarded"] += 1
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s["min"], s["max"] = self.minconn, self.maxconn
+        s["idle"] = len(self._pool._pool)
+        s["open"] = s["idle"] + s["in_use"]
+        s["avg_wait_ms"] = round(s["wait_ms_total"] / s["waits"], 2) if s["waits"] else 0.0
+        return s
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+_POOL = None
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool(dsn=None, **overrides):
+    """Süreç başına tek havuz (gunicorn fork'undan sonra yeniden kurulur)."""
+    global _POOL, _POOL_PID
+    pid = os.getpid()
+    if _POOL is not None and _POOL_PID == pid:
+        return _POOL
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_PID != pid:
+            dsn = dsn or os.getenv("DATABASE_URL")
+            if not dsn:
+                raise RuntimeError("DATABASE_URL is not set.")
+            kwargs = {
+                "minconn": int(os.getenv("DB_POOL_MIN", "1")),
+                "maxconn": int(os.getenv("DB_POOL_MAX", "10")),
+                "timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                "check_idle": float(os.getenv("DB_POOL_CHECK_IDLE", "30")),
+            }
+            sslmode = os.getenv("DB_SSLMODE", "require")
+            if sslmode:
+                kwargs["sslmode"] = sslmode
+            kwargs.update(overrides)
+            if kwargs.get("sslmode") is None:
+                kwargs.pop("sslmode", None)
+            _POOL = ConnectionPool(dsn, **kwargs)
+            _POOL_PID = pid
+    return _POOL
+
+
+def script_conn():
+    """scripts/ için: DATABASE_URL yoksa mesajla çıkar; sslmode libpq varsayılanı (DB_SSLMODE ile değişir).
+    `with script_conn() as conn:` ile kullanılır."""
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL yok.", file=sys.stderr); sys.exit(1)
+    return get_pool(sslmode=os.getenv("DB_SSLMODE")).connection()
+
+
+@contextmanager
+def get_conn():
+    """Havuzdan bağlantı: `with get_conn() as conn:` — çıkışta commit edilmemiş iş geri alınır."""
+    with get_pool().connection() as conn:
+        yield conn
@@ -0,0 +1,429 @@
+# embeddings.py
+# OpenAI embedding çağrıları + içerik adresli cache.
+# Anahtar: (model, sha256(normalize edilmiş metin)). Önce süreç içi LRU, sonra (CACHE_BACKEND
+# sqlite/postgres ise) worker'lar arası paylaşılan katman (sharedcache.py), sonra Postgres'teki
+# embedding_cache tablosu; hiçbirinde yoksa OpenAI'ye gidilir.
+#
+# Toplu işler için embed_batch(): istek başına N girdi, token bütçeli paketleme,
+# rate limit'te exponential backoff, hatalı girdileri ikiye bölerek ayıklama.
+#
+# Env:
+#   EMBED_CACHE_SIZE (2048; LRU kapasitesi), EMBED_CACHE_DB (1; 0 ise sadece bellek)
+#   EMBED_SHARED_TTL (604800 s; paylaşılan katmanda ömür)
+#   EMBED_BATCH_MAX (256 girdi/istek), EMBED_BATCH_TOKENS (250000 token/istek), EMBED_MAX_RETRIES (6)
+#   OPENAI_API_BASE: openai 0.28 bunu kendisi okur (ör. scripts/fake_openai.py ile offline test)
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+import psycopg2.extras
+
+try:
+    import openai
+except Exception:
+    openai = None
+
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+from db import get_conn
+from sharedcache import get_backend as get_shared_cache
+
+DEFAULT_MODEL = "text-embedding-3-small"
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "256"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "250000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_SHARED_TTL = float(os.getenv("EMBED_SHARED_TTL", str(7 * 86400)))
+
+
+def normalize_text(text: str) -> str:
+    """NFC + boşlukları tek boşluğa indirir; cache anahtarı için."""
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """LRU bellek katmanı + (opsiyonel) Postgres embedding_cache tablosu."""
+
+    def __init__(self, max_items=2048, use_db=True):
+        self.max_items = max_items
+        self.use_db = use_db
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._table_ready = False
+        self._stats = {"mem_hits": 0, "shared_hits": 0, "db_hits": 0, "misses": 0, "db_errors": 0}
+
+    def _ensure_table(self, cur):
+        if self._table_ready:
+            return
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            embedding JSONB NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (model, text_hash)
+        );
+        """)
+        self._table_ready = True
+
+    def _remember(self, key, emb):
+        with self._lock:
+            self._mem[key] = emb
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+
+    # ---------- paylaşılan katman (float64 bayt; JSON'dan küçük, kayıpsız) ----------
+    @staticmethod
+    def _shared():
+        backend = get_shared_cache()
+        return backend if backend.shared else None
+
+    def _shared_get(self, keys):
+        """keys: [(model, hash)] -> {key: emb}"""
+        backend = self._shared()
+        if backend is None or not keys:
+            return {}
+        try:
+            raw = backend.get_many("emb", [f"{m}:{h}" for m, h in keys])
+        except Exception as e:
+            print(f"[embedding_cache] shared: {e}", file=sys.stderr, flush=True)
+            return {}
+        out = {}
+        for m, h in keys:
+            v = raw.get(f"{m}:{h}")
+            if v is not None:
+                out[(m, h)] = array("d", v).tolist()
+        return out
+
+    def _shared_put(self, pairs):
+        """pairs: [((model, hash), emb)]"""
+        backend = self._shared()
+        if backend is None or not pairs:
+            return
+        try:
+            backend.set_many("emb", [(f"{m}:{h}", array("d", emb).tobytes()) for (m, h), emb in pairs],
+                             EMBED_SHARED_TTL)
+        except Exception as e:
+            print(f"[embedding_cache] shared: {e}", file=sys.stderr, flush=True)
+
+    def _db_error(self, e):
+        with self._lock:
+            self._stats["db_errors"] += 1
+        print(f"[embedding_cache] DB: {e}", file=sys.stderr, flush=True)
+
+    def get(self, model, text):
+        key = (model, text_hash(text))
+        with self._lock:
+            emb = self._mem.get(key)
+            if emb is not None:
+                self._mem.move_to_end(key)
+                self._stats["mem_hits"] += 1
+                return emb
+        emb = self._shared_get([key]).get(key)
+        if emb is not None:
+            self._remember(key, emb)
+            with self._lock:
+                self._stats["shared_hits"] += 1
+            return emb
+        if self.use_db:
+            try:
+                with get_conn() as conn:
+                    cur = conn.cursor()
+                    self._ensure_table(cur)
+                    cur.execute("SELECT embedding FROM embedding_cache WHERE model=%s AND text_hash=%s;", key)
+                    row = cur.fetchone()
+                    conn.commit(); cur.close()
+                if row:
+                    emb = json.loads(row[0]) if isinstance(row[0], str) else row[0]
+                    self._remember(key, emb)
+                    self._shared_put([(key, emb)])
+                    with self._lock:
+                        self._stats["db_hits"] += 1
+                    return emb
+            except Exception as e:
+                self._db_error(e)
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, model, text, emb):
+        key = (model, text_hash(text))
+        self._remember(key, emb)
+        self._shared_put([(key, emb)])
+        if self.use_db:
+            try:
+                with get_conn() as conn:
+                    cur = conn.cursor()
+                    self._ensure_table(cur)
+                    cur.execute("INSERT INTO embedding_cache (model, text_hash, embedding) VALUES (%s,%s,%s) "
+                                "ON CONFLICT DO NOTHING;", (key[0], key[1], json.dumps(emb)))
+                    conn.commit(); cur.close()
+            except Exception as e:
+                self._db_error(e)
+
+    def get_many(self, model, texts):
+        """{i: embedding} — sadece cache'te bulunanlar (DB'ye tek sorgu)."""
+        found, need = {}, {}
+        with self._lock:
+            for i, t in enumerate(texts):
+                key = (model, text_hash(t))
+                emb = self._mem.get(key)
+                if emb is not None:
+                    self._mem.move_to_end(key)
+                    self._stats["mem_hits"] += 1
+                    found[i] = emb
+                else:
+                    need.setdefault(key[1], []).append(i)
+        if need:
+            for (_, h), emb in self._shared_get([(model, h) for h in need]).items():
+                self._remember((model, h), emb)
+                for i in need.pop(h):
+                    found[i] = emb
+                    with self._lock:
+                        self._stats["shared_hits"] += 1
+        if need and self.use_db:
+            try:
+                with get_conn() as conn:
+                    cur = conn.cursor()
+                    self._ensure_table(cur)
+                    cur.execute("SELECT text_hash, embedding FROM embedding_cache WHERE model=%s AND text_hash = ANY(%s);",
+                                (model, list(need)))
+                    rows = cur.fetchall()
+                    conn.commit(); cur.close()
+                rows = [(h, json.loads(emb) if isinstance(emb, str) else emb) for h, emb in rows]
+                self._shared_put([((model, h), emb) for h, emb in rows])
+                for h, emb in rows:
+                    emb = json.loads(emb) if isinstance(emb, str) else emb
+                    self._remember((model, h), emb)
+                    for i in need.pop(h, []):
+                        found[i] = emb
+                        with self._lock:
+                            self._stats["db_hits"] += 1
+            except Exception as e:
+                self._db_error(e)
+        with self._lock:
+            self._stats["misses"] += sum(len(v) for v in need.values())
+        return found
+
+    def put_many(self, model, pairs):
+        """pairs: [(text, embedding), ...]"""
+        rows, shared = {}, []
+        for text, emb in pairs:
+            key = (model, text_hash(text))
+            self._remember(key, emb)
+            rows[key[1]] = (model, key[1], json.dumps(emb))
+            shared.append((key, emb))
+        self._shared_put(shared)
+        if rows and self.use_db:
+            try:
+                with get_conn() as conn:
+                    cur = conn.cursor()
+                    self._ensure_table(cur)
+                    psycopg2.extras.execute_values(
+                        cur, "INSERT INTO embedding_cache (model, text_hash, embedding) VALUES %s ON CONFLICT DO NOTHING;",
+                        list(rows.values()))
+                    conn.commit(); cur.close()
+            except Exception as e:
+                self._db_error(e)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s["mem_items"] = len(self._mem)
+        s["max_items"] = self.max_items
+        return s
+
+
+_CACHE = EmbeddingCache(
+    max_items=int(os.getenv("EMBED_CACHE_SIZE", "2048")),
+    use_db=os.getenv("EMBED_CACHE_DB", "1") != "0",
+)
+
+
+def get_cache():
+    return _CACHE
+
+
+def get_embedding(text: str, model=DEFAULT_MODEL):
+    """Cache'e bakar; yoksa OpenAI'den alır ve cache'e yazar. openai.api_key çağıran tarafta ayarlanır."""
+    emb = _CACHE.get(model, text)
+    if emb is not None:
+        return emb
+    if openai is None:
+        raise RuntimeError("openai package is not installed")
+    resp = openai.Embedding.create(model=model, input=text)
+    emb = resp["data"][0]["embedding"]
+    _CACHE.put(model, text, emb)
+    return emb
+
+
+async def aget_embedding(text: str, model=DEFAULT_MODEL):
+    """get_embedding'in asyncio sürümü (asgi.py): OpenAI çağrısı aiohttp ile, cache thread'de."""
+    import asyncio
+    emb = await asyncio.to_thread(_CACHE.get, model, text)
+    if emb is not None:
+        return emb
+    if openai is None:
+        raise RuntimeError("openai package is not installed")
+    resp = await openai.Embedding.acreate(model=model, input=text)
+    emb = resp["data"][0]["embedding"]
+    await asyncio.to_thread(_CACHE.put, model, text, emb)
+    return emb
+
+
+# ---------- Rate limit ----------
+class RateLimiter:
+    """İki token bucket: istek/dakika (rpm) ve token/dakika (tpm). Thread-safe; acquire() bekletir."""
+
+    def __init__(self, rpm=None, tpm=None):
+        self.rpm, self.tpm = rpm, tpm
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        self._req = float(rpm or 0)
+        self._tok = float(tpm or 0)
+        self._t = now
+
+    def _refill(self, now):
+        dt = now - self._t
+        self._t = now
+        if self.rpm:
+            self._req = min(float(self.rpm), self._req + dt * self.rpm / 60.0)
+        if self.tpm:
+            self._tok = min(float(self.tpm), self._tok + dt * self.tpm / 60.0)
+
+    def acquire(self, tokens=0):
+        # bütçeden büyük tek istek sonsuza kadar beklemesin
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                need_r = 0.0 if not self.rpm else max(0.0, 1 - self._req) * 60.0 / self.rpm
+                need_t = 0.0 if not self.tpm else max(0.0, tokens - self._tok) * 60.0 / self.tpm
+                wait = max(need_r, need_t)
+                if wait <= 0:
+                    if self.rpm:
+                        self._req -= 1
+                    if self.tpm:
+                        self._tok -= tokens
+                    return
+            time.sleep(min(wait, 5.0))
+
+
+# ---------- Batch ----------
+_ENCODER = None
+
+def estimate_tokens(text: str) -> int:
+    """tiktoken varsa gerçek sayım, yoksa ~4 karakter/token tahmini."""
+    global _ENCODER
+    if tiktoken is not None:
+        try:
+            if _ENCODER is None:
+                _ENCODER = tiktoken.get_encoding("cl100k_base")
+            return len(_ENCODER.encode(text or "", disallowed_special=()))
+        except Exception:
+            pass
+    return len(text or "") // 4 + 1
+
+
+def _pack(items, max_inputs, max_tokens):
+    """(i, text) listesini girdi sayısı + token bütçesine göre paketler."""
+    batch, used = [], 0
+    for i, text in items:
+        n = estimate_tokens(text)
+        if batch and (len(batch) >= max_inputs or used + n > max_tokens):
+            yield batch
+            batch, used = [], 0
+        batch.append((i, text))
+        used += n
+    if batch:
+        yield batch
+
+
+def _retryable(e):
+    if openai is None:
+        return False
+    err = getattr(openai, "error", None)
+    kinds = tuple(k for k in (getattr(err, n, None) for n in (
+        "RateLimitError", "APIError", "Timeout", "ServiceUnavailableError", "APIConnectionError",
+        "TryAgain")) if k is not None)
+    return isinstance(e, kinds)
+
+
+def _input_error(e):
+    """Girdiye özgü kalıcı hata (400 InvalidRequestError: çok uzun / geçersiz girdi). Bölmek sadece bunda işe yarar."""
+    if openai is None:
+        return False
+    kind = getattr(getattr(openai, "error", None), "InvalidRequestError", None)
+    return kind is not None and isinstance(e, kind) and getattr(e, "http_status", 400) in (None, 400)
+
+
+def _create_with_retry(model, inputs, max_retries, limiter=None):
+    delay = 1.0
+    tokens = sum(estimate_tokens(t) for t in inputs) if limiter is not None else 0
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            resp = openai.Embedding.create(model=model, input=inputs)
+            data = sorted(resp["data"], key=lambda d: d["index"])
+            return [d["embedding"] for d in data]
+        except Exception as e:
+            if not _retryable(e) or attempt == max_retries:
+                raise
+            wait = delay * (1 + random.random() * 0.25)
+            print(f"[embed] {type(e).__name__}: {len(inputs)} girdi, {wait:.1f}s sonra tekrar ({attempt + 1}/{max_retries})",
+                  file=sys.stderr, flush=True)
+            time.sleep(wait)
+            delay = min(delay * 2, 60.0)
+
+
+def _embed_or_split(model, batch, out, max_retries, limiter=None):
+    """Paket girdi hatası (400) verirse ikiye bölünür; tek girdi de başarısızsa None kalır.
+    Diğer hatalar (auth, tükenmiş retry, bağlantı) bölmekle düzelmez, yukarı fırlatılır."""
+    try:
+        embs = _create_with_retry(model, [t for _, t in batch], max_retries, limiter)
+        for (i, _), emb in zip(batch, embs):
+            out[i] = emb
+    except Exception as e:
+        if not _input_error(e):
+            raise
+        if len(batch) == 1:
+            print(f"[embed] girdi #{batch[0][0]} atlandı: {e}", file=sys.stderr, flush=True)
+            return
+        mid = len(batch) // 2
+        _embed_or_split(model, batch[:mid], out, max_retries, limiter)
+        _embed_or_split(model, batch[mid:], out, max_retries, limiter)
+
+
+def embed_batch(texts, model=DEFAULT_MODEL, max_inputs=None, max_tokens=None, max_retries=None, limiter=None):
+    """texts ile aynı sırada embedding listesi döner; alınamayanlar None. limiter: RateLimiter (opsiyonel)."""
+    if openai is None:
+        raise RuntimeError("openai package is not installed")
+    max_inputs = max_inputs or EMBED_BATCH_MAX
+    max_tokens = max_tokens or EMBED_BATCH_TOKENS
+    max_retries = EMBED_MAX_RETRIES if max_retries is None else max_retries
+
+    out = [None] * len(texts)
+    for i, emb in _CACHE.get_many(model, texts).items():
+        out[i] = emb
+    todo = [(i, t) for i, t in enumerate(texts) if out[i] is None]
+    for batch in _pack(todo, max_inputs, max_tokens):
+        _embed_or_split(model, batch, out, max_retries, limiter)
+        _CACHE.put_many(model, [(t, out[i]) for i, t in batch if out[i] is not None])
+    return out
@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Procfile: gunicorn -c gunicorn.conf.py ... app:app
+# jobs.JobQueue worker thread'leri süreç başınadır ve fork'ta kopyalanmaz:
+#   - preload yok (varsayılan): her worker app'i fork'tan sonra import eder, thread'ler import'ta başlar.
+#   - GUNICORN_PRELOAD=1: app master'da bir kez import edilir; master'da thread başlatılmaz (JOB_AUTOSTART=0),
+#     her worker post_fork'ta kendi thread'lerini başlatır.
+#
+# Env:
+#   GUNICORN_PRELOAD (0)
+
+import os
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+if preload_app:
+    os.environ["JOB_AUTOSTART"] = "0"
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from jobs import get_queue
+        get_queue().start()
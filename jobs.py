@@ -0,0 +1,302 @@
+# jobs.py
+# Postgres tabanlı iş kuyruğu (analysis_jobs) + süreç içi worker thread havuzu.
+# /analyze işi kuyruğa yazar ve hemen job id döner; PDF çıkarma, embedding, benzer arama
+# ve GPT çağrısı worker'da yapılır, UI /jobs/<id> ile durumu poll eder.
+# İş satırı `FOR UPDATE SKIP LOCKED` ile alınır; birden fazla süreç/worker güvenle çalışır.
+# Yarıda kalan (worker ölmüş) işler JOB_STALE_SECONDS sonra tekrar kuyruğa düşer.
+#
+# Env:
+#   JOB_WORKERS (2; 0 ise bu süreç iş almaz, sadece kuyruğa yazar — scripts/job_worker.py kullanın)
+#   JOB_POLL_SECONDS (1.0), JOB_STALE_SECONDS (600), JOB_MAX_ATTEMPTS (2), JOB_RETENTION_HOURS (24)
+#   JOB_PARTIAL_FLUSH_SECONDS (0.5; akan GPT çıktısının analysis_jobs.partial'a yazılma aralığı)
+#   JOB_AUTOSTART (1; app import'unda worker'ları başlat. Fork'tan önce import eden süreçte 0 —
+#     gunicorn preload_app bunu gunicorn.conf.py'de ayarlar ve post_fork'ta start() çağırır)
+#
+# Akış (SSE): handler progress(job_id, text) ile kısmi çıktıyı bildirir. Aynı süreçteki
+# okuyucular watch() ile Condition üzerinden anında uyanır; başka süreçteki iş için
+# analysis_jobs.partial kolonu poll edilir.
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+
+import psycopg2
+import psycopg2.extras
+
+from db import get_conn
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id UUID PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    payload JSONB,
+    input BYTEA,
+    result JSONB,
+    error TEXT,
+    user_id UUID,
+    username TEXT,
+    attempts INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+ALTER TABLE analysis_jobs ADD COLUMN IF NOT EXISTS partial TEXT;
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_queued ON analysis_jobs(created_at) WHERE status IN ('queued', 'running');
+"""
+
+# queued işler ya da süresi aşılmış running işler (worker ölmüş)
+CLAIM_SQL = """
+UPDATE analysis_jobs SET status='running', started_at=NOW(), attempts=attempts+1
+WHERE id = (
+    SELECT id FROM analysis_jobs
+    WHERE kind = ANY(%s)
+      AND (status='queued' OR (status='running' AND started_at < NOW() - %s * INTERVAL '1 second'))
+      AND attempts < %s
+    ORDER BY created_at
+    FOR UPDATE SKIP LOCKED
+    LIMIT 1
+)
+RETURNING id, kind, payload, input, user_id, username, attempts;
+"""
+
+STATUSES = ("queued", "running", "done", "failed")
+
+
+class JobQueue:
+    """Kuyruğa yazma + kind -> handler ile çalışan worker thread'ler."""
+
+    def __init__(self, workers=2, poll_seconds=1.0, stale_seconds=600, max_attempts=2, retention_hours=24,
+                 partial_flush_seconds=0.5):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.retention_hours = retention_hours
+        self.partial_flush_seconds = partial_flush_seconds
+        self._live = {}  # job_id -> {"text", "flushed_at"}; sadece bu süreçte çalışan işler
+        self._live_cond = threading.Condition()
+        self._handlers = {}
+        self._threads = []
+        self._pid = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "done": 0, "failed": 0, "busy": 0}
+        self._last_sweep = 0.0
+
+    def _bump(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def ensure_schema(self, conn):
+        cur = conn.cursor()
+        cur.execute(SCHEMA_SQL)
+        conn.commit(); cur.close()
+
+    def register(self, kind, handler):
+        """handler(job: dict) -> result (JSON'a çevrilebilir). Hata fırlatırsa iş failed olur."""
+        self._handlers[kind] = handler
+
+    def submit(self, kind, payload=None, data=None, user_id=None, username=None):
+        jid = str(uuid.uuid4())
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT INTO analysis_jobs (id, kind, payload, input, user_id, username) VALUES (%s,%s,%s,%s,%s,%s);",
+                        (jid, kind, json.dumps(payload or {}), psycopg2.Binary(data) if data is not None else None,
+                         user_id, username))
+            conn.commit(); cur.close()
+        self._bump("submitted")
+        self.start()
+        self._wake.set()
+        return jid
+
+    def get(self, job_id):
+        with get_conn() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            cur.execute("SELECT id, kind, status, payload, result, error, user_id, username, attempts, "
+                        "created_at, started_at, finished_at FROM analysis_jobs WHERE id=%s;", (job_id,))
+            row = cur.fetchone()
+            cur.close()
+        return dict(row) if row else None
+
+    # ---- worker tarafı ----
+    def start(self):
+        """Worker thread'lerini (süreç başına, fork sonrası da) başlatır; canlı thread sayısı self.workers'tan
+        azsa (ölen thread ya da sonradan artırılan workers) eksik kadarını ekler."""
+        pid = os.getpid()
+        if not self.workers or (self._pid == pid and self._alive() >= self.workers):
+            return
+        with self._start_lock:
+            if self._pid == pid and self._alive() >= self.workers:
+                return
+            if self._pid != pid:
+                self._threads = []
+                self._wake = threading.Event()
+            self._pid = pid
+            self._stop.clear()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                t = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _alive(self):
+        return sum(t.is_alive() for t in self._threads)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _claim(self):
+        with get_conn() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            cur.execute(CLAIM_SQL, (list(self._handlers), self.stale_seconds, self.max_attempts))
+            row = cur.fetchone()
+            conn.commit(); cur.close()
+        return dict(row) if row else None
+
+    def _finish(self, job_id, result=None, error=None):
+        with get_conn() as conn:
+            cur = conn.cursor()
+            # PDF baytlarına artık gerek yok
+            cur.execute("UPDATE analysis_jobs SET status=%s, result=%s, error=%s, input=NULL, partial=NULL, "
+                        "finished_at=NOW() WHERE id=%s;",
+                        ("failed" if error else "done", json.dumps(result) if error is None else None, error, job_id))
+            conn.commit(); cur.close()
+
+    # ---- kısmi çıktı (streaming) ----
+    def progress(self, job_id, text):
+        """Handler'dan: o ana kadarki tüm çıktı. Bellekte hemen, DB'de throttle'lı güncellenir."""
+        job_id = str(job_id)
+        now = time.monotonic()
+        with self._live_cond:
+            live = self._live.setdefault(job_id, {"text": "", "flushed_at": 0.0})
+            live["text"] = text
+            flush = now - live["flushed_at"] >= self.partial_flush_seconds
+            if flush:
+                live["flushed_at"] = now
+            self._live_cond.notify_all()
+        if flush:
+            try:
+                with get_conn() as conn:
+                    cur = conn.cursor()
+                    cur.execute("UPDATE analysis_jobs SET partial=%s WHERE id=%s;", (text, job_id))
+                    conn.commit(); cur.close()
+            except Exception as e:
+                print(f"[jobs] partial {job_id}: {e}", file=sys.stderr, flush=True)
+
+    def _live_done(self, job_id):
+        with self._live_cond:
+            self._live.pop(str(job_id), None)
+            self._live_cond.notify_all()
+
+    def watch(self, job_id, seen=0, timeout=1.0):
+        """(text, finished): seen karakterden uzun çıktı gelene, iş bitene ya da timeout'a kadar bekler."""
+        job_id = str(job_id)
+        deadline = time.monotonic() + timeout
+        was_live = False
+        with self._live_cond:
+            while job_id in self._live:
+                was_live = True
+                live = self._live[job_id]
+                left = deadline - time.monotonic()
+                if len(live["text"]) > seen or left <= 0:
+                    return live["text"], False
+                self._live_cond.wait(left)
+        # iş bitti, başka süreçte ya da henüz başlamadı: DB'den
+        if not was_live:
+            time.sleep(max(0.0, min(self.partial_flush_seconds, deadline - time.monotonic())))
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT status, partial FROM analysis_jobs WHERE id=%s;", (job_id,))
+            row = cur.fetchone()
+            cur.close()
+        if not row:
+            return "", True
+        return row[1] or "", row[0] in ("done", "failed")
+
+    def _sweep(self):
+        """Deneme hakkı bitmiş takılı işleri failed yapar, eski işleri siler."""
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("UPDATE analysis_jobs SET status='failed', error='worker lost', input=NULL, finished_at=NOW() "
+                        "WHERE status='running' AND started_at < NOW() - %s * INTERVAL '1 second' AND attempts >= %s;",
+                        (self.stale_seconds, self.max_attempts))
+            cur.execute("DELETE FROM analysis_jobs WHERE status IN ('done','failed') "
+                        "AND finished_at < NOW() - %s * INTERVAL '1 hour';", (self.retention_hours,))
+            conn.commit(); cur.close()
+
+    def run_one(self):
+        """Bir iş alıp çalıştırır; iş yoksa False."""
+        job = self._claim()
+        if not job:
+            return False
+        self._bump("busy")
+        try:
+            if job.get("input") is not None:
+                job["input"] = bytes(job["input"])
+            result = self._handlers[job["kind"]](job)
+            self._finish(job["id"], result=result)
+            self._bump("done")
+        except Exception as e:
+            print(f"[jobs] {job['kind']} {job['id']} başarısız: {e}", file=sys.stderr, flush=True)
+            try:
+                self._finish(job["id"], error=str(e)[:1000] or e.__class__.__name__)
+            except Exception as e2:
+                print(f"[jobs] {job['id']} durumu yazılamadı: {e2}", file=sys.stderr, flush=True)
+            self._bump("failed")
+        finally:
+            self._live_done(job["id"])
+            self._bump("busy", -1)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._sweep()
+                if self.run_one():
+                    continue
+            except Exception as e:
+                print(f"[jobs] worker: {e}", file=sys.stderr, flush=True)
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["workers"] = self._alive() if self._pid == os.getpid() else 0
+        try:
+            with get_conn() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT status, COUNT(1) FROM analysis_jobs GROUP BY status;")
+                s["table"] = {k: 0 for k in STATUSES}
+                s["table"].update(dict(cur.fetchall()))
+                cur.close()
+        except Exception as e:
+            s["table"] = f"error: {e}"
+        return s
+
+
+_QUEUE = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    poll_seconds=float(os.getenv("JOB_POLL_SECONDS", "1.0")),
+    stale_seconds=float(os.getenv("JOB_STALE_SECONDS", "600")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "2")),
+    retention_hours=float(os.getenv("JOB_RETENTION_HOURS", "24")),
+    partial_flush_seconds=float(os.getenv("JOB_PARTIAL_FLUSH_SECONDS", "0.5")),
+)
+
+
+def get_queue():
+    return _QUEUE
@@ -0,0 +1,126 @@
+# lexical.py
+# Sözcüksel (full-text) aday arama: sreports.report_tsv (report_text'ten üretilen tsvector, GIN index) ve
+# vektör adaylarıyla reciprocal rank fusion (RRF). Vektör araması jargonu ve birebir kodları (tescil
+# işareti C-GABC, meydan kodu CYOW, parça / tip numarası PW127) iyi yakalamaz; bunlar GIN index'ten
+# tam tarama olmadan gelir. app.find_similar iki listeyi tek sıralamada birleştirir; "why similar"
+# eşleşen terimleri gösterir.
+#
+# Sorgu terimleri: metindeki birebir kodlar (ağırlık EXACT_WEIGHT) + anahtar kelimeler (report_fields.top_keywords).
+# Sıralama: terim ağırlıklı ts_rank toplamı, belge uzunluğuyla normalize (BM25 benzeri; Postgres'te IDF yok,
+# nadir kodların ağırlığı bunu kısmen karşılar).
+#
+# Kolon: report_tsv tsvector (GENERATED, STORED) — INSERT'ler değişmez; ilk ALTER tabloyu bir kez yeniden yazar.
+
+import re
+
+from report_fields import top_keywords
+
+TS_CONFIG = "english"
+TSV_MAX_CHARS = 200000     # tsvector 1 MB sınırı; çok uzun PDF metinlerinde baş kısım yeterli
+RANK_NORMALIZATION = 1     # ts_rank: skor / (1 + log(belge uzunluğu))
+EXACT_WEIGHT = 3.0
+MAX_EXACT, MAX_KEYWORDS = 8, 8
+
+COLUMNS_SQL = f"""
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS report_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', left(coalesce(report_text, ''), {TSV_MAX_CHARS}))) STORED;
+CREATE INDEX IF NOT EXISTS idx_sreports_report_tsv ON sreports USING GIN (report_tsv);
+"""
+
+# birebir aranacak kodlar (büyük harfli metinde)
+_EXACT_RES = (
+    re.compile(r"\b[A-Z]{1,2}-[A-Z0-9]{3,5}\b"),                                  # tescil: C-GABC, N-123AB
+    re.compile(r"\bC[YZ][A-Z]{2}\b"),                                             # ICAO meydan: CYOW, CZBB
+    re.compile(r"\b(?=[A-Z0-9-]*\d)(?=[A-Z0-9-]*[A-Z])[A-Z0-9]+(?:-[A-Z0-9]+)*\b"),  # tip / parça: PW127, B737-800
+    re.compile(r"\b\d{3,}(?:-[A-Z0-9]+)+\b"),                                     # parça no: 3214552-1
+)
+# kod gibi görünen ama ayırt edici olmayanlar: tarih, CADORS numarası, saat
+_NOT_EXACT_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}|\d{4}[A-Z]\d{4}|\d{3,4}Z)$")
+# ingest_cadors.build_report_text etiketleri: her CADORS satırında var, sorgu terimi olarak işe yaramaz
+# "why similar"da gösterilebilecek terim biçimi (kodlar / anahtar kelimeler); serbest sorgu metni gösterilmez
+_TERM_RE = re.compile(r"^[a-z0-9][a-z0-9-]*$")
+_BOILERPLATE = set("cadors aerodrome location province region aircraft phase events categories narrative unknown".split())
+
+
+def ensure_columns(conn):
+    cur = conn.cursor()
+    cur.execute(COLUMNS_SQL)
+    conn.commit(); cur.close()
+
+
+def exact_terms(text, k=MAX_EXACT):
+    """Metindeki kodlar (küçük harf), sıklığa göre; her biri en az 4 karakter."""
+    freq = {}
+    for rx in _EXACT_RES:
+        for tok in rx.findall(text or ""):
+            if len(tok) >= 4 and not _NOT_EXACT_RE.match(tok):
+                freq[tok.lower()] = freq.get(tok.lower(), 0) + 1
+    return [t for t, _ in sorted(freq.items(), key=lambda x: -x[1])[:k]]
+
+
+def is_exact_query(q):
+    """Serbest aramada tüm kelimeler kod ise (C-GABC, cyow, pw127) embedding / vektör taraması gerekmez."""
+    words = (q or "").upper().split()
+    return bool(words) and all(exact_terms(w) == [w.lower()] for w in words)
+
+
+def query_terms(text, keywords=None):
+    """Belge sorgusu -> [(terim, ağırlık)]; keywords verilmezse metinden çıkarılır."""
+    exact = exact_terms(text)
+    parts = {p for t in exact for p in t.split("-")}
+    words = [w for w in (keywords if keywords is not None else top_keywords(text))
+             if w not in _BOILERPLATE and w not in parts and w not in exact]
+    return [(t, EXACT_WEIGHT) for t in exact] + [(w, 1.0) for w in words[:MAX_KEYWORDS]]
+
+
+def search_terms(q):
+    """Serbest arama -> [(terim, ağırlık)]: tüm ifade (AND) + içindeki kodlar ayrı ayrı."""
+    q = " ".join((q or "").split())
+    if not q:
+        return []
+    exact = [t for t in exact_terms(q.upper()) if t != q.lower()]
+    return [(q.lower(), EXACT_WEIGHT if is_exact_query(q) else 1.0)] + [(t, EXACT_WEIGHT) for t in exact]
+
+
+def top_k(cur, terms, where=(), params=(), k=30, qvec=None):
+    """terms: [(terim, ağırlık)] -> [(id, rank, eşleşen terimler, sim|None)], rank'e göre azalan.
+    Eşleşen terimler SQL'de sıra no olarak döner ve matched_terms ile süzülür (ham sorgu metni geri gelmez).
+    where/params: "s." önekli ek koşullar (scope, meta filtreleri). qvec (pgvector literal) verilirse
+    adayların kosinüsü de aynı sorguda hesaplanır (s.embedding_vec)."""
+    terms = [(t, float(w)) for t, w in terms if t and t.strip()]
+    if not terms:
+        return []
+    tsq = f"plainto_tsquery('{TS_CONFIG}', %s)"
+    rank = " + ".join([f"%s::float8 * ts_rank(s.report_tsv, {tsq}, {RANK_NORMALIZATION})"] * len(terms))
+    matched = ", ".join(f"CASE WHEN s.report_tsv @@ {tsq} THEN {i} END" for i in range(len(terms)))
+    sim = "1 - (s.embedding_vec <=> %s::vector)" if qvec else "NULL::float"
+    cond = "".join(f" AND {w}" for w in where)
+    cur.execute(f"""
+        SELECT s.id::text, {rank} AS rank, array_remove(ARRAY[{matched}]::int[], NULL) AS matched, {sim} AS sim
+        FROM sreports s
+        WHERE s.report_tsv @@ ({" || ".join([tsq] * len(terms))}){cond}
+        ORDER BY rank DESC
+        LIMIT %s;
+    """, [x for t, w in terms for x in (w, t)] + [t for t, _ in terms] + ([qvec] if qvec else [])
+        + [t for t, _ in terms] + list(params) + [k])
+    return [(rid, float(rank), matched_terms(terms, matched or []), None if s is None else float(s))
+            for rid, rank, matched, s in cur.fetchall()]
+
+
+def matched_terms(terms, idx):
+    """top_k'nın sıra no'ları -> gösterilebilir terimler (sadece kod / kelime biçimindekiler; ham sorgu metni değil)."""
+    out = []
+    for i in idx:
+        if 0 <= i < len(terms) and _TERM_RE.match(terms[i][0]) and terms[i][0] not in out:
+            out.append(terms[i][0])
+    return out
+
+
+def rrf(ranked_lists, k=60, weights=None):
+    """Reciprocal rank fusion: skor(d) = Σ w / (k + sıra), sıra 1'den. -> [(id, skor)] azalan."""
+    weights = weights or [1.0] * len(ranked_lists)
+    scores = {}
+    for ids, w in zip(ranked_lists, weights):
+        for rank, rid in enumerate(ids, start=1):
+            scores[rid] = scores.get(rid, 0.0) + w / (k + rank)
+    return sorted(scores.items(), key=lambda x: -x[1])
@@ -0,0 +1,159 @@
+# passages.py
+# Rapor parçaları (passage) ve parça embedding'leri: sreport_passages tablosu.
+# Belge tek vektörle temsil edildiğinde 50 sayfalık rapor ile 3 satırlık CADORS anlatısı
+# kaba karşılaştırılır; parça düzeyinde arama eşleşen bölümü bulur ve "why similar"
+# metninde gösterilir. Belge skoru, parça benzerliklerinden (max ya da ortalama) türetilir.
+#
+# Env:
+#   PASSAGE_TOKENS (300), PASSAGE_OVERLAP (40)
+#   PASSAGE_SCORING: max (varsayılan) | mean (belgenin bulunan parçalarının ortalaması)
+
+import os
+import re
+import uuid
+from collections import defaultdict
+
+import psycopg2.extras
+from markupsafe import escape
+
+from chunking import split_chunks
+from db import get_conn
+from embeddings import DEFAULT_MODEL, embed_batch
+import quantize
+
+PASSAGE_TOKENS = int(os.getenv("PASSAGE_TOKENS", "300"))
+PASSAGE_OVERLAP = int(os.getenv("PASSAGE_OVERLAP", "40"))
+PASSAGE_SCORING = os.getenv("PASSAGE_SCORING", "max").lower()
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS sreport_passages (
+    report_id UUID NOT NULL REFERENCES sreports(id) ON DELETE CASCADE,
+    ord INT NOT NULL,
+    text TEXT NOT NULL,
+    embedding JSONB,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (report_id, ord)
+);
+CREATE INDEX IF NOT EXISTS idx_passages_created ON sreport_passages(created_at);
+-- sıkıştırılmış kopya (quantize.py); index yüklemesi bunu okur
+ALTER TABLE sreport_passages ADD COLUMN IF NOT EXISTS embedding_q BYTEA;
+"""
+
+
+def ensure_schema(conn):
+    cur = conn.cursor()
+    cur.execute(SCHEMA_SQL)
+    conn.commit(); cur.close()
+
+
+def passage_id(report_id, ord_):
+    """Index'teki id: '<report_id>:<ord>' (belge id'si ayrıştırılabilir)."""
+    return f"{report_id}:{ord_}"
+
+
+def report_of(pid):
+    return str(pid).split(":", 1)[0]
+
+
+def make_passages(text):
+    return [p for p in split_chunks(text or "", PASSAGE_TOKENS, PASSAGE_OVERLAP) if p.strip()]
+
+
+def embed_passages(docs, model=DEFAULT_MODEL, limiter=None):
+    """docs: [(report_id, text)] -> [(report_id, ord, passage, emb)]; tüm parçalar tek embed_batch'te."""
+    items = [(rid, i, p) for rid, text in docs for i, p in enumerate(make_passages(text))]
+    if not items:
+        return []
+    embs = embed_batch([p for _, _, p in items], model=model, limiter=limiter)
+    return [(rid, i, p, emb) for (rid, i, p), emb in zip(items, embs)]
+
+
+def write_passages(conn, rows):
+    """rows: embed_passages çıktısı. Aynı (report_id, ord) varsa güncellenir. Commit çağırana ait."""
+    if not rows:
+        return 0
+    cur = conn.cursor()
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO sreport_passages (report_id, ord, text, embedding, embedding_q) VALUES %s
+        ON CONFLICT (report_id, ord) DO UPDATE SET text=EXCLUDED.text, embedding=EXCLUDED.embedding,
+            embedding_q=EXCLUDED.embedding_q
+    """, [(str(rid), i, p, psycopg2.extras.Json(emb) if emb is not None else None,
+           psycopg2.Binary(quantize.encode(emb)) if emb is not None else None) for rid, i, p, emb in rows],
+        page_size=500)
+    cur.close()
+    return len(rows)
+
+
+def store_passages(report_id, text):
+    """Tek rapor: parçala, embed et, yaz. [(passage_id, emb)] döner (index'e eklemek için)."""
+    rows = embed_passages([(report_id, text)])
+    with get_conn() as conn:
+        write_passages(conn, rows)
+        conn.commit()
+    return [(passage_id(rid, i), emb) for rid, i, _, emb in rows if emb is not None]
+
+
+def iter_passage_rows(since=None):
+    """Index yüklemesi için: id, method ve meta (rapordan), embedding, created_at, embedded_at — server-side cursor.
+    since: embedded_at alt sınırı (watermark.py)."""
+    with get_conn() as conn:
+        cur = conn.cursor(name=f"psg_{uuid.uuid4().hex}", cursor_factory=psycopg2.extras.DictCursor)
+        cur.itersize = 5000
+        sql = """
+            SELECT p.report_id::text || ':' || p.ord AS id, s.method, p.embedding_q,
+                   CASE WHEN p.embedding_q IS NULL THEN p.embedding END AS embedding, p.created_at,
+                   p.embedded_at, s.occurred_on, s.aerodrome, s.province, s.aircraft, s.phase
+            FROM sreport_passages p JOIN sreports s ON s.id = p.report_id
+            WHERE p.embedding IS NOT NULL {}
+            ORDER BY p.embedded_at;
+        """
+        if since is None:
+            cur.execute(sql.format(""))
+        else:
+            cur.execute(sql.format("AND p.embedded_at > %s"), (since,))
+        try:
+            for r in cur:
+                yield r
+        finally:
+            cur.close()
+
+
+def fetch_texts(pids):
+    """{passage_id: text}"""
+    keys = [(report_of(pid), int(str(pid).rsplit(":", 1)[1])) for pid in pids]
+    if not keys:
+        return {}
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT p.report_id::text, p.ord, p.text FROM sreport_passages p
+            JOIN unnest(%s::uuid[], %s::int[]) AS k(report_id, ord) USING (report_id, ord);
+        """, ([k[0] for k in keys], [k[1] for k in keys]))
+        out = {passage_id(rid, o): t for rid, o, t in cur.fetchall()}
+        cur.close()
+    return out
+
+
+def score_documents(hits, scoring=None):
+    """[(passage_id, sim)] -> {report_id: (score, best_passage_id, best_sim)}"""
+    scoring = scoring or PASSAGE_SCORING
+    by_doc = defaultdict(list)
+    for pid, sim in hits:
+        by_doc[report_of(pid)].append((sim, pid))
+    out = {}
+    for rid, lst in by_doc.items():
+        lst.sort(reverse=True)
+        best_sim, best_pid = lst[0]
+        score = sum(s for s, _ in lst) / len(lst) if scoring == "mean" else best_sim
+        out[rid] = (score, best_pid, best_sim)
+    return out
+
+
+def highlight(passage, terms, max_chars=600):
+    """HTML: passage (kırpılmış) içinde ortak terimler <mark> ile."""
+    text = passage if len(passage) <= max_chars else passage[:max_chars].rsplit(" ", 1)[0] + "…"
+    html = str(escape(text))
+    if terms:
+        pat = re.compile(r"\b(" + "|".join(re.escape(t) for t in terms) + r")\b", re.I)
+        html = pat.sub(r"<mark class='bg-amber-300/40 text-amber-100 rounded px-0.5'>\1</mark>", html)
+    return html
@@ -0,0 +1,263 @@
+# pdf_store.py
+# Üretilmiş PDF'ler için artifact store (eski sınırsız _PDF_STORE dict'inin yerine).
+# Anahtar: "<report_id>.<variant>.<içerik hash'i>" — aynı içerik aynı anahtarı verir, böylece
+# tekrar indirmeler reportlab'e gitmez; içerik değişirse (yeni benzer liste, güncellenmiş rapor)
+# anahtar da değişir. Anahtar URL'de kullanılabilir (/download/memory/<key>), tüm worker'larda çözülür.
+#
+# Katmanlar: süreç içi LRU (toplam bayt sınırlı) -> kalıcı backend:
+#   disk: PDF_STORE_DIR altında <key>.pdf (aynı makinedeki worker'lar paylaşır, restart'ta kalır)
+#   db:   Postgres pdf_artifacts tablosu (BYTEA; birden çok makine)
+#   shared: sharedcache.py backend'i (CACHE_BACKEND=sqlite/postgres), "pdf" namespace'i
+#   memory: sadece LRU
+#
+# Env:
+#   PDF_STORE_BACKEND (disk), PDF_STORE_DIR (data/pdf_store), PDF_STORE_TTL (86400 s)
+#   PDF_STORE_MEM_BYTES (64 MB; LRU üst sınırı)
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from db import get_conn
+from sharedcache import get_backend as get_shared_cache
+
+# variant -> (indirme adı, benzer vaka izni gerekir mi)
+VARIANTS = {
+    "report": ("report.pdf", False),
+    "full": ("report_with_similar.pdf", True),
+    "updated": ("updated_report.pdf", False),
+    "updated_full": ("updated_report_with_similar.pdf", True),
+}
+
+_KEY_RE = re.compile(r"^[0-9A-Za-z-]{1,64}\.[a-z_]+\.[0-9a-f]{16,64}$")
+_SWEEP_EVERY = 200  # bu kadar put'ta bir süresi geçenler silinir
+
+
+def content_hash(*parts) -> str:
+    """Render girdilerinin hash'i (str/bytes ya da JSON'a çevrilebilir değerler)."""
+    h = hashlib.sha256()
+    for p in parts:
+        if not isinstance(p, (str, bytes)):
+            p = json.dumps(p, sort_keys=True, default=str)
+        h.update(p.encode("utf-8") if isinstance(p, str) else p)
+        h.update(b"\x00")
+    return h.hexdigest()[:32]
+
+
+def make_key(report_id, variant, digest) -> str:
+    rid = str(report_id or "")
+    if not re.fullmatch(r"[0-9A-Za-z-]{1,64}", rid):
+        rid = "adhoc"
+    return f"{rid}.{variant}.{digest}"
+
+
+def parse_key(key):
+    """-> (report_id, variant) ya da geçersizse None."""
+    if not key or not _KEY_RE.match(key):
+        return None
+    rid, variant, _ = key.split(".")
+    if variant not in VARIANTS:
+        return None
+    return rid, variant
+
+
+class PdfStore:
+    def __init__(self, backend="disk", directory=None, ttl=86400, mem_bytes=64 * 1024 * 1024):
+        self.backend = backend
+        self.directory = directory
+        self.ttl = ttl
+        self.mem_bytes = mem_bytes
+        self._mem = OrderedDict()   # key -> (bytes, expires_at)
+        self._mem_size = 0
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._table_ready = False
+        self._stats = {"mem_hits": 0, "store_hits": 0, "misses": 0, "renders": 0, "errors": 0}
+
+    # ---------- bellek katmanı ----------
+    def _remember(self, key, data, expires_at):
+        if len(data) > self.mem_bytes:
+            return
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._mem_size -= len(old[0])
+            self._mem[key] = (data, expires_at)
+            self._mem_size += len(data)
+            while self._mem_size > self.mem_bytes:
+                _, (d, _) = self._mem.popitem(last=False)
+                self._mem_size -= len(d)
+
+    def _mem_get(self, key):
+        with self._lock:
+            ent = self._mem.get(key)
+            if ent is None:
+                return None
+            if ent[1] < time.time():
+                del self._mem[key]
+                self._mem_size -= len(ent[0])
+                return None
+            self._mem.move_to_end(key)
+            return ent[0]
+
+    # ---------- kalıcı katman ----------
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pdf")
+
+    def _ensure_table(self, cur):
+        if self._table_ready:
+            return
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS pdf_artifacts (
+            key TEXT PRIMARY KEY,
+            data BYTEA NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_pdf_artifacts_created ON pdf_artifacts(created_at);
+        """)
+        self._table_ready = True
+
+    def _load(self, key):
+        """-> (bytes, expires_at) ya da None."""
+        if self.backend == "disk":
+            path = self._path(key)
+            try:
+                expires_at = os.path.getmtime(path) + self.ttl
+                if expires_at < time.time():
+                    os.unlink(path)
+                    return None
+                with open(path, "rb") as f:
+                    return f.read(), expires_at
+            except FileNotFoundError:
+                return None
+        if self.backend == "db":
+            with get_conn() as conn:
+                cur = conn.cursor()
+                self._ensure_table(cur)
+                cur.execute("SELECT data, EXTRACT(EPOCH FROM NOW() - created_at)::float8 FROM pdf_artifacts "
+                            "WHERE key=%s AND created_at > NOW() - make_interval(secs => %s);", (key, self.ttl))
+                row = cur.fetchone()
+                conn.commit(); cur.close()
+            return (bytes(row[0]), time.time() - row[1] + self.ttl) if row else None
+        if self.backend == "shared":
+            data = get_shared_cache().get("pdf", key)
+            # kalan ömür bilinmiyor; bellek katmanı en fazla TTL kadar tutar
+            return (bytes(data), time.time() + self.ttl) if data is not None else None
+        return None
+
+    def _save(self, key, data):
+        if self.backend == "disk":
+            os.makedirs(self.directory, exist_ok=True)
+            # yarım dosya okunmasın: temp + rename
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        elif self.backend == "db":
+            with get_conn() as conn:
+                cur = conn.cursor()
+                self._ensure_table(cur)
+                cur.execute("INSERT INTO pdf_artifacts (key, data) VALUES (%s, %s) "
+                            "ON CONFLICT (key) DO UPDATE SET data=EXCLUDED.data, created_at=NOW();",
+                            (key, data))
+                conn.commit(); cur.close()
+        elif self.backend == "shared":
+            get_shared_cache().set("pdf", key, data, self.ttl)
+
+    def _sweep(self):
+        """Süresi geçen kalıcı kayıtları siler."""
+        if self.backend == "disk":
+            cutoff = time.time() - self.ttl
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                return
+            for name in names:
+                path = os.path.join(self.directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                except OSError:
+                    pass
+        elif self.backend == "db":
+            with get_conn() as conn:
+                cur = conn.cursor()
+                self._ensure_table(cur)
+                cur.execute("DELETE FROM pdf_artifacts WHERE created_at < NOW() - make_interval(secs => %s);",
+                            (self.ttl,))
+                conn.commit(); cur.close()
+
+    def _error(self, what, e):
+        with self._lock:
+            self._stats["errors"] += 1
+        print(f"[pdf_store] {what}: {e}", file=sys.stderr, flush=True)
+
+    # ---------- API ----------
+    def get(self, key):
+        data = self._mem_get(key)
+        if data is not None:
+            with self._lock:
+                self._stats["mem_hits"] += 1
+            return data
+        try:
+            hit = self._load(key)
+        except Exception as e:
+            self._error("okuma", e)
+            hit = None
+        with self._lock:
+            self._stats["store_hits" if hit else "misses"] += 1
+        if hit is None:
+            return None
+        self._remember(key, *hit)
+        return hit[0]
+
+    def put(self, key, data):
+        self._remember(key, data, time.time() + self.ttl)
+        try:
+            self._save(key, data)
+            with self._lock:
+                self._puts += 1
+                sweep = self._puts % _SWEEP_EVERY == 0
+            if sweep:
+                self._sweep()
+        except Exception as e:
+            self._error("yazma", e)
+
+    def get_or_render(self, key, render):
+        """render(): bytes ya da BytesIO; sadece store'da yoksa çağrılır."""
+        data = self.get(key)
+        if data is not None:
+            return data
+        out = render()
+        data = out.getvalue() if hasattr(out, "getvalue") else bytes(out)
+        with self._lock:
+            self._stats["renders"] += 1
+        self.put(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, backend=self.backend, mem_items=len(self._mem),
+                        mem_bytes=self._mem_size, mem_limit=self.mem_bytes, ttl=self.ttl)
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store():
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            root = os.path.dirname(os.path.abspath(__file__))
+            _STORE = PdfStore(backend=os.getenv("PDF_STORE_BACKEND", "disk").lower(),
+                              directory=os.getenv("PDF_STORE_DIR", os.path.join(root, "data", "pdf_store")),
+                              ttl=float(os.getenv("PDF_STORE_TTL", "86400")),
+                              mem_bytes=int(os.getenv("PDF_STORE_MEM_BYTES", str(64 * 1024 * 1024))))
+        return _STORE
@@ -0,0 +1,170 @@
+# pdfrender.py
+# Rapor PDF'leri (reportlab). app.py'deki eski generate_pdf_* ile aynı görünüm; farklar:
+#   - stiller süreç başına bir kez kurulur (getSampleStyleSheet her çağrıda çalışmaz)
+#   - ardışık boş satırlar tek boşluğa iner; uzun metin bloklar halinde Paragraph'lara
+#     bölünür (sayfalara yayılan tek dev Paragraph'ın tekrar tekrar bölünmesi pahalı)
+#   - compact modu: benzer vaka başına içerik PDF_CASE_MAX_CHARS ile sınırlı
+# Ölçüm: scripts/bench_pdf.py
+#
+# Env:
+#   PDF_COMPACT (0; 1 ise download_full varsayılanı compact), PDF_CASE_MAX_CHARS (1500)
+
+import io
+import os
+import re
+import threading
+
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem, HRFlowable
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib import colors
+
+PDF_COMPACT = os.getenv("PDF_COMPACT", "0") == "1"
+PDF_CASE_MAX_CHARS = int(os.getenv("PDF_CASE_MAX_CHARS", "1500"))
+
+_BULLET_RE = re.compile(r"^\s*[-•]\s+")
+_NUMBERED_RE = re.compile(r"^\s*\d+\.\s+")
+_BLOCK_RE = re.compile(r"\n\s*\n")
+
+_STYLES = None
+_STYLES_LOCK = threading.Lock()
+
+
+def _header_footer(canvas, doc):
+    canvas.saveState()
+    canvas.setFont("Helvetica-Bold", 10)
+    canvas.setFillColor(colors.HexColor("#06b6d4"))
+    canvas.drawString(doc.leftMargin, doc.height + doc.topMargin - 10, "✈ AI Safety Report Analyzer")
+    canvas.setFont("Helvetica", 9)
+    canvas.setFillColor(colors.grey)
+    canvas.drawRightString(doc.leftMargin + doc.width, 12, f"Page {doc.page}")
+    canvas.restoreState()
+
+
+def styles():
+    """(title, h2, body) — süreç başına bir kez."""
+    global _STYLES
+    if _STYLES is None:
+        with _STYLES_LOCK:
+            if _STYLES is None:
+                base = getSampleStyleSheet()
+                title_style = ParagraphStyle("Title2", parent=base["Heading1"], alignment=TA_CENTER,
+                                             fontName="Helvetica-Bold", fontSize=18,
+                                             textColor=colors.HexColor("#22d3ee"), spaceAfter=10)
+                h2 = ParagraphStyle("H2", parent=base["Heading2"], fontName="Helvetica-Bold",
+                                    fontSize=14, textColor=colors.HexColor("#38bdf8"),
+                                    spaceBefore=10, spaceAfter=6)
+                body = ParagraphStyle("Body", parent=base["BodyText"], fontName="Helvetica",
+                                      fontSize=10.5, leading=14.5, spaceAfter=6)
+                _STYLES = (title_style, h2, body)
+    return _STYLES
+
+
+def _rule(thickness, space_after):
+    # build flowable'a yazar (canv, _frame, genişlik): paylaşılmaz, belge başına yeni nesne
+    return HRFlowable(width="100%", thickness=thickness, color=colors.HexColor("#0ea5e9"), spaceAfter=space_after)
+
+
+def _build(elements, title):
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4,
+                            leftMargin=18*mm, rightMargin=18*mm,
+                            topMargin=20*mm, bottomMargin=16*mm, title=title)
+    doc.build(elements, onFirstPage=_header_footer, onLaterPages=_header_footer)
+    buf.seek(0)
+    return buf
+
+
+def _head(title):
+    title_style, _, _ = styles()
+    return [Paragraph(title, title_style), _rule(0.6, 8)]
+
+
+def render_markdown(elements, markdown_text, h2, body):
+    """### başlık, - / 1. listeler ve paragraflar; ardışık satırlar tek Paragraph olur."""
+    lines = [ln.rstrip() for ln in (markdown_text or "").splitlines()]
+    i, para_buf = 0, []
+
+    def flush_p():
+        nonlocal para_buf
+        if para_buf:
+            elements.append(Paragraph(" ".join(para_buf).strip(), body))
+            para_buf = []
+
+    def space():
+        if not elements or not isinstance(elements[-1], Spacer):
+            elements.append(Spacer(1, 4))
+
+    while i < len(lines):
+        ln = lines[i]
+        if not ln.strip():
+            flush_p(); space(); i += 1; continue
+        if ln.startswith("### "):
+            flush_p(); elements.append(Spacer(1, 2))
+            elements.append(_rule(0.4, 4))
+            elements.append(Paragraph(ln[4:].strip(), h2)); i += 1; continue
+        if _BULLET_RE.match(ln):
+            flush_p(); items = []
+            while i < len(lines) and _BULLET_RE.match(lines[i]):
+                txt = _BULLET_RE.sub("", lines[i]).strip()
+                items.append(ListItem(Paragraph(txt, body), leftIndent=6)); i += 1
+            elements.append(ListFlowable(items, bulletType="bullet", leftPadding=12)); space(); continue
+        if _NUMBERED_RE.match(ln):
+            flush_p(); items = []
+            while i < len(lines) and _NUMBERED_RE.match(lines[i]):
+                txt = _NUMBERED_RE.sub("", lines[i]).strip()
+                items.append(ListItem(Paragraph(txt, body), leftIndent=6)); i += 1
+            elements.append(ListFlowable(items, bulletType="1", leftPadding=12)); space(); continue
+        para_buf.append(ln); i += 1
+    flush_p()
+
+
+def _text_blocks(elements, text, style):
+    """Satır sonları korunur (<br/>); boş satırlarda ayrı Paragraph."""
+    for block in _BLOCK_RE.split(text or ""):
+        if block.strip():
+            elements.append(Paragraph(block.strip().replace("\n", "<br/>"), style))
+
+
+def _clip(text, limit):
+    text = text or ""
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " …"
+
+
+def generate_pdf_report(markdown_text: str, title="Safety Report"):
+    _, h2, body = styles()
+    elements = _head(title)
+    render_markdown(elements, markdown_text or "", h2, body)
+    return _build(elements, title)
+
+
+def generate_pdf_full(current_markdown, similar_list, title="Safety Report (with similar)", compact=None):
+    """compact: benzer vaka başına özet + kırpılmış tam rapor (PDF_CASE_MAX_CHARS)."""
+    compact = PDF_COMPACT if compact is None else compact
+    _, h2, body = styles()
+    els = _head(title)
+
+    els.append(Paragraph("Current Report", h2))
+    _text_blocks(els, current_markdown, body)
+    els.append(Spacer(1, 10))
+
+    if similar_list:
+        els.append(Paragraph("Similar Cases", h2))
+        for i, c in enumerate(similar_list, 1):
+            els.append(Paragraph(f"Case {i} — Similarity: {c['sim']:.2f}", body))
+            els.append(Paragraph(f"Why similar: {c['why']}", body))
+            els.append(Paragraph("Snippet:", body))
+            snippet = _clip(c["snippet"], PDF_CASE_MAX_CHARS // 2) if compact else c["snippet"]
+            els.append(Paragraph(snippet.replace("\n", "<br/>"), body))
+            els.append(Spacer(1, 6))
+            full = c.get("full_markdown")
+            if full:
+                els.append(Paragraph("<b>Full Case Report</b>" + (" (excerpt)" if compact and len(full) > PDF_CASE_MAX_CHARS else ""), body))
+                _text_blocks(els, _clip(full, PDF_CASE_MAX_CHARS) if compact else full, body)
+                els.append(Spacer(1, 10))
+
+    return _build(els, title)
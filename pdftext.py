@@ -0,0 +1,147 @@
+# pdftext.py
+# PDF -> metin. Sayfalar listede toplanıp tek join ile birleştirilir (text += ... yok).
+# Büyük belgelerde sayfa aralıkları bir process pool'a dağıtılır; her süreç dosyayı
+# kendisi açar, böylece PDF baytları süreçlere kopyalanmaz.
+# Kaynak bir dosya yolu ya da diskte adı olan bir dosya nesnesiyse (ör. yüklemenin spool
+# edildiği temp dosya) belge diskten açılır, bellekte tam kopya tutulmaz.
+#
+# Env:
+#   PDF_MAX_BYTES (25 MB; üstü PdfTooLarge), PDF_MAX_PAGES (500; sonrası okunmaz)
+#   PDF_PARALLEL_PAGES (64; bu sayfa sayısından itibaren process pool), PDF_WORKERS (min(4, cpu))
+#   PDF_PAGES_PER_TASK (32)
+
+import os
+import sys
+import atexit
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(25 * 1024 * 1024)))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+PDF_PARALLEL_PAGES = int(os.getenv("PDF_PARALLEL_PAGES", "64"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+
+
+class PdfTooLarge(ValueError):
+    pass
+
+
+_POOL = None
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool():
+    """Süreç başına tek pool. spawn: çok thread'li (gthread) süreçten fork güvenli değil.
+    spawn ana modülü çocukta __mp_main__ olarak yeniden import eder; ana modülün import anındaki
+    yan etkileri bunu kontrol etmeli (app.py: _POOL_CHILD)."""
+    global _POOL, _POOL_PID
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_PID != os.getpid():
+            _POOL = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            _POOL_PID = os.getpid()
+            atexit.register(_POOL.shutdown, wait=False, cancel_futures=True)
+        return _POOL
+
+
+def _reset_pool():
+    global _POOL
+    with _POOL_LOCK:
+        _POOL = None
+
+
+def _extract_range(path, start, stop):
+    """Pool işçisi: [start, stop) sayfalarının metni."""
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def _disk_path(src):
+    """Kaynak diskte bir dosyaysa yolu; değilse None."""
+    if isinstance(src, (str, os.PathLike)):
+        return os.fspath(src)
+    name = getattr(src, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+
+def size_of(src):
+    """Baytları okumadan boyut (yükleme limitini erken kontrol için)."""
+    if hasattr(src, "stream"):
+        src = src.stream
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return len(src)
+    path = _disk_path(src)
+    if path is not None:
+        return os.path.getsize(path)
+    pos = src.tell()
+    src.seek(0, os.SEEK_END)
+    size = src.tell()
+    src.seek(pos)
+    return size
+
+
+def _parallel_pages(path, n):
+    step = max(1, min(PDF_PAGES_PER_TASK, -(-n // PDF_WORKERS)))
+    ranges = [(i, min(i + step, n)) for i in range(0, n, step)]
+    pool = _get_pool()
+    futures = [pool.submit(_extract_range, path, a, b) for a, b in ranges]
+    texts = []
+    for f in futures:
+        texts.extend(f.result())
+    return texts
+
+
+def extract_text(src, max_pages=None, max_bytes=None, parallel_pages=None):
+    """src: bytes, dosya yolu ya da dosya nesnesi (Flask FileStorage dahil)."""
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    max_bytes = PDF_MAX_BYTES if max_bytes is None else max_bytes
+    parallel_pages = PDF_PARALLEL_PAGES if parallel_pages is None else parallel_pages
+    if hasattr(src, "stream"):  # werkzeug FileStorage
+        src = src.stream
+
+    size = size_of(src)
+    if max_bytes and size > max_bytes:
+        raise PdfTooLarge(f"PDF is {size / 1e6:.1f} MB; limit is {max_bytes / 1e6:.1f} MB")
+
+    path = _disk_path(src)
+    data = None
+    if path is None:
+        data = bytes(src) if isinstance(src, (bytes, bytearray, memoryview)) else src.read()
+
+    doc = fitz.open(path) if path else fitz.open(stream=data, filetype="pdf")
+    tmp = None
+    try:
+        n = doc.page_count
+        if max_pages and n > max_pages:
+            print(f"[pdftext] {n} sayfa, ilk {max_pages} sayfa okunuyor.", file=sys.stderr, flush=True)
+            n = max_pages
+        if n < parallel_pages or PDF_WORKERS <= 1:
+            return "".join(doc[i].get_text() for i in range(n)).strip()
+
+        if path is None:
+            # süreçler aynı dosyayı açsın: baytları bir kez diske yaz
+            tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+            tmp.write(data)
+            tmp.close()
+            path = tmp.name
+        try:
+            return "".join(_parallel_pages(path, n)).strip()
+        except BrokenProcessPool as e:
+            print(f"[pdftext] process pool bozuldu, seri okunuyor: {e}", file=sys.stderr, flush=True)
+            _reset_pool()
+            return "".join(doc[i].get_text() for i in range(n)).strip()
+    finally:
+        doc.close()
+        if tmp is not None:
+            try:
+                os.unlink(tmp.name)
+            except OSError:
+                pass
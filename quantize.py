@@ -0,0 +1,102 @@
+# quantize.py
+# Embedding'lerin sıkıştırılmış gösterimleri: float16 ve int8 (vektör başına ölçekli skaler kuantizasyon).
+#   float32: 4 bayt/boyut (1536 boyut = 6 KB), float16: 2 bayt/boyut, int8: 1 bayt/boyut + 4 bayt ölçek
+#   JSONB (6 ondalık metin) ise satır başına ~20-30 KB.
+# int8: x ≈ code * scale, scale = max|x| / 127; kosinüs sırası korunur, skor hatası ~1e-3 mertebesinde.
+#
+# Kullananlar:
+#   vector_index.py: RAM'deki / memmap matris (INDEX_QUANT), aday listesi exact float32 ile yeniden sıralanır
+#   sreports.embedding_q / sreport_passages.embedding_q (BYTEA): index yüklemesi JSONB yerine bunu okur.
+#   Analiz (app.py / asgi.py) ve parça yazımı doldurur; toplu içe aktarılanlar ve eski satırlar için
+#   scripts/quantize_embeddings.py. JSONB kaynak olarak kalır (pgvector migration, check_embeddings).
+# Ölçüm: scripts/bench_quant.py (exact kosinüse karşı recall@k)
+#
+# Env:
+#   EMBED_STORAGE (int8; embedding_q kodlaması: float16 | int8)
+
+import os
+import struct
+
+import numpy as np
+
+MODES = ("float32", "float16", "int8")
+EMBED_STORAGE = os.getenv("EMBED_STORAGE", "int8").lower()
+
+# embedding_q ilk baytı: kodlama
+_TAGS = {"float32": b"f", "float16": b"h", "int8": b"b"}
+_MODES_BY_TAG = {v: k for k, v in _TAGS.items()}
+_BLOCK = 4096  # dönüşüm bloğu (satır); float32 geçici bellek blok*boyut*4 bayt
+
+# sreport_passages.embedding_q passages.py şemasında
+COLUMNS_SQL = """
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS embedding_q BYTEA;
+"""
+
+
+def ensure_columns(conn):
+    cur = conn.cursor()
+    cur.execute(COLUMNS_SQL)
+    conn.commit(); cur.close()
+
+
+def check_mode(mode):
+    if mode not in MODES:
+        raise ValueError(f"quant {mode} (seçenekler: {', '.join(MODES)})")
+    return mode
+
+
+def quantize(mat, mode):
+    """(n, d) float32 -> (kodlar, ölçekler); ölçekler sadece int8'de (n,) float32, diğerlerinde None."""
+    mat = np.asarray(mat, dtype=np.float32)
+    if mode == "float32":
+        return mat, None
+    if mode == "float16":
+        return mat.astype(np.float16), None
+    check_mode(mode)
+    scales = np.abs(mat).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(mat / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes, scales=None):
+    out = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        out = out * np.asarray(scales, dtype=np.float32)[:, None]
+    return out
+
+
+def dot(codes, scales, q):
+    """codes @ q (float32); float16/int8 bloklar halinde float32'ye çevrilir (numpy'da BLAS sadece float32/64)."""
+    if codes.dtype == np.float32 and scales is None:
+        return codes @ q
+    out = np.empty(len(codes), dtype=np.float32)
+    for i in range(0, len(codes), _BLOCK):
+        out[i:i + _BLOCK] = np.asarray(codes[i:i + _BLOCK], dtype=np.float32) @ q
+    if scales is not None:
+        out *= scales
+    return out
+
+
+def encode(vec, mode=None):
+    """Tek vektör -> BYTEA değeri (etiket baytı [+ int8 ölçeği] + kodlar)."""
+    mode = check_mode(mode or EMBED_STORAGE)
+    codes, scales = quantize(np.asarray(vec, dtype=np.float32)[None, :], mode)
+    head = _TAGS[mode] + (struct.pack("<f", float(scales[0])) if scales is not None else b"")
+    return head + codes[0].astype(codes.dtype.newbyteorder("<"), copy=False).tobytes()
+
+
+def decode(blob):
+    """encode() çıktısı -> float32 vektör (bozuksa None)."""
+    blob = bytes(blob)
+    mode = _MODES_BY_TAG.get(blob[:1])
+    if mode is None:
+        return None
+    if mode == "int8":
+        (scale,) = struct.unpack("<f", blob[1:5])
+        return np.frombuffer(blob, dtype=np.int8, offset=5).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype="<f2" if mode == "float16" else "<f4", offset=1).astype(np.float32)
+
+
+def nbytes_per_vector(mode, dim):
+    return dim * {"float32": 4, "float16": 2, "int8": 1}[check_mode(mode)] + (4 if mode == "int8" else 0)
@@ -0,0 +1,74 @@
+# report_fields.py
+# sreports satırından türetilen alanlar: anahtar kelimeler, olay özeti, kısa snippet.
+# Benzer vaka listesi her aday için bunları metinden yeniden çıkarmasın diye
+# rapor eklenirken (app.py analizi, scripts/ingest_cadors.py) bir kez hesaplanıp
+# sreports'a yazılır; eski satırlar için scripts/backfill_report_fields.py.
+#
+# Kolonlar: keywords TEXT[], incident_summary TEXT, snippet TEXT
+# (keywords NULL ise satır henüz doldurulmamıştır; okuyan taraf metinden hesaplar.)
+
+import re
+
+import psycopg2.extras
+
+STOP = set("""
+the and for with that this from into over under across about above below between during after before while would could
+have has had were was are is been being also only more most less least very much many such those these then than
+shall will may might can cannot not nor but yet though although because since due therefore however hence
+""".split())
+
+SNIPPET_CHARS = 220
+
+COLUMNS_SQL = """
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS keywords TEXT[];
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS incident_summary TEXT;
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS snippet TEXT;
+"""
+
+
+def ensure_columns(conn):
+    cur = conn.cursor()
+    cur.execute(COLUMNS_SQL)
+    conn.commit(); cur.close()
+
+
+def top_keywords(text: str, k=10):
+    words = re.findall(r"[A-Za-z]{4,}", (text or "").lower())
+    words = [w for w in words if w not in STOP]
+    freq = {}
+    for w in words:
+        freq[w] = freq.get(w, 0) + 1
+    return [w for w, _ in sorted(freq.items(), key=lambda x: -x[1])[:k]]
+
+
+def incident_summary_from_markdown(md: str) -> str:
+    m = re.search(r"(?im)^###\s*Incident Summary\s*\n(.+?)(?:\n###|\Z)", md, re.S)
+    if not m:
+        return "\n".join(md.strip().splitlines()[:4])
+    return m.group(1).strip()
+
+
+def derive(report_text, result_text):
+    """-> (keywords, incident_summary, snippet); benzer vaka kartındaki eski hesapla aynı."""
+    report_text = report_text or ""
+    summary = incident_summary_from_markdown(result_text or report_text)
+    snippet = (summary or report_text[:SNIPPET_CHARS]).strip()
+    return top_keywords(report_text), summary, snippet
+
+
+def row_fields(row):
+    """Satırdaki kayıtlı alanlar; doldurulmamışsa metinden hesaplanır."""
+    if row.get("keywords") is not None:
+        return row["keywords"], row.get("incident_summary") or "", row.get("snippet") or ""
+    return derive(row.get("report_text"), row.get("result_text"))
+
+
+def write_fields(cur, rows):
+    """rows: [(id, report_text, result_text)] -> türetilmiş alanları yazar. Commit çağırana ait."""
+    values = [(str(rid),) + derive(rt, res) for rid, rt, res in rows]
+    psycopg2.extras.execute_values(cur, """
+        UPDATE sreports AS s SET keywords = v.kw, incident_summary = v.summ, snippet = v.snip
+        FROM (VALUES %s) AS v(id, kw, summ, snip)
+        WHERE s.id = v.id::uuid;
+    """, values, template="(%s, %s::text[], %s, %s)", page_size=500)
+    return len(values)
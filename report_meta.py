@@ -0,0 +1,212 @@
+# report_meta.py
+# Raporun yapısal meta verisi: olay tarihi, meydan, eyalet, hava aracı (make/model), uçuş safhası.
+# CADORS CSV'sinde bu alanlar ayrı kolonlardır; ingest_cadors.py eskiden hepsini rapor metnine
+# gömüyordu. Artık sreports kolonlarına da yazılır ve benzer vaka araması vektör skorlamasından ÖNCE
+# bunlarla filtreler (pgvector: WHERE; in-process index: satır maskesi, bkz. vector_index.py).
+# Eski CADORS satırları için scripts/backfill_report_meta.py (rapor metnindeki başlık satırlarından).
+#
+# Kolonlar: occurred_on DATE, aerodrome, province, aircraft, phase TEXT
+# Kurum içi raporlarda bu alanlar boştur; tarih filtresi için olay tarihi yoksa kayıt tarihi kullanılır.
+#
+# Filtreler (similar_cases ?date_from=&date_to=&aircraft=&phase=&province=):
+#   date_from / date_to: YYYY-MM-DD (dahil), province: tam eşleşme, aircraft / phase: içerir;
+#   metinler büyük/küçük harf duyarsız. SQL tarafı kolonu norm() ile aynı biçime getirir (NORM_SQL: boşluklar
+#   tek, küçük harf); index'ler bu ifade üzerinde: province btree, aircraft / phase pg_trgm GIN ('%x%' LIKE için).
+#   pg_trgm kurulamazsa (yetki / extension yok) içerir filtreleri doğru çalışır ama index'siz taranır.
+
+import re
+import sys
+import datetime
+
+import psycopg2
+import psycopg2.extras
+
+FIELDS = ("aerodrome", "province", "aircraft", "phase")
+FILTER_FIELDS = ("aircraft", "phase", "province")
+MATCH = {"aircraft": "contains", "phase": "contains", "province": "exact"}
+MAX_FILTER_CHARS = 80
+# norm() ile aynı: boşluk dizileri tek boşluk, baş/son boşluksuz, küçük harf (index ifadesiyle birebir aynı olmalı)
+NORM_SQL = "lower(btrim(regexp_replace({col}, '\\s+', ' ', 'g')))"
+
+COLUMNS_SQL = """
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS occurred_on DATE;
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS aerodrome TEXT;
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS province TEXT;
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS aircraft TEXT;
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS phase TEXT;
+CREATE INDEX IF NOT EXISTS idx_sreports_event_day ON sreports ((coalesce(occurred_on, created_at::date)));
+DROP INDEX IF EXISTS idx_sreports_province;
+DROP INDEX IF EXISTS idx_sreports_phase;
+CREATE INDEX IF NOT EXISTS idx_sreports_province_norm ON sreports (({province}));
+""".format(province=NORM_SQL.format(col="province"))
+
+TRGM_SQL = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_sreports_aircraft_trgm ON sreports USING GIN (({aircraft}) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_sreports_phase_trgm ON sreports USING GIN (({phase}) gin_trgm_ops);
+""".format(aircraft=NORM_SQL.format(col="aircraft"), phase=NORM_SQL.format(col="phase"))
+
+# SELECT listelerine eklenecek kolonlar (row_meta bunları okur)
+META_COLS = "occurred_on, aerodrome, province, aircraft, phase"
+EVENT_DAY_SQL = "coalesce({p}occurred_on, {p}created_at::date)"
+
+_DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%Y%m%d", "%d-%b-%Y", "%B %d, %Y", "%b %d, %Y")
+
+
+def ensure_columns(conn):
+    cur = conn.cursor()
+    cur.execute(COLUMNS_SQL)
+    conn.commit()
+    try:
+        cur.execute(TRGM_SQL)
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"[report_meta] pg_trgm index'leri kurulamadı ({str(e).strip().splitlines()[0]}); aircraft / phase filtreleri "
+              "index'siz çalışır.", file=sys.stderr, flush=True)
+    cur.close()
+
+
+def norm(value):
+    """Karşılaştırma biçimi: boşluklar tek, küçük harf; boş / '-' -> ''."""
+    value = " ".join(str(value or "").split()).lower()
+    return "" if value == "-" else value
+
+
+def parse_date(value):
+    value = (value or "").strip()
+    if not value:
+        return None
+    for fmt in _DATE_FORMATS:
+        for cand in (value, value[:10]):
+            try:
+                return datetime.datetime.strptime(cand, fmt).date()
+            except ValueError:
+                pass
+    return None
+
+
+def _clean(value):
+    value = " ".join(str(value or "").split())
+    return value if value and value != "-" else None
+
+
+def from_cadors_row(row: dict):
+    """CADORS CSV satırı -> meta sözlüğü (kolon adları indirmeye göre değişebilir; build_report_text ile aynı)."""
+    def g(*keys):
+        for k in keys:
+            if k in row and row[k]:
+                return str(row[k]).strip()
+        return ""
+    aircraft = " ".join(p for p in (g("Make"), g("Model")) if p)
+    return {
+        "occurred_on": parse_date(g("Occurrence Date", "Date")),
+        "aerodrome": _clean(g("Aerodrome Name", "Aerodrome")),
+        "province": _clean(g("Province")),
+        "aircraft": _clean(aircraft),
+        "phase": _clean(g("Phase of Flight", "Phase")),
+    }
+
+
+_HEADER_RE = re.compile(r"^\[CADORS [^\]]*\]\s+(\S+)")
+_AERODROME_RE = re.compile(r"^Aerodrome:\s*(.*?)\s*\|\s*Location:.*\|\s*Province/Region:\s*(.*?)\s*/", re.M)
+_AIRCRAFT_RE = re.compile(r"^Aircraft:\s*(\S+)\s*(.*?)\s*\|\s*Phase:\s*(.*)$", re.M)
+
+
+def parse_report_text(text):
+    """ingest_cadors.build_report_text çıktısından meta (CSV'si olmayan eski satırlar için)."""
+    text = text or ""
+    meta = {"occurred_on": None, "aerodrome": None, "province": None, "aircraft": None, "phase": None}
+    m = _HEADER_RE.match(text)
+    if m:
+        meta["occurred_on"] = parse_date(m.group(1))
+    m = _AERODROME_RE.search(text)
+    if m:
+        meta["aerodrome"], meta["province"] = _clean(m.group(1)), _clean(m.group(2))
+    m = _AIRCRAFT_RE.search(text)
+    if m:
+        meta["aircraft"], meta["phase"] = _clean(m.group(2)), _clean(m.group(3))
+    return meta
+
+
+def row_meta(r):
+    """DB satırından (META_COLS + created_at) index meta'sı: {"day": date|None, alan: str}."""
+    day = r["occurred_on"]
+    if day is None and r.get("created_at") is not None:
+        day = r["created_at"].date()
+    out = {"day": day}
+    for f in FIELDS:
+        out[f] = r[f] or ""
+    return out
+
+
+def write_meta(cur, rows):
+    """rows: [(id, meta)] -> sreports kolonları."""
+    psycopg2.extras.execute_values(cur, """
+        UPDATE sreports AS s SET occurred_on = v.occurred_on::date, aerodrome = v.aerodrome,
+               province = v.province, aircraft = v.aircraft, phase = v.phase
+        FROM (VALUES %s) AS v(id, occurred_on, aerodrome, province, aircraft, phase)
+        WHERE s.id = v.id::uuid
+    """, [(str(rid), m["occurred_on"], m["aerodrome"], m["province"], m["aircraft"], m["phase"]) for rid, m in rows],
+        page_size=500)
+
+
+# ---------- filtreler ----------
+def parse_filters(args):
+    """request.args benzeri sözlük -> {date_from, date_to, aircraft, phase, province}; boşlar atlanır."""
+    out = {}
+    for key in ("date_from", "date_to"):
+        d = parse_date(args.get(key) or "")
+        if d:
+            out[key] = d
+    for f in FILTER_FIELDS:
+        v = norm((args.get(f) or "")[:MAX_FILTER_CHARS])
+        if v:
+            out[f] = v
+    return out
+
+
+def filters_key(filters):
+    """Cache anahtarı için sıralı tuple (filtre yoksa ())."""
+    return tuple(sorted((k, str(v)) for k, v in (filters or {}).items()))
+
+
+def matches(field, filter_value, value):
+    """Normalize edilmiş değer filtreye uyuyor mu (in-process index vocab'ı için)."""
+    if MATCH[field] == "exact":
+        return value == filter_value
+    return filter_value in value
+
+
+def sql_where(filters, prefix=""):
+    """pgvector sorguları için (koşullar, parametreler); prefix ör. "s."."""
+    where, params = [], []
+    if not filters:
+        return where, params
+    day = EVENT_DAY_SQL.format(p=prefix)
+    if filters.get("date_from"):
+        where.append(f"{day} >= %s")
+        params.append(filters["date_from"])
+    if filters.get("date_to"):
+        where.append(f"{day} <= %s")
+        params.append(filters["date_to"])
+    for f in FILTER_FIELDS:
+        v = filters.get(f)
+        if not v:
+            continue
+        col = NORM_SQL.format(col=prefix + f)
+        if MATCH[f] == "exact":
+            where.append(f"{col} = %s")
+            params.append(v)
+        else:
+            where.append(f"{col} LIKE %s")
+            params.append("%" + v.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+    return where, params
+
+
+def describe(filters):
+    """UI etiketi: 'aircraft: cessna · 2023-01-01 → 2023-12-31'."""
+    parts = [f"{f}: {filters[f]}" for f in FILTER_FIELDS if filters.get(f)]
+    if filters.get("date_from") or filters.get("date_to"):
+        parts.append(f"{filters.get('date_from') or '…'} → {filters.get('date_to') or '…'}")
+    return " · ".join(parts)
@@ -0,0 +1,67 @@
+# scripts/backfill_report_fields.py
+# sreports.keywords / incident_summary / snippet kolonlarını (report_fields.py) mevcut satırlar için doldurur.
+# Yeni raporlar bu alanlarla eklenir (app.py analizi, ingest_cadors.py); bu script eski corpus içindir.
+# Doldurulmamış satırlar için benzer vaka listesi alanları metinden hesaplamaya devam eder.
+# Kullanım:
+#   python scripts/backfill_report_fields.py --batch-size 2000
+#   python scripts/backfill_report_fields.py --scope internal --limit 10000
+#   python scripts/backfill_report_fields.py --all      # STOP listesi vb. değiştiyse hepsini yeniden hesapla
+#
+# Gerekli env:
+#   DATABASE_URL
+
+import os, sys, time, argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import script_conn as get_conn
+import report_fields
+
+# id sırasıyla keyset: --all'da da her satır bir kez işlenir
+SELECT_SQL = """
+SELECT s.id, coalesce(s.report_text, ''), coalesce(s.result_text, '') FROM sreports s
+WHERE s.id > %s {missing} {scope}
+ORDER BY s.id
+LIMIT %s;
+"""
+
+SCOPES = {
+    "all": "",
+    "internal": "AND s.method IS DISTINCT FROM 'Imported (CADORS)'",
+    "cadors": "AND s.method = 'Imported (CADORS)'",
+}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=2000, help="Batch başına satır")
+    parser.add_argument("--limit", type=int, default=None, help="Bu kadar satırı işle ve çık")
+    parser.add_argument("--scope", choices=sorted(SCOPES), default="all")
+    parser.add_argument("--all", action="store_true", help="Dolu olanlar dahil tüm satırları yeniden hesapla")
+    args = parser.parse_args()
+
+    sql = SELECT_SQL.format(missing="" if args.all else "AND s.keywords IS NULL", scope=SCOPES[args.scope])
+    last_id = "00000000-0000-0000-0000-000000000000"
+    done = 0
+    t0 = time.time()
+    with get_conn() as conn:
+        report_fields.ensure_columns(conn)
+        while args.limit is None or done < args.limit:
+            n = args.batch_size if args.limit is None else min(args.batch_size, args.limit - done)
+            cur = conn.cursor()
+            cur.execute(sql, (last_id, n))
+            rows = cur.fetchall()
+            if not rows:
+                cur.close()
+                break
+            report_fields.write_fields(cur, rows)
+            conn.commit(); cur.close()
+            last_id = str(rows[-1][0])
+            done += len(rows)
+            rate = done / max(time.time() - t0, 1e-9)
+            print(f"[{time.strftime('%H:%M:%S')}] satırlar: {done} | {rate:.0f} satır/s", flush=True)
+    print(f"\nDONE. rows={done} in {time.time()-t0:.1f}s\n")
+
+if __name__ == "__main__":
+    main()
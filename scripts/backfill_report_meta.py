@@ -0,0 +1,68 @@
+# scripts/backfill_report_meta.py
+# sreports.occurred_on / aerodrome / province / aircraft / phase kolonlarını (report_meta.py) eski CADORS
+# satırları için rapor metnindeki başlık satırlarından doldurur (ingest_cadors.build_report_text biçimi).
+# Yeni içe aktarımlar bu alanları CSV'den kendisi yazar; kurum içi raporlarda alanlar boş kalır.
+# In-process index meta'yı yüklerken okur: backfill sonrası snapshot / ANN index'i yeniden kurun
+# (scripts/embedding_snapshot.py build, scripts/build_ann_index.py), ya da app'i snapshot'sız yeniden başlatın.
+# Kullanım:
+#   python scripts/backfill_report_meta.py --batch-size 2000
+#   python scripts/backfill_report_meta.py --all      # parse kuralları değiştiyse hepsini yeniden yaz
+#
+# Gerekli env:
+#   DATABASE_URL
+
+import os, sys, time, argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import script_conn as get_conn
+import report_meta
+
+# id sırasıyla keyset; sadece CADORS satırları (kurum içi raporlarda başlık satırları yok)
+SELECT_SQL = """
+SELECT s.id, coalesce(s.report_text, '') FROM sreports s
+WHERE s.id > %s AND s.method = 'Imported (CADORS)' {missing}
+ORDER BY s.id
+LIMIT %s;
+"""
+
+MISSING = ("AND s.occurred_on IS NULL AND s.aerodrome IS NULL AND s.province IS NULL "
+           "AND s.aircraft IS NULL AND s.phase IS NULL")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=2000, help="Batch başına satır")
+    parser.add_argument("--limit", type=int, default=None, help="Bu kadar satırı işle ve çık")
+    parser.add_argument("--all", action="store_true", help="Dolu olanlar dahil tüm CADORS satırlarını yeniden yaz")
+    args = parser.parse_args()
+
+    sql = SELECT_SQL.format(missing="" if args.all else MISSING)
+    last_id = "00000000-0000-0000-0000-000000000000"
+    done = parsed = 0
+    t0 = time.time()
+    with get_conn() as conn:
+        report_meta.ensure_columns(conn)
+        while args.limit is None or done < args.limit:
+            n = args.batch_size if args.limit is None else min(args.batch_size, args.limit - done)
+            cur = conn.cursor()
+            cur.execute(sql, (last_id, n))
+            rows = cur.fetchall()
+            if not rows:
+                cur.close()
+                break
+            metas = [(rid, report_meta.parse_report_text(text)) for rid, text in rows]
+            metas = [(rid, m) for rid, m in metas if any(v is not None for v in m.values())]
+            if metas:
+                report_meta.write_meta(cur, metas)
+            conn.commit(); cur.close()
+            last_id = str(rows[-1][0])
+            done += len(rows)
+            parsed += len(metas)
+            rate = done / max(time.time() - t0, 1e-9)
+            print(f"[{time.strftime('%H:%M:%S')}] satırlar: {done} (meta: {parsed}) | {rate:.0f} satır/s", flush=True)
+    print(f"\nDONE. rows={done} meta={parsed} in {time.time()-t0:.1f}s\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# scripts/bench_asgi.py
+# gthread (app:app) ile ASGI (asgi:app) kurulumlarını aynı yük altında karşılaştırır.
+# Her sanal kullanıcı: login -> POST /analyze -> SSE akışını (ya da /jobs/<id> poll'unu) sonuna kadar okur.
+# Ölçülenler: /analyze yanıt süresi, ilk token süresi (TTFT), toplam süre, throughput.
+#
+# Örnek (OpenAI yerine sahte sunucu, 2 sn gecikme + 30 ms/token):
+#   python scripts/fake_openai.py --latency-ms 2000 --token-ms 30 &
+#   export OPENAI_API_BASE=http://127.0.0.1:8089/v1 OPENAI_API_KEY=test
+#   gunicorn -w 1 -k gthread --threads 16 -b 127.0.0.1:8000 app:app &
+#   uvicorn asgi:app --port 8001 &
+#   python scripts/bench_asgi.py --url http://127.0.0.1:8000 --user bench --password bench --concurrency 100
+#   python scripts/bench_asgi.py --url http://127.0.0.1:8001 --user bench --password bench --concurrency 100
+
+import os, re, sys, time, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import fitz  # PyMuPDF
+
+JOB_RE = re.compile(r'id="job-([0-9a-f-]{36})"')
+
+def sample_pdf():
+    """Küçük, tek sayfalık test PDF'i."""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "During taxi the aircraft crossed the hold short line without clearance.\n"
+                               "Tower issued a go-around to landing traffic. Crew cited radio congestion.")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def pct(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+def one_user(args, pdf, results, lock):
+    s = requests.Session()
+    r = s.post(f"{args.url}/login", data={"username": args.user, "password": args.password}, allow_redirects=False)
+    if r.status_code >= 400:
+        raise RuntimeError(f"login failed: {r.status_code}")
+
+    t0 = time.perf_counter()
+    r = s.post(f"{args.url}/analyze", files={"pdf": ("bench.pdf", pdf, "application/pdf")},
+               data={"method": "Five Whys", "lang": "English"}, timeout=args.timeout)
+    t_submit = time.perf_counter() - t0
+    m = JOB_RE.search(r.text)
+    if r.status_code != 200 or not m:
+        raise RuntimeError(f"analyze: {r.status_code} {r.text[:120]}")
+    job_id = m.group(1)
+
+    ttft = None
+    if "sse-connect" in r.text:
+        with s.get(f"{args.url}/jobs/{job_id}/stream", stream=True, timeout=args.timeout) as resp:
+            event = None
+            for line in resp.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[7:]
+                    if event == "token" and ttft is None:
+                        ttft = time.perf_counter() - t0
+                    if event == "done":
+                        break
+    else:
+        while time.perf_counter() - t0 < args.timeout:
+            html = s.get(f"{args.url}/jobs/{job_id}", timeout=args.timeout).text
+            if "hx-trigger=\"load delay" not in html:
+                break
+            time.sleep(1.0)
+    total = time.perf_counter() - t0
+    with lock:
+        results["submit"].append(t_submit)
+        results["total"].append(total)
+        if ttft is not None:
+            results["ttft"].append(ttft)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--user", default=os.getenv("BENCH_USER", "bench"))
+    parser.add_argument("--password", default=os.getenv("BENCH_PASSWORD", "bench"))
+    parser.add_argument("--concurrency", type=int, default=50, help="Aynı anda kaç kullanıcı")
+    parser.add_argument("--requests", type=int, default=None, help="Toplam analiz sayısı (varsayılan = concurrency)")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+    n = args.requests or args.concurrency
+
+    pdf = sample_pdf()
+    results = {"submit": [], "ttft": [], "total": []}
+    lock = threading.Lock()
+    errors = []
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        futs = [ex.submit(one_user, args, pdf, results, lock) for _ in range(n)]
+        for f in futs:
+            try:
+                f.result()
+            except Exception as e:
+                errors.append(str(e))
+    wall = time.perf_counter() - t0
+
+    print(f"\n--- {args.url} | {n} analyses, concurrency {args.concurrency} ---")
+    for key in ("submit", "ttft", "total"):
+        v = results[key]
+        print(f"{key:<7}: p50 {pct(v, 50):7.2f}s | p95 {pct(v, 95):7.2f}s | max {max(v) if v else float('nan'):7.2f}s | n={len(v)}")
+    print(f"wall   : {wall:.1f}s | throughput {len(results['total']) / wall:.2f} analyses/s | errors {len(errors)}")
+    for e in errors[:5]:
+        print(f"  ! {e}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# scripts/bench_pdf.py
+# pdfrender.py ölçümü: 1 / 10 / 50 sayfalık çıktılar için ms/sayfa ve tepe bellek (tracemalloc).
+# Modlar: report (generate_pdf_report), full (10 benzer vaka, tam metin), compact (aynı girdi, compact=True).
+# DB / OpenAI gerekmez; girdiler sentetik markdown.
+#
+# Kullanım:
+#   python scripts/bench_pdf.py
+#   python scripts/bench_pdf.py --pages 1 10 50 --repeat 5
+
+import os, sys, time, argparse, statistics, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import fitz  # PyMuPDF
+import pdfrender
+
+SECTION = """### {title}
+The crew reported a {thing} during the {phase} phase. Tower instructed the aircraft to hold position while
+maintenance assessed the {thing}. Weather was VMC with light crosswind and the runway was dry.
+
+- Contributing factor: {thing} indication was intermittent and not covered by the checklist
+- Contributing factor: radio congestion delayed the clearance read-back
+- Mitigation: update the QRH and brief crews on the {thing} procedure
+
+1. Review maintenance records for recurring {thing} defects
+2. Add the scenario to recurrent simulator training
+"""
+
+THINGS = ["hydraulic leak", "bird strike", "runway incursion", "engine vibration", "smoke warning"]
+PHASES = ["taxi", "take-off", "climb", "cruise", "approach", "landing"]
+
+
+def make_markdown(sections):
+    return "\n".join(SECTION.format(title=f"Finding {i + 1}", thing=THINGS[i % len(THINGS)],
+                                    phase=PHASES[i % len(PHASES)]) for i in range(sections))
+
+
+def page_count(buf):
+    with fitz.open(stream=buf.getvalue(), filetype="pdf") as doc:
+        return doc.page_count
+
+
+def measure(render, repeat):
+    """-> (medyan süre s, tepe bellek bayt, sayfa sayısı); tracemalloc yavaşlattığı için bellek ayrı turda."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        buf = render()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    render()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak, page_count(buf)
+
+
+def sections_for(pages, render_for):
+    """Hedef sayfa sayısına yakın bölüm sayısı (bir kez ölçüp ölçekler)."""
+    probe = 20
+    got = page_count(render_for(probe))
+    return max(1, round(probe * pages / max(got, 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", type=int, default=10, help="full/compact için benzer vaka sayısı")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    pdfrender.styles()
+    print(f"styles (ilk kurulum): {(time.perf_counter() - t0) * 1000:.1f} ms, sonraki çağrılar cache'ten\n")
+
+    def report(n):
+        return pdfrender.generate_pdf_report(make_markdown(n), title="Bench Report")
+
+    def similar(n):
+        # vaka başına tam rapor: toplam hacim ~n bölüm
+        per_case = max(1, n // (args.cases + 1))
+        return [{"sim": 0.8 - i * 0.01, "why": "They both center on hydraulic leak during taxi.",
+                 "snippet": "Hydraulic leak reported during taxi; aircraft returned to stand.",
+                 "full_markdown": make_markdown(per_case)} for i in range(args.cases)]
+
+    def full(n, compact):
+        per_case = max(1, n // (args.cases + 1))
+        return pdfrender.generate_pdf_full(make_markdown(per_case), similar(n), title="Bench Full", compact=compact)
+
+    modes = {
+        "report": report,
+        "full": lambda n: full(n, False),
+        "compact": lambda n: full(n, True),
+    }
+    print(f"{'mode':<8} {'hedef':>5} {'sayfa':>5} {'süre ms':>9} {'ms/sayfa':>9} {'tepe MB':>8}")
+    for pages in args.pages:
+        for name, fn in modes.items():
+            # compact, full ile aynı girdiyi kullanır (sayfa hedefi full'a göre)
+            n = sections_for(pages, modes["full"] if name == "compact" else fn)
+            t, peak, got = measure(lambda: fn(n), args.repeat)
+            print(f"{name:<8} {pages:>5} {got:>5} {t * 1000:>9.1f} {t * 1000 / max(got, 1):>9.1f} {peak / 1e6:>8.1f}",
+                  flush=True)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# scripts/bench_quant.py
+# Kuantize index (quantize.py / vector_index.py) ölçümü: exact float32 kosinüse karşı recall@k,
+# sorgu süresi ve vektör başına bayt. Modlar: float32, float16, int8; int8/float16 rerank'lı ve rerank'sız.
+# Varsayılan veri sentetik (kümeli, normalize); --snapshot ile gerçek corpus (embedding_snapshot.py çıktısı).
+# DB / OpenAI gerekmez.
+#
+# Kullanım:
+#   python scripts/bench_quant.py
+#   python scripts/bench_quant.py --n 100000 --queries 200 --k 10 --nprobe 8
+#   python scripts/bench_quant.py --snapshot data/emb_snapshot
+
+import os, sys, json, time, argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import quantize
+from vector_index import EmbeddingIndex
+
+def synthetic(n, dim, clusters, seed=0):
+    """Kümeli veri: gerçek embedding'ler gibi komşular birbirine yakın, skor farkları küçük."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    mat = centers[rng.integers(0, clusters, size=n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return mat / np.linalg.norm(mat, axis=1, keepdims=True)
+
+def from_snapshot(directory):
+    index = EmbeddingIndex()
+    index.load_snapshot(directory)
+    return index._matrix().astype(np.float32)
+
+def run(index, qs, exact, k, nprobe, rerank):
+    t0 = time.perf_counter()
+    got = [[rid for rid, _ in index.search(q, k=k, min_sim=-1.0, nprobe=nprobe, rerank=rerank)] for q in qs]
+    dt = (time.perf_counter() - t0) / len(qs) * 1000
+    recall = np.mean([len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(exact, got)])
+    return dt, recall
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", type=str, default=None, help="Gerçek vektörler için snapshot klasörü")
+    parser.add_argument("--n", type=int, default=50000, help="Sentetik satır sayısı")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=4, help="Aday çarpanı (k*rerank exact ile sıralanır)")
+    parser.add_argument("--nprobe", type=int, default=0, help="0: tam tarama; >0 ise IVF kurulur")
+    args = parser.parse_args()
+
+    mat = from_snapshot(args.snapshot) if args.snapshot else synthetic(args.n, args.dim, args.clusters)
+    n, dim = mat.shape
+    rng = np.random.default_rng(1)
+    # sorgular: corpus vektörlerine gürültü eklenmiş hali (kendisi dahil değil)
+    qs = mat[rng.choice(n, size=min(args.queries, n), replace=False)] + 0.05 * rng.normal(size=(min(args.queries, n), dim))
+    qs = (qs / np.linalg.norm(qs, axis=1, keepdims=True)).astype(np.float32)
+    rows = [(str(i), "", mat[i]) for i in range(n)]
+    print(f"n={n} dim={dim} queries={len(qs)} k={args.k} nprobe={args.nprobe}\n")
+
+    exact = [list(map(str, np.argsort(-(mat @ q))[:args.k])) for q in qs]
+    js = np.mean([len(json.dumps([round(float(x), 6) for x in v])) for v in mat[:200]])
+    print(f"{'mode':<8} {'rerank':>6} {'tarama B':>9} {'RAM B':>7} {'DB B':>6} {'ms/sorgu':>9} {'recall@k':>9}")
+    print(f"{'jsonb':<8} {'-':>6} {'-':>9} {'-':>7} {js:>6.0f}")
+    for mode in quantize.MODES:
+        db = len(quantize.encode(mat[0], mode))
+        for rerank in ([0] if mode == "float32" else [0, args.rerank]):
+            index = EmbeddingIndex(dim=dim, quant=mode, rerank=rerank)
+            index.load(rows)
+            if args.nprobe:
+                index.train()
+            scanned = index._mat[:n].nbytes + (index._scale[:n].nbytes if index._scale is not None else 0)
+            ram = scanned + (index._exact[:n].nbytes if index._exact is not None else 0)
+            dt, recall = run(index, qs, exact, args.k, args.nprobe, rerank)
+            print(f"{mode:<8} {rerank:>6} {scanned / n:>9.0f} {ram / n:>7.0f} {db:>6} {dt:>9.2f} {recall:>9.3f}", flush=True)
+    print("\ntarama B: skorlanan matris; RAM B: + exact kopya (rerank). Snapshot'tan açılan index'te exact kopya")
+    print("exact.npy'dadır (diskte, sadece aday satırlar okunur); RAM'de sadece tarama matrisi kalır.")
+
+if __name__ == "__main__":
+    main()
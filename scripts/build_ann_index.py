@@ -0,0 +1,104 @@
+# scripts/build_ann_index.py
+# sreports içindeki TÜM embedding'lerden IVF (ANN) index kurar ve diske yazar.
+# app.py açılışta bu dosyayı okur, sadece sonradan eklenen satırları DB'den çeker.
+# Kullanım:
+#   python scripts/build_ann_index.py
+#   python scripts/build_ann_index.py --nlist 1024 --out data/ann_index.npz --eval 200
+#   python scripts/build_ann_index.py --passages     # sreport_passages -> data/passage_index.npz
+#
+# Gerekli env:
+#   DATABASE_URL
+
+import os, sys, time, argparse
+import psycopg2.extras as extras
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import script_conn as get_conn
+from vector_index import EmbeddingIndex
+import report_meta
+import watermark as wmark
+
+PASSAGE_SQL = """
+    select p.report_id::text || ':' || p.ord as id, s.method, p.embedding_q,
+           case when p.embedding_q is null then p.embedding end as embedding, p.created_at, p.embedded_at,
+           s.occurred_on, s.aerodrome, s.province, s.aircraft, s.phase
+    from sreport_passages p join sreports s on s.id = p.report_id
+    where p.embedding is not null
+    order by p.embedded_at
+"""
+
+def iter_rows(conn, passages=False):
+    with conn.cursor(name="ann_build", cursor_factory=extras.DictCursor) as cur:
+        cur.itersize = 2000
+        cur.execute(PASSAGE_SQL if passages else """
+            select id, method, embedding_q,
+                   case when embedding_q is null then embedding end as embedding, created_at, embedded_at,
+                   occurred_on, aerodrome, province, aircraft, phase from sreports
+            where embedding is not null
+            order by embedded_at
+        """)
+        for r in cur:
+            yield r
+
+def evaluate(index, queries=200, k=10, probes=(1, 2, 4, 8, 16, 32)):
+    """Rastgele corpus vektörleriyle recall@k ve ortalama gecikmeyi (exact'e karşı) ölçer."""
+    n = len(index)
+    if not index.trained or n == 0:
+        print("[eval] index eğitilmemiş, atlanıyor."); return
+    rng = np.random.default_rng(0)
+    qs = index._gather(rng.choice(n, size=min(queries, n), replace=False))
+    t0 = time.perf_counter()
+    exact = [{rid for rid, _ in index.search(q, k=k, min_sim=-1.0, nprobe=0)} for q in qs]
+    t_exact = (time.perf_counter() - t0) / len(qs) * 1000
+    print(f"\n--- recall@{k} vs exact ({len(qs)} queries) ---")
+    print(f"exact          : {t_exact:7.2f} ms/query")
+    for p in probes:
+        t0 = time.perf_counter()
+        got = [{rid for rid, _ in index.search(q, k=k, min_sim=-1.0, nprobe=p)} for q in qs]
+        dt = (time.perf_counter() - t0) / len(qs) * 1000
+        recall = np.mean([len(a & b) / max(len(a), 1) for a, b in zip(exact, got)])
+        print(f"nprobe={p:<8d}: {dt:7.2f} ms/query | recall {recall:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", type=str, default=None, help="Varsayılan data/ann_index.npz (--passages: data/passage_index.npz)")
+    parser.add_argument("--passages", action="store_true", help="Rapor yerine parça (sreport_passages) index'i")
+    parser.add_argument("--nlist", type=int, default=None, help="Küme sayısı (varsayılan ~4*sqrt(n))")
+    parser.add_argument("--iters", type=int, default=10, help="k-means iterasyonu")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--eval", type=int, default=0, help="Bu kadar sorguyla recall/latency ölç")
+    args = parser.parse_args()
+    if args.out is None:
+        args.out = os.path.join(ROOT, "data", "passage_index.npz" if args.passages else "ann_index.npz")
+
+    t0 = time.time()
+    index = EmbeddingIndex(dim=args.dim)
+    watermark = [None]
+
+    def rows():
+        for r in iter_rows(conn, args.passages):
+            if r["embedded_at"] and (watermark[0] is None or r["embedded_at"] > watermark[0]):
+                watermark[0] = r["embedded_at"]
+            emb = r["embedding_q"] if r["embedding_q"] is not None else r["embedding"]
+            yield r["id"], r["method"], emb, report_meta.row_meta(r)
+
+    with get_conn() as conn:
+        index.load(rows())
+    print(f"[{time.strftime('%H:%M:%S')}] loaded: {len(index)} vectors in {time.time()-t0:.1f}s")
+
+    t1 = time.time()
+    index.train(nlist=args.nlist, iters=args.iters)
+    print(f"[{time.strftime('%H:%M:%S')}] trained: nlist={len(index._lists)} in {time.time()-t1:.1f}s")
+
+    index.save(args.out, meta={"watermark": watermark[0], "watermark_kind": wmark.KIND})
+    print(f"\nDONE. {args.out} ({os.path.getsize(args.out)/1e6:.1f} MB)\n")
+
+    if args.eval:
+        evaluate(index, queries=args.eval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# scripts/build_passages.py
+# Parçası (sreport_passages) olmayan raporları parçalara böler, embed eder ve yazar.
+# Yeni analizler parçalarını app.py'de kendisi yazar; bu script mevcut corpus içindir.
+# Kullanım:
+#   python scripts/build_passages.py --batch-size 100
+#   python scripts/build_passages.py --scope cadors --limit 5000 --rpm 3000 --tpm 1000000
+#   python scripts/build_ann_index.py --passages      # sonra parça ANN index'i
+#
+# Gerekli env:
+#   DATABASE_URL, OPENAI_API_KEY
+
+import os, sys, time, argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import script_conn as get_conn
+from embeddings import RateLimiter
+import passages
+
+SELECT_SQL = """
+SELECT s.id, coalesce(s.report_text, '') FROM sreports s
+WHERE NOT EXISTS (SELECT 1 FROM sreport_passages p WHERE p.report_id = s.id)
+  AND coalesce(s.report_text, '') <> ''
+  AND NOT (s.id::text = ANY(%s))
+  {scope}
+ORDER BY s.created_at
+LIMIT %s
+FOR UPDATE OF s SKIP LOCKED;
+"""
+
+SCOPES = {
+    "all": "",
+    "internal": "AND s.method IS DISTINCT FROM 'Imported (CADORS)'",
+    "cadors": "AND s.method = 'Imported (CADORS)'",
+}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=100, help="Batch başına rapor")
+    parser.add_argument("--limit", type=int, default=None, help="Bu kadar raporu işle ve çık")
+    parser.add_argument("--scope", choices=sorted(SCOPES), default="all")
+    parser.add_argument("--model", type=str, default="text-embedding-3-small")
+    parser.add_argument("--rpm", type=int, default=None, help="OpenAI istek/dakika limiti")
+    parser.add_argument("--tpm", type=int, default=None, help="OpenAI token/dakika limiti")
+    args = parser.parse_args()
+
+    limiter = RateLimiter(args.rpm, args.tpm) if (args.rpm or args.tpm) else None
+    sql = SELECT_SQL.format(scope=SCOPES[args.scope])
+    failed = set()
+    docs_done = rows_done = 0
+    t0 = time.time()
+    with get_conn() as conn:
+        passages.ensure_schema(conn)
+        while args.limit is None or docs_done < args.limit:
+            n = args.batch_size if args.limit is None else min(args.batch_size, args.limit - docs_done)
+            with conn.cursor() as cur:
+                cur.execute(sql, (list(failed), n))
+                docs = cur.fetchall()
+            if not docs:
+                conn.commit()
+                break
+            rows = passages.embed_passages([(str(rid), text) for rid, text in docs], model=args.model, limiter=limiter)
+            # bir parçası bile alınamayan rapor yazılmaz, sonra tekrar denenir (bu çalışmada atlanır)
+            bad = {rid for rid, _, _, emb in rows if emb is None}
+            failed |= bad
+            ok = [r for r in rows if r[0] not in bad]
+            passages.write_passages(conn, ok)
+            conn.commit()
+            docs_done += len(docs)
+            rows_done += len(ok)
+            rate = docs_done / max(time.time() - t0, 1e-9)
+            print(f"[{time.strftime('%H:%M:%S')}] raporlar: {docs_done} | parçalar: {rows_done} | "
+                  f"hatalı: {len(failed)} | {rate:.1f} rapor/s", flush=True)
+    print(f"\nDONE. reports={docs_done} passages={rows_done} failed={len(failed)} in {time.time()-t0:.1f}s\n")
+
+if __name__ == "__main__":
+    main()
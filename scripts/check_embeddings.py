@@ -3,14 +3,25 @@
 # Kullanım:
 #   python scripts/check_embeddings.py --summary
 #   python scripts/check_embeddings.py --backfill --batch-size 200 --limit 1000
+#   python scripts/check_embeddings.py --backfill --workers 8 --rpm 3000 --tpm 1000000
+#   (offline: OPENAI_API_BASE=http://127.0.0.1:8089/v1 ile scripts/fake_openai.py)
+# Satırlar kısa bir transaction'da kiralanır (sreports.embed_lease_until), embedding transaction dışında alınır,
+# yazma tek writer thread'de toplu yapılır; --rpm/--tpm her worker sayısında uygulanır.
 #
 # Gerekli env:
 #   DATABASE_URL, OPENAI_API_KEY
 
-import os, sys, time, argparse
-import psycopg2
+import os, sys, time, queue, argparse, threading
 import psycopg2.extras as extras
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import script_conn as get_conn
+from embeddings import RateLimiter
+from chunking import embed_documents
+
 # openai==0.28.1 ile uyumlu kullanım
 try:
     import openai
@@ -20,12 +31,6 @@ except Exception:
 def to_pgvector(vec):
     return "[" + ",".join(f"{x:.6f}" for x in vec) + "]"
 
-def get_conn():
-    db_url = os.getenv("DATABASE_URL")
-    if not db_url:
-        print("ERROR: DATABASE_URL yok.", file=sys.stderr); sys.exit(1)
-    return psycopg2.connect(db_url)
-
 def column_exists(conn, table, col):
     with conn.cursor() as c:
         c.execute("""
@@ -56,7 +61,75 @@ def summary():
     print(f"With embedding (NOT NULL)    : {r['with_emb']}")
     print(f"Missing embedding (NULL)     : {r['missing']}\n")
 
-def backfill(batch_size=200, limit=None, model="text-embedding-3-small"):
+LEASE_SQL = "ALTER TABLE sreports ADD COLUMN IF NOT EXISTS embed_lease_until TIMESTAMP;"
+
+def claim_sql_for(conn):
+    # title var mı diye kontrol et
+    has_title = column_exists(conn, "sreports", "title")
+    # Kısa transaction: satırları kiralar (embed_lease_until) ve hemen commit eder; embedding transaction
+    # dışında alınır. Kirası dolan satır (süreç ölmüş) tekrar seçilir. SKIP LOCKED: eşzamanlı claim'ler çakışmaz.
+    return """
+        update sreports as s set embed_lease_until = now() + %s * interval '1 second'
+        where s.id in (
+            select id from sreports
+            where method = 'Imported (CADORS)' and embedding is null
+              and (embed_lease_until is null or embed_lease_until < now())
+              and not (id::text = any(%s))
+            order by created_at desc
+            limit %s
+            for update skip locked
+        )
+        returning s.id, {text_expr} as text
+    """.format(
+        text_expr=(
+            "coalesce(s.title,'') || E'\\n' || coalesce(s.report_text,'')"
+            if has_title else
+            "coalesce(s.report_text,'')"
+        )
+    )
+
+def claim_batch(claim_sql, failed, batch_size, lease_seconds):
+    """Satırları kirala ve commit et -> [(id, text)]."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(claim_sql, (lease_seconds, list(failed), batch_size))
+            rows = cur.fetchall()
+        conn.commit()
+    return rows
+
+def embed_batch_rows(rows, model, limiter=None):
+    """Transaction dışında: [(id, text)] -> (yazılacak [(id, pgvector)], embedding alınamayan id'ler)."""
+    # Uzun metinler kırpılmaz: parçalanıp belge vektörüne indirgenir (chunking.py, app.py ile aynı)
+    texts = [(text or "").strip() for (_, text) in rows]
+
+    # Tek istekte çok sayıda girdi (token bütçeli); boş metinler API'ye gitmez
+    todo = [i for i, t in enumerate(texts) if t]
+    embs = embed_documents([texts[i] for i in todo], model=model, limiter=limiter)
+    by_row = {i: emb for i, emb in zip(todo, embs)}
+
+    updates, failed = [], []
+    for i, (rid, _) in enumerate(rows):
+        emb = by_row.get(i) if texts[i] else [0.0] * 1536
+        if emb is None:
+            failed.append(str(rid))
+        else:
+            updates.append((str(rid), to_pgvector(emb)))
+    return updates, failed
+
+def write_batch(conn, updates, failed):
+    """Tek kısa transaction: embedding'leri toplu yaz, kiraları (başarısızlar dahil) bırak."""
+    with conn.cursor() as cur:
+        if updates:
+            extras.execute_values(cur, """
+                update sreports as s set embedding = v.emb::jsonb, embed_lease_until = null
+                from (values %s) as v(id, emb)
+                where s.id = v.id::uuid
+            """, updates, page_size=500)
+        if failed:
+            cur.execute("update sreports set embed_lease_until = null where id = any(%s::uuid[])", (list(failed),))
+    conn.commit()
+
+def _check_openai():
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         print("ERROR: OPENAI_API_KEY yok.", file=sys.stderr); sys.exit(1)
@@ -64,63 +137,118 @@ def backfill(batch_size=200, limit=None, model="text-embedding-3-small"):
         print("ERROR: openai paketi kurulu değil (requirements.txt).", file=sys.stderr); sys.exit(1)
     openai.api_key = api_key
 
-    fetched = 0
-    total_embedded = 0
-    t0 = time.time()
+def count_missing():
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("select count(*) from sreports where method = 'Imported (CADORS)' and embedding is null")
+        return cur.fetchone()[0]
 
-    while True:
-        with get_conn() as conn:
-            conn.autocommit = False
-
-            # title var mı diye kontrol et
-            has_title = column_exists(conn, "sreports", "title")
-
-            select_sql = """
-                select id, {text_expr} as text
-                from sreports
-                where method = 'Imported (CADORS)' and embedding is null
-                order by created_at desc
-                limit %s
-            """.format(
-                text_expr=(
-                    "coalesce(title,'') || E'\\n' || coalesce(report_text,'')"
-                    if has_title else
-                    "coalesce(report_text,'')"
-                )
-            )
+def backfill(workers=1, batch_size=200, limit=None, model="text-embedding-3-small",
+             rpm=None, tpm=None, lease_seconds=600, report_every=5.0):
+    """Üretici/tüketici hattı: N embed worker (kirala -> transaction dışında embed) -> kuyruk -> tek writer
+    (toplu yaz). rpm/tpm limiti worker sayısından bağımsız uygulanır.
+    Aynı anda birden fazla süreç de çalıştırılabilir (kira + SKIP LOCKED)."""
+    _check_openai()
+    limiter = RateLimiter(rpm=rpm, tpm=tpm) if (rpm or tpm) else None
 
-            with conn.cursor() as cur:
-                cur.execute(select_sql, (batch_size,))
-                rows = cur.fetchall()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(LEASE_SQL)
+        conn.commit()
+        claim_sql = claim_sql_for(conn)
+        conn.commit()
 
-                if not rows:
-                    break
+    target = count_missing()
+    if limit is not None:
+        target = min(target, limit)
+    print(f"[backfill] {target} kayıt | workers={workers} rpm={rpm or '-'} tpm={tpm or '-'}", flush=True)
 
-                for (rid, text) in rows:
-                    fetched += 1
-                    text = (text or "").strip()
-                    # Çok aşırı uzun metinlerde gereksiz masrafı kesmek için kırp (yaklaşık 15k karakter)
-                    if len(text) > 15000:
-                        text = text[:15000]
+    lock = threading.Lock()
+    state = {"claimed": 0, "done": 0, "failed": set(), "errors": 0}
+    stop = threading.Event()
+    # sınırlı kuyruk: writer geride kalırsa embed worker'lar bekler
+    writes = queue.Queue(maxsize=workers * 2)
+    t0 = time.time()
 
-                    if not text:
-                        emb = [0.0] * 1536
-                    else:
-                        resp = openai.Embedding.create(model=model, input=[text])
-                        emb = resp["data"][0]["embedding"]
+    def worker():
+        while not stop.is_set():
+            with lock:
+                n = batch_size if limit is None else min(batch_size, limit - state["claimed"])
+                failed = set(state["failed"])
+            if n <= 0:
+                break
+            try:
+                rows = claim_batch(claim_sql, failed, n, lease_seconds)
+                if not rows:
+                    break
+                with lock:
+                    state["claimed"] += len(rows)
+                updates, failed_ids = embed_batch_rows(rows, model, limiter)
+            except Exception as e:
+                # kiralanan satırlar kira dolunca tekrar seçilir
+                with lock:
+                    state["errors"] += 1
+                print(f"[backfill] worker hata: {e}", file=sys.stderr, flush=True)
+                time.sleep(2)
+                continue
+            with lock:
+                state["failed"].update(failed_ids)
+            writes.put((updates, failed_ids))
 
-                    emb_str = to_pgvector(emb)
-                    cur.execute("update sreports set embedding = %s where id = %s", (emb_str, rid))
-                    total_embedded += 1
+    def writer():
+        with get_conn() as conn:
+            while True:
+                item = writes.get()
+                if item is None:
+                    break
+                updates, failed_ids = item
+                try:
+                    write_batch(conn, updates, failed_ids)
+                except Exception as e:
+                    conn.rollback()
+                    with lock:
+                        state["errors"] += 1
+                    print(f"[backfill] yazma hata ({len(updates)} satır, kira dolunca tekrar): {e}",
+                          file=sys.stderr, flush=True)
+                    continue
+                with lock:
+                    state["done"] += len(updates)
 
-            conn.commit()
+    def reporter():
+        last_t, last_done = t0, 0
+        while not stop.wait(report_every):
+            now = time.time()
+            with lock:
+                done, nfail = state["done"], len(state["failed"])
+            rate = (done - last_done) / max(now - last_t, 1e-9)
+            avg = done / max(now - t0, 1e-9)
+            eta = (target - done) / avg if avg > 0 else float("inf")
+            eta_s = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "?"
+            print(f"[{time.strftime('%H:%M:%S')}] {done}/{target} | {rate:.1f}/s (avg {avg:.1f}/s) | "
+                  f"failed {nfail} | ETA {eta_s}", flush=True)
+            last_t, last_done = now, done
 
-        print(f"[{time.strftime('%H:%M:%S')}] batch ok: {len(rows)} | total_embedded: {total_embedded}")
-        if limit is not None and total_embedded >= limit:
-            break
+    threads = [threading.Thread(target=worker, name=f"backfill-{i}") for i in range(workers)]
+    wr = threading.Thread(target=writer, name="backfill-writer")
+    rep = threading.Thread(target=reporter, daemon=True)
+    rep.start()
+    wr.start()
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        # kuyruktaki yazılar bitsin; kiralı kalanlar kira dolunca tekrar seçilir
+        stop.set()
+        for t in threads:
+            t.join()
+    writes.put(None)
+    wr.join()
+    stop.set()
 
     dt = time.time() - t0
-    print(f"\nDONE. embedded={total_embedded} in {dt:.1f}s\n")
+    print(f"\nDONE. embedded={state['done']} failed={len(state['failed'])} errors={state['errors']} in {dt:.1f}s "
+          f"({state['done'] / max(dt, 1e-9):.1f}/s)\n")
     summary()
 
 def main():
@@ -130,12 +258,21 @@ def main():
     parser.add_argument("--batch-size", type=int, default=200)
     parser.add_argument("--limit", type=int, default=None, help="Bu kadar kaydı işle ve çık (opsiyonel)")
     parser.add_argument("--model", type=str, default="text-embedding-3-small")
+    parser.add_argument("--workers", type=int, default=1, help="Paralel backfill worker sayısı")
+    parser.add_argument("--rpm", type=int, default=None, help="OpenAI istek/dakika limiti")
+    parser.add_argument("--tpm", type=int, default=None, help="OpenAI token/dakika limiti")
+    parser.add_argument("--lease-seconds", type=int, default=600,
+                        help="Kiralanan satır bu süre içinde yazılmazsa (süreç öldü) tekrar seçilir")
     args = parser.parse_args()
 
+    # claim başına kısa bağlantı + writer + embedding cache için pay
+    os.environ.setdefault("DB_POOL_MAX", str(args.workers * 2 + 2))
+
     if args.summary:
         summary(); return
     if args.backfill:
-        backfill(batch_size=args.batch_size, limit=args.limit, model=args.model); return
+        backfill(workers=max(1, args.workers), batch_size=args.batch_size, limit=args.limit, model=args.model,
+                 rpm=args.rpm, tpm=args.tpm, lease_seconds=args.lease_seconds); return
 
     summary()
 
@@ -0,0 +1,152 @@
+# scripts/embedding_snapshot.py
+# Embedding'leri worker'ların np.memmap ile açacağı bir snapshot klasörüne yazar (vector_index.py).
+# Aynı makinedeki tüm gunicorn worker'ları matrisi OS page cache'inden paylaşır; açılışta DB'den
+# JSONB embedding okunup çözülmez, sadece snapshot'tan sonraki satırlar (watermark) çekilir.
+#   build: sreports (ya da --passages ile sreport_passages) -> yeni snap-<ts>/ + CURRENT
+#   delta: snapshot watermark'ından sonra eklenen / embed edilen satırları (embedded_at, watermark.py)
+#          delta log'a ekler (rebuild gerekmez)
+#   info:  CURRENT snapshot'ın özeti
+# Delta büyüdükçe (ör. satırların %20'si) yeniden build edilmesi önerilir; IVF tail'i tam taranır.
+#
+# Kullanım:
+#   python scripts/embedding_snapshot.py build
+#   python scripts/embedding_snapshot.py build --dtype float16 --nlist 1024
+#   python scripts/embedding_snapshot.py build --dtype int8      # + exact.npy (rerank için, sadece disk)
+#   python scripts/embedding_snapshot.py build --passages        # -> data/passage_snapshot
+#   python scripts/embedding_snapshot.py delta                   # cron ile periyodik
+#   python scripts/embedding_snapshot.py info
+#
+# Gerekli env:
+#   DATABASE_URL
+# app.py tarafı: EMB_SNAPSHOT_DIR (data/emb_snapshot), PASSAGE_SNAPSHOT_DIR (data/passage_snapshot)
+
+import os, sys, json, time, argparse
+import psycopg2.extras as extras
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import script_conn as get_conn
+from vector_index import EmbeddingIndex, SNAPSHOT_DTYPES
+import report_meta
+import watermark as wmark
+
+REPORT_SQL = """
+    select id::text as id, method, embedding_q,
+           case when embedding_q is null then embedding end as embedding, created_at, embedded_at,
+           occurred_on, aerodrome, province, aircraft, phase from sreports
+    where embedding is not null {where}
+    order by embedded_at
+"""
+
+PASSAGE_SQL = """
+    select p.report_id::text || ':' || p.ord as id, s.method, p.embedding_q,
+           case when p.embedding_q is null then p.embedding end as embedding, p.created_at, p.embedded_at,
+           s.occurred_on, s.aerodrome, s.province, s.aircraft, s.phase
+    from sreport_passages p join sreports s on s.id = p.report_id
+    where p.embedding is not null {where}
+    order by p.embedded_at
+"""
+
+def iter_rows(conn, passages=False, since=None):
+    col = "p.embedded_at" if passages else "embedded_at"
+    sql = (PASSAGE_SQL if passages else REPORT_SQL).format(where=f"and {col} > %s" if since else "")
+    with conn.cursor(name="emb_snapshot", cursor_factory=extras.DictCursor) as cur:
+        cur.itersize = 2000
+        cur.execute(sql, (since,) if since else None)
+        for r in cur:
+            yield r
+
+def tracked(rows, watermark, recent=None):
+    """(id, method, embedding, meta) üretir; watermark[0] en büyük embedded_at olur.
+    recent ({id: damga str}) verilirse OVERLAP penceresinde zaten yazılmış (id, damga) atlanır."""
+    for r in rows:
+        ts = r["embedded_at"]
+        if recent is not None and ts is not None:
+            if recent.get(r["id"]) == str(ts):
+                continue
+            recent[r["id"]] = str(ts)
+        if ts and (watermark[0] is None or ts > watermark[0]):
+            watermark[0] = ts
+        emb = r["embedding_q"] if r["embedding_q"] is not None else r["embedding"]
+        yield r["id"], r["method"], emb, report_meta.row_meta(r)
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def cmd_build(args):
+    t0 = time.time()
+    index = EmbeddingIndex(dim=args.dim)
+    watermark = [None]
+    with get_conn() as conn:
+        index.load(tracked(iter_rows(conn, args.passages), watermark))
+    print(f"[{time.strftime('%H:%M:%S')}] loaded: {len(index)} vectors in {time.time()-t0:.1f}s")
+    if args.nlist != 0 and len(index) >= args.min_rows:
+        t1 = time.time()
+        index.train(nlist=args.nlist, iters=args.iters)
+        print(f"[{time.strftime('%H:%M:%S')}] trained: nlist={len(index._lists)} in {time.time()-t1:.1f}s")
+    path = index.save_snapshot(args.dir, meta={"watermark": watermark[0], "watermark_kind": wmark.KIND,
+                                                      "passages": args.passages},
+                               dtype=args.dtype, keep=args.keep, exact=not args.no_exact)
+    print(f"\nDONE. {path} ({dir_size(path)/1e6:.1f} MB, {args.dtype})\n")
+
+def cmd_delta(args):
+    path = EmbeddingIndex.snapshot_path(args.dir)
+    if path is None:
+        print(f"ERROR: {args.dir} altında snapshot yok; önce build.", file=sys.stderr); sys.exit(1)
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("watermark_kind") != wmark.KIND:
+        print(f"ERROR: {path} created_at watermark'lı (eski); yeniden build edin.", file=sys.stderr); sys.exit(1)
+    state = {"watermark": meta.get("watermark"), "recent": {}}
+    if os.path.exists(os.path.join(path, "delta.json")):
+        with open(os.path.join(path, "delta.json"), encoding="utf-8") as f:
+            state.update({k: v for k, v in json.load(f).items() if k in ("watermark", "recent") and v})
+    watermark = [None]
+    recent = state["recent"]
+    with get_conn() as conn:
+        since = wmark.since(state["watermark"])
+        rows = list(tracked(iter_rows(conn, meta.get("passages", False), since), watermark, recent))
+    low = wmark.since(watermark[0] or state["watermark"])
+    recent = {rid: ts for rid, ts in recent.items() if low is not None and ts > str(low)}
+    added = EmbeddingIndex.append_delta(args.dir, rows, watermark[0], dim=meta.get("dim", args.dim), recent=recent)
+    print(f"[{time.strftime('%H:%M:%S')}] delta: +{added} rows (since {state['watermark']})")
+
+def cmd_info(args):
+    path = EmbeddingIndex.snapshot_path(args.dir)
+    if path is None:
+        print(f"{args.dir}: snapshot yok"); return
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    delta = {"rows": 0, "watermark": None}
+    if os.path.exists(os.path.join(path, "delta.json")):
+        with open(os.path.join(path, "delta.json"), encoding="utf-8") as f:
+            delta = json.load(f)
+    print(f"snapshot : {path} ({dir_size(path)/1e6:.1f} MB)")
+    print(f"rows     : {meta['n']} ({meta['dtype']}, dim={meta['dim']}, ivf_rows={meta.get('trained_n', 0)})")
+    print(f"watermark: {meta.get('watermark')}")
+    print(f"delta    : {delta['rows']} rows, watermark {delta.get('watermark')}")
+    if meta["n"] and delta["rows"] > 0.2 * meta["n"]:
+        print("öneri    : delta satırların %20'sini geçti, yeniden build edin")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["build", "delta", "info"])
+    parser.add_argument("--dir", type=str, default=None, help="Varsayılan data/emb_snapshot (--passages: data/passage_snapshot)")
+    parser.add_argument("--passages", action="store_true", help="Rapor yerine parça (sreport_passages) snapshot'ı")
+    parser.add_argument("--dtype", choices=SNAPSHOT_DTYPES, default="float32",
+                        help="float16 / int8 taranan matrisi (page cache) 2x / ~4x küçültür")
+    parser.add_argument("--no-exact", action="store_true", help="Kuantize dtype'ta exact.npy yazma (rerank kapalı olur)")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF küme sayısı (0: IVF yok)")
+    parser.add_argument("--iters", type=int, default=10, help="k-means iterasyonu")
+    parser.add_argument("--min-rows", type=int, default=int(os.getenv("ANN_MIN_ROWS", "5000")), help="Bunun altında IVF kurulmaz")
+    parser.add_argument("--keep", type=int, default=2, help="Tutulacak snapshot sayısı (eski worker'lar için)")
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+    if args.dir is None:
+        args.dir = os.path.join(ROOT, "data", "passage_snapshot" if args.passages else "emb_snapshot")
+    {"build": cmd_build, "delta": cmd_delta, "info": cmd_info}[args.command](args)
+
+if __name__ == "__main__":
+    main()
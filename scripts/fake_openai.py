@@ -0,0 +1,142 @@
+# scripts/fake_openai.py
+# Offline test için OpenAI yerine geçen küçük HTTP sunucu.
+#   POST /v1/embeddings        -> metnin sha256'sından türetilen deterministik vektör
+#   POST /v1/chat/completions  -> sabit, markdown formatlı analiz ("stream": true ise SSE chunk'ları)
+# Kullanım:
+#   python scripts/fake_openai.py --port 8089 --latency-ms 50 --rate-limit-every 10
+#   OPENAI_API_BASE=http://127.0.0.1:8089/v1 OPENAI_API_KEY=test python scripts/check_embeddings.py --backfill
+#   python scripts/fake_openai.py --token-ms 30   # stream=True'da kelime başına gecikme (time-to-first-token testi)
+
+import re, sys, json, time, hashlib, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+CANNED = """### Incident Summary
+- Simulated analysis produced by scripts/fake_openai.py.
+
+### Root Cause Analysis
+- Placeholder root cause.
+
+### Short-term Solution (7 days)
+- Placeholder action.
+
+### Long-term Solution (30 days)
+- Placeholder strategy.
+
+### Severity Level
+- Minor
+"""
+
+def fake_vector(text, dim=1536):
+    seed = int.from_bytes(hashlib.sha256((text or "").encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (v / (np.linalg.norm(v) or 1.0)).tolist()
+
+class Handler(BaseHTTPRequestHandler):
+    opts = None
+    counter = 0
+    lock = threading.Lock()
+
+    def log_message(self, fmt, *args):
+        if self.opts.verbose:
+            super().log_message(fmt, *args)
+
+    def _json(self, code, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_chat(self, req):
+        """OpenAI chat.completion.chunk formatında SSE; bağlantı kapanınca akış biter (HTTP/1.0)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send(delta, finish=None):
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": req.get("model"), "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send({"role": "assistant"})
+        for tok in re.findall(r"\S+\s*", CANNED):
+            if self.opts.token_ms:
+                time.sleep(self.opts.token_ms / 1000.0)
+            send({"content": tok})
+        send({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _rate_limited(self):
+        every = self.opts.rate_limit_every
+        if not every:
+            return False
+        with Handler.lock:
+            Handler.counter += 1
+            n = Handler.counter
+        if n % every:
+            return False
+        self._json(429, {"error": {"message": "Rate limit reached (fake)", "type": "requests",
+                                   "code": "rate_limit_exceeded"}}, {"Retry-After": "1"})
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        req = json.loads(self.rfile.read(length) or b"{}")
+        if self.opts.latency_ms:
+            time.sleep(self.opts.latency_ms / 1000.0)
+        if self._rate_limited():
+            return
+
+        if self.path.rstrip("/").endswith("/embeddings"):
+            inputs = req.get("input")
+            inputs = [inputs] if isinstance(inputs, str) else list(inputs or [])
+            if any(not isinstance(t, str) or not t for t in inputs):
+                return self._json(400, {"error": {"message": "'$.input' is invalid (fake)", "type": "invalid_request_error"}})
+            dim = int(req.get("dimensions") or self.opts.dim)
+            data = [{"object": "embedding", "index": i, "embedding": fake_vector(t, dim)} for i, t in enumerate(inputs)]
+            tokens = sum(len(t) // 4 + 1 for t in inputs)
+            return self._json(200, {"object": "list", "data": data, "model": req.get("model"),
+                                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            if req.get("stream"):
+                return self._stream_chat(req)
+            return self._json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                "model": req.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": CANNED}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        self._json(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency-ms", type=int, default=0, help="Her isteğe eklenen gecikme")
+    parser.add_argument("--token-ms", type=int, default=0, help="stream=True'da her parça arası gecikme")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Her N. isteğe 429 döndür")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    Handler.opts = args
+    srv = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"fake OpenAI on http://{args.host}:{args.port}/v1", file=sys.stderr, flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
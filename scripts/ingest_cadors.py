@@ -4,6 +4,10 @@
 #
 # Kullanım (Railway veya lokal):
 #   python scripts/ingest_cadors.py --csv data/cadors_last24m.csv --embed --max-rows 100000 --reembed --reembed-max 25000
+#   python scripts/ingest_cadors.py --csv data/cadors_last24m.csv --bulk --chunk-size 5000
+#     (bulk: COPY + set-based dedup, embedding yok; sonra check_embeddings.py --backfill --workers N)
+#   python scripts/ingest_cadors.py --csv data/cadors_last24m.csv --bulk --resume
+#     (her chunk'tan sonra byte offset + son CADORS no checkpoint'e yazılır; --resume oradan devam eder)
 #
 # Notlar:
 # - Aynı CADORS numarasını ikinci kez eklememek için "cadors_index" tablosu kullanılır.
@@ -12,9 +16,18 @@
 # - Embedding için önce env'deki OPENAI_API_KEY'i kullanır; yoksa "config.py" dosyası varsa oradan alır.
 # - --embed verilmezse embedding atlanır. --reembed ile var olan CADORS kayıtlarının boş embeddingleri sonradan doldurulur.
 
-import os, sys, csv, json, uuid, argparse, datetime as dt
+import os, io, sys, csv, json, time, uuid, argparse, datetime as dt
 import psycopg2, psycopg2.extras
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import get_pool
+from chunking import document_embedding, embed_documents
+import report_fields
+import report_meta
+
 # --- OpenAI (eski 0.28 sürümü ile uyumlu) ---
 try:
     import openai
@@ -42,29 +55,33 @@ if not DB_URL:
 
 # --------- SQL helpers ----------
 def get_conn():
-    return psycopg2.connect(DB_URL, sslmode="require")
+    """Paylaşılan havuzdan bağlantı (db.py); `with get_conn() as conn:` ile kullanılır."""
+    return get_pool(DB_URL).connection()
 
 def init_cadors_tables():
     """cadors_index tablosu (mapping) yoksa oluşturur."""
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS cadors_index (
-        cadors_no TEXT PRIMARY KEY,
-        sreports_id UUID NOT NULL,
-        created_at TIMESTAMP DEFAULT NOW()
-    );
-    """)
-    conn.commit()
-    cur.close(); conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS cadors_index (
+            cadors_no TEXT PRIMARY KEY,
+            sreports_id UUID NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """)
+        conn.commit()
+        cur.close()
+        # sreports.keywords / incident_summary / snippet (benzer vaka kartı için)
+        report_fields.ensure_columns(conn)
+        # occurred_on / aerodrome / province / aircraft / phase (filtreli benzer arama)
+        report_meta.ensure_columns(conn)
 
 # --------- Embedding ----------
 def get_embedding(text: str):
     if (not openai) or (not API_KEY):
         raise RuntimeError("OpenAI embeddings unavailable (package or API key missing)")
-    # Aynı modeli app.py'dekiyle uyumlu tutalım
-    resp = openai.Embedding.create(model="text-embedding-3-small", input=text)
-    return resp["data"][0]["embedding"]
+    # Aynı modeli app.py'dekiyle uyumlu tutalım; aynı anlatı ikinci kez embed edilmez (embedding_cache)
+    return document_embedding(text, model="text-embedding-3-small")
 
 # --------- CSV -> metin ----------
 def build_report_text(row: dict) -> str:
@@ -107,8 +124,12 @@ def build_report_text(row: dict) -> str:
     return "\n".join([p for p in parts if p]).strip()
 
 # --------- Upsert tek kayıt ----------
-def upsert_cadors_row(conn, row: dict, do_embed: bool):
-    cad_no = (row.get("Cadors Number") or row.get("CADORS Number") or row.get("Cadors #") or "(unknown)").strip()
+def cadors_no_of(row: dict) -> str:
+    return (row.get("Cadors Number") or row.get("CADORS Number") or row.get("Cadors #") or "(unknown)").strip()
+
+def upsert_cadors_row(conn, row: dict, do_embed: bool, emb=None):
+    """emb verilirse (batch ile önceden alınmış) tekrar embed edilmez."""
+    cad_no = cadors_no_of(row)
     rid = uuid.uuid4()
 
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
@@ -121,8 +142,7 @@ def upsert_cadors_row(conn, row: dict, do_embed: bool):
 
     text = build_report_text(row)
 
-    emb = None
-    if do_embed:
+    if emb is None and do_embed:
         try:
             emb = get_embedding(text)
         except Exception as e:
@@ -130,17 +150,199 @@ def upsert_cadors_row(conn, row: dict, do_embed: bool):
             print(f"[WARN] embedding failed for {cad_no}: {e}", file=sys.stderr)
             emb = None
 
+    keywords, summary, snippet = report_fields.derive(text, "")
+    meta = report_meta.from_cadors_row(row)
     cur.execute("""
-        INSERT INTO sreports (id, method, lang, report_text, result_text, embedding)
-        VALUES (%s, %s, %s, %s, %s, %s);
-    """, (str(rid), "Imported (CADORS)", "English", text, "", json.dumps(emb) if emb is not None else None))
+        INSERT INTO sreports (id, method, lang, report_text, result_text, embedding, keywords, incident_summary, snippet,
+                              occurred_on, aerodrome, province, aircraft, phase)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+    """, (str(rid), "Imported (CADORS)", "English", text, "", json.dumps(emb) if emb is not None else None,
+          keywords, summary, snippet,
+          meta["occurred_on"], meta["aerodrome"], meta["province"], meta["aircraft"], meta["phase"]))
     cur.execute("INSERT INTO cadors_index (cadors_no, sreports_id) VALUES (%s, %s);", (cad_no, str(rid)))
     conn.commit()
     cur.close()
     return True, str(rid)
 
+def embed_new_rows(conn, rows):
+    """Chunk içindeki yeni (cadors_index'te olmayan) satırları tek batch'te embed eder: {cadors_no: emb}."""
+    nos = [cadors_no_of(r) for r in rows]
+    cur = conn.cursor()
+    cur.execute("SELECT cadors_no FROM cadors_index WHERE cadors_no = ANY(%s);", (nos,))
+    seen = {r[0] for r in cur.fetchall()}
+    cur.close()
+    todo = {}
+    for no, r in zip(nos, rows):
+        if no not in seen and no not in todo:
+            todo[no] = build_report_text(r)
+    if not todo:
+        return {}
+    embs = embed_documents(list(todo.values()), model="text-embedding-3-small")
+    return {no: emb for no, emb in zip(todo, embs) if emb is not None}
+
+# --------- Bulk (COPY) import ----------
+STAGE_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS cadors_stage (
+    cadors_no TEXT,
+    id UUID,
+    report_text TEXT,
+    keywords TEXT[],
+    incident_summary TEXT,
+    snippet TEXT,
+    occurred_on DATE,
+    aerodrome TEXT,
+    province TEXT,
+    aircraft TEXT,
+    phase TEXT
+) ON COMMIT DELETE ROWS;
+"""
+
+# Tek set-based anti-join: cadors_index'te olmayanlar hem sreports'a hem cadors_index'e
+BULK_INSERT_SQL = """
+WITH new AS (
+    SELECT DISTINCT ON (s.cadors_no) s.cadors_no, s.id, s.report_text, s.keywords, s.incident_summary, s.snippet,
+           s.occurred_on, s.aerodrome, s.province, s.aircraft, s.phase
+    FROM cadors_stage s
+    WHERE NOT EXISTS (SELECT 1 FROM cadors_index c WHERE c.cadors_no = s.cadors_no)
+    ORDER BY s.cadors_no
+), ins AS (
+    INSERT INTO sreports (id, method, lang, report_text, result_text, embedding, keywords, incident_summary, snippet,
+                          occurred_on, aerodrome, province, aircraft, phase)
+    SELECT id, 'Imported (CADORS)', 'English', report_text, '', NULL, keywords, incident_summary, snippet,
+           occurred_on, aerodrome, province, aircraft, phase FROM new
+)
+INSERT INTO cadors_index (cadors_no, sreports_id)
+SELECT cadors_no, id FROM new;
+"""
+
+def copy_chunk(conn, rows):
+    """Chunk'ı staging'e COPY eder ve iki tabloya yazar (commit çağırana ait). Eklenen satır sayısını döner."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for row in rows:
+        text = build_report_text(row)
+        keywords, summary, snippet = report_fields.derive(text, "")
+        meta = report_meta.from_cadors_row(row)
+        # keywords [A-Za-z]{4,}: dizi literal'inde tırnak gerekmez; None -> boş alan -> NULL
+        w.writerow([cadors_no_of(row), str(uuid.uuid4()), text, "{" + ",".join(keywords) + "}", summary, snippet,
+                    meta["occurred_on"], meta["aerodrome"], meta["province"], meta["aircraft"], meta["phase"]])
+    buf.seek(0)
+    cur = conn.cursor()
+    cur.execute(STAGE_DDL)
+    cur.copy_expert("COPY cadors_stage (cadors_no, id, report_text, keywords, incident_summary, snippet, "
+                    "occurred_on, aerodrome, province, aircraft, phase) FROM STDIN WITH (FORMAT csv)", buf)
+    cur.execute(BULK_INSERT_SQL)
+    n = cur.rowcount
+    cur.close()
+    return n
+
+# --------- Streaming CSV + checkpoint ----------
+CHECKPOINT_DDL = """
+CREATE TABLE IF NOT EXISTS cadors_ingest_checkpoint (
+    source TEXT PRIMARY KEY,
+    byte_offset BIGINT NOT NULL,
+    rows_done BIGINT NOT NULL,
+    last_cadors_no TEXT,
+    header JSONB,
+    file_size BIGINT,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+"""
+
+def load_checkpoint(conn, source):
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur.execute(CHECKPOINT_DDL)
+    cur.execute("SELECT byte_offset, rows_done, last_cadors_no, header, file_size "
+                "FROM cadors_ingest_checkpoint WHERE source=%s;", (source,))
+    row = cur.fetchone()
+    conn.commit(); cur.close()
+    return dict(row) if row else None
+
+def save_checkpoint(conn, source, offset, rows_done, last_no, header, file_size):
+    """Chunk verisiyle aynı transaction'da yazılır; crash'te ikisi birlikte ya var ya yok."""
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO cadors_ingest_checkpoint (source, byte_offset, rows_done, last_cadors_no, header, file_size, updated_at)
+        VALUES (%s,%s,%s,%s,%s,%s,NOW())
+        ON CONFLICT (source) DO UPDATE SET
+          byte_offset=EXCLUDED.byte_offset, rows_done=EXCLUDED.rows_done, last_cadors_no=EXCLUDED.last_cadors_no,
+          header=EXCLUDED.header, file_size=EXCLUDED.file_size, updated_at=NOW();
+    """, (source, offset, rows_done, last_no, json.dumps(header), file_size))
+    cur.close()
+
+class _ByteLines:
+    """Binary dosyadan satır satır okur, okunan byte sayısını tutar (csv.reader ileriye okumaz)."""
+    def __init__(self, f):
+        self.f = f
+        self.pos = f.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.pos += len(line)
+        return line.decode("utf-8")
+
+def iter_csv_chunks(path, chunk_size, offset=0, header=None, max_rows=None):
+    """(header, rows, end_offset) üçlüleri. offset>0 ise header checkpoint'ten gelir.
+    max_rows satır okunduktan sonra durur (fazladan satır okunmaz)."""
+    read = 0
+    with open(path, "rb") as f:
+        if offset:
+            f.seek(offset)
+        elif f.read(3) != b"\xef\xbb\xbf":  # UTF-8 BOM
+            f.seek(0)
+        lines = _ByteLines(f)
+        reader = csv.reader(lines)
+        if header is None:
+            header = next(reader, None)
+            if header is None:
+                return
+        chunk = []
+        while max_rows is None or read < max_rows:
+            rec = next(reader, None)
+            if rec is None:
+                break
+            read += 1
+            chunk.append(dict(zip(header, rec)))
+            if len(chunk) >= chunk_size:
+                yield header, chunk, lines.pos
+                chunk = []
+        if chunk:
+            yield header, chunk, lines.pos
+
+def run_import(conn, args, process_chunk):
+    """CSV'yi chunk chunk işler; her chunk'tan sonra checkpoint + commit. --resume ile kaldığı yerden."""
+    source = args.checkpoint_key or os.path.abspath(args.csv)
+    size = os.path.getsize(args.csv)
+    offset, header, rows_done = 0, None, 0
+    cp = load_checkpoint(conn, source)
+    if args.resume and cp:
+        if cp["file_size"] is not None and cp["byte_offset"] > size:
+            print(f"ERROR: checkpoint offset {cp['byte_offset']} > file size {size}; dosya değişmiş.", file=sys.stderr)
+            sys.exit(1)
+        offset, header, rows_done = cp["byte_offset"], cp["header"], cp["rows_done"]
+        print(f"[resume] {source}: {rows_done} satır zaten işlenmiş, byte {offset}'den devam "
+              f"(son CADORS {cp['last_cadors_no']})", flush=True)
+    elif args.resume:
+        print(f"[resume] {source} için checkpoint yok, baştan başlanıyor.", flush=True)
+
+    total = 0
+    t0 = time.time()
+    for header, rows, end in iter_csv_chunks(args.csv, args.chunk_size, offset, header, args.max_rows):
+        process_chunk(rows, rows_done + total)
+        total += len(rows)
+        save_checkpoint(conn, source, end, rows_done + total, cadors_no_of(rows[-1]), header, size)
+        conn.commit()
+        print(f"[chunk] {rows_done + total} satır | byte {end}/{size} | {total / max(time.time() - t0, 1e-9):.0f} satır/s",
+              flush=True)
+    return total
+
 # --------- Geriye dönük embedding ----------
-def reembed_existing(conn, limit=25000):
+def reembed_existing(conn, limit=25000, batch_size=200):
     """method='Imported (CADORS)' olan ve embedding'i boş olan raporlar için embedding üretir."""
     if (not openai) or (not API_KEY):
         print("[reembed] OpenAI key yok, atlanıyor.", flush=True)
@@ -164,17 +366,25 @@ def reembed_existing(conn, limit=25000):
 
     print(f"[reembed] başlıyor: {total} kayıt", flush=True)
     done = 0
-    for rid, txt in rows:
+    for start in range(0, total, batch_size):
+        part = rows[start:start + batch_size]
         try:
-            emb = get_embedding(txt or "")
+            embs = embed_documents([txt or "" for _, txt in part], model="text-embedding-3-small")
         except Exception as e:
-            print(f"[reembed] {rid} hata: {e}", flush=True)
+            print(f"[reembed] batch {start}-{start + len(part)} hata: {e}", flush=True)
             continue
-        cur.execute("UPDATE sreports SET embedding=%s WHERE id=%s;", (json.dumps(emb), rid))
-        done += 1
-        if done % 200 == 0:
-            conn.commit()
-            print(f"[reembed] {done}/{total}", flush=True)
+        updates = [(str(rid), json.dumps(emb)) for (rid, _), emb in zip(part, embs) if emb is not None]
+        for (rid, _), emb in zip(part, embs):
+            if emb is None:
+                print(f"[reembed] {rid} hata: embedding alınamadı", flush=True)
+        psycopg2.extras.execute_values(cur, """
+            UPDATE sreports AS s SET embedding = v.emb::jsonb
+            FROM (VALUES %s) AS v(id, emb)
+            WHERE s.id = v.id::uuid;
+        """, updates, page_size=500)
+        done += len(updates)
+        conn.commit()
+        print(f"[reembed] {done}/{total}", flush=True)
     conn.commit()
     cur.close()
     print(f"[reembed] tamamlandı: {done}/{total}", flush=True)
@@ -189,6 +399,16 @@ def parse_args():
                    help="Existing CADORS rows: backfill embeddings where missing.")
     p.add_argument("--reembed-max", type=int, default=25000,
                    help="How many existing CADORS rows to (re)embed at most.")
+    p.add_argument("--embed-batch", type=int, default=200,
+                   help="Rows per embedding batch (one OpenAI request per batch).")
+    p.add_argument("--bulk", action="store_true",
+                   help="COPY-based import with set-based dedup (no inline embeddings; --embed runs as a separate stage).")
+    p.add_argument("--chunk-size", type=int, default=None,
+                   help="Rows per chunk/checkpoint (default: 5000 with --bulk, 500 otherwise).")
+    p.add_argument("--resume", action="store_true",
+                   help="Continue from the last checkpoint for this CSV instead of the beginning.")
+    p.add_argument("--checkpoint-key", default=None,
+                   help="Checkpoint name (default: absolute CSV path).")
     return p.parse_args()
 
 # --------- Main ----------
@@ -207,32 +427,48 @@ def main():
 
     init_cadors_tables()
 
-    conn = get_conn()
-    total, inserted, skipped, dup = 0, 0, 0, 0
+    if args.chunk_size is None:
+        args.chunk_size = 5000 if args.bulk else 500
 
-    with open(args.csv, "r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            total += 1
-            if total > args.max_rows:
-                break
-            try:
-                ok, _rid = upsert_cadors_row(conn, row, do_embed=args.embed)
-                if ok:
-                    inserted += 1
-                else:
-                    dup += 1
-            except Exception as e:
-                skipped += 1
-                print(f"[WARN] insert fail (row #{total}): {e}", file=sys.stderr)
-
-    print(f"DONE. total={total} inserted={inserted} skipped={skipped} dup={dup}", flush=True)
-
-    # İstenirse mevcut CADORS kayıtlarının boş embeddinglerini doldur
-    if args.reembed:
-        reembed_existing(conn, limit=args.reembed_max)
-
-    conn.close()
+    with get_conn() as conn:
+        t0 = time.time()
+        stats = {"inserted": 0, "skipped": 0, "dup": 0}
+
+        def bulk_chunk(rows, first_no):
+            stats["inserted"] += copy_chunk(conn, rows)
+
+        def row_chunk(rows, first_no):
+            embs = {}
+            if args.embed:
+                try:
+                    embs = embed_new_rows(conn, rows)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"[WARN] batch embedding failed: {e}", file=sys.stderr)
+            for n, row in enumerate(rows, first_no + 1):
+                try:
+                    ok, _rid = upsert_cadors_row(conn, row, do_embed=False, emb=embs.get(cadors_no_of(row)))
+                    if ok:
+                        stats["inserted"] += 1
+                    else:
+                        stats["dup"] += 1
+                except Exception as e:
+                    conn.rollback()
+                    stats["skipped"] += 1
+                    print(f"[WARN] insert fail (row #{n}): {e}", file=sys.stderr)
+
+        total = run_import(conn, args, bulk_chunk if args.bulk else row_chunk)
+        if args.bulk:
+            stats["dup"] = total - stats["inserted"]
+        print(f"DONE. total={total} inserted={stats['inserted']} skipped={stats['skipped']} dup={stats['dup']} "
+              f"in {time.time() - t0:.1f}s", flush=True)
+
+        if args.bulk and args.embed and not args.reembed:
+            # Bulk'ta embedding ayrı aşama: yeni eklenen (embedding'i boş) CADORS satırları
+            reembed_existing(conn, limit=stats["inserted"], batch_size=args.embed_batch)
+        # İstenirse mevcut CADORS kayıtlarının boş embeddinglerini doldur
+        if args.reembed:
+            reembed_existing(conn, limit=args.reembed_max, batch_size=args.embed_batch)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,37 @@
+# scripts/job_worker.py
+# analysis_jobs kuyruğunu web sürecinden ayrı çalıştırır (web'de JOB_WORKERS=0 iken).
+# Kullanım:
+#   JOB_WORKERS=0 gunicorn ... app:app          # web sadece kuyruğa yazar
+#   python scripts/job_worker.py --workers 4     # işleri bu süreç yapar
+#
+# Gerekli env:
+#   DATABASE_URL, OPENAI_API_KEY
+
+import os, sys, time, argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=int(os.getenv("JOB_WORKERS") or 2))
+    parser.add_argument("--stats-every", type=float, default=60.0, help="Bu kadar saniyede bir kuyruk durumunu yaz")
+    args = parser.parse_args()
+
+    # app import'u JOB_WORKERS kadar thread başlatmasın; sayıyı --workers belirler
+    os.environ["JOB_AUTOSTART"] = "0"
+    import app  # init_db + handler kaydı
+    queue = app.get_job_queue()
+    queue.workers = max(1, args.workers)
+    queue.start()
+    print(f"[{time.strftime('%H:%M:%S')}] job worker: {queue.workers} thread", flush=True)
+    try:
+        while True:
+            time.sleep(args.stats_every)
+            print(f"[{time.strftime('%H:%M:%S')}] {queue.stats()}", flush=True)
+    except KeyboardInterrupt:
+        queue.stop()
+
+if __name__ == "__main__":
+    main()
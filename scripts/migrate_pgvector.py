@@ -0,0 +1,143 @@
+# scripts/migrate_pgvector.py
+# sreports.embedding (JSONB) -> sreports.embedding_vec vector(1536) geçişi.
+#  1) vector extension + embedding_vec kolonu
+#  2) embedding yazıldıkça embedding_vec'i dolduran trigger (app.py ve CADORS scriptleri değişmeden çalışır)
+#  3) mevcut JSONB satırlarını partiler halinde dönüştürür
+#  4) HNSW (varsayılan) veya IVFFlat cosine index
+#  Aynısı parça tablosu (sreport_passages) için de yapılır (PASSAGE_SEARCH).
+# Kullanım:
+#   python scripts/migrate_pgvector.py
+#   python scripts/migrate_pgvector.py --index ivfflat --lists 300 --batch-size 5000
+# Sonra app için: VECTOR_BACKEND=pgvector
+# pgvector >= 0.8 önerilir: scope / meta filtreli sorgularda hnsw.iterative_scan kullanılır (app.py _pg_knn);
+# daha eski sürümde filtreli sorgu k'yı dolduramazsa exact taramaya düşer (doğru ama yavaş).
+#
+# Gerekli env:
+#   DATABASE_URL
+
+import os, sys, time, argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import script_conn as get_conn
+import passages
+
+DIM = 1536
+
+SCHEMA_SQL = f"""
+CREATE EXTENSION IF NOT EXISTS vector;
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS embedding_vec vector({DIM});
+
+CREATE OR REPLACE FUNCTION sreports_sync_embedding_vec() RETURNS trigger AS $$
+BEGIN
+  IF NEW.embedding IS NOT NULL
+     AND (CASE WHEN jsonb_typeof(NEW.embedding) = 'array'
+               THEN jsonb_array_length(NEW.embedding) END) = {DIM} THEN
+    NEW.embedding_vec := (NEW.embedding::text)::vector;
+  ELSE
+    NEW.embedding_vec := NULL;
+  END IF;
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_sreports_embedding_vec ON sreports;
+CREATE TRIGGER trg_sreports_embedding_vec
+  BEFORE INSERT OR UPDATE OF embedding ON sreports
+  FOR EACH ROW EXECUTE FUNCTION sreports_sync_embedding_vec();
+"""
+
+BACKFILL_SQL = f"""
+WITH batch AS (
+  SELECT id FROM sreports
+  WHERE embedding_vec IS NULL
+    AND embedding IS NOT NULL
+    AND (CASE WHEN jsonb_typeof(embedding) = 'array'
+              THEN jsonb_array_length(embedding) END) = {DIM}
+  LIMIT %s
+)
+UPDATE sreports s SET embedding_vec = (s.embedding::text)::vector
+FROM batch WHERE s.id = batch.id;
+"""
+
+# Parçalar: aynı trigger fonksiyonu (NEW.embedding -> NEW.embedding_vec)
+PASSAGE_SCHEMA_SQL = f"""
+ALTER TABLE sreport_passages ADD COLUMN IF NOT EXISTS embedding_vec vector({DIM});
+DROP TRIGGER IF EXISTS trg_passages_embedding_vec ON sreport_passages;
+CREATE TRIGGER trg_passages_embedding_vec
+  BEFORE INSERT OR UPDATE OF embedding ON sreport_passages
+  FOR EACH ROW EXECUTE FUNCTION sreports_sync_embedding_vec();
+"""
+
+PASSAGE_BACKFILL_SQL = f"""
+WITH batch AS (
+  SELECT report_id, ord FROM sreport_passages
+  WHERE embedding_vec IS NULL
+    AND embedding IS NOT NULL
+    AND (CASE WHEN jsonb_typeof(embedding) = 'array'
+              THEN jsonb_array_length(embedding) END) = {DIM}
+  LIMIT %s
+)
+UPDATE sreport_passages p SET embedding_vec = (p.embedding::text)::vector
+FROM batch WHERE p.report_id = batch.report_id AND p.ord = batch.ord;
+"""
+
+def migrate(batch_size=5000, index="hnsw", m=16, ef_construction=64, lists=100):
+    t0 = time.time()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SCHEMA_SQL)
+        conn.commit()
+        passages.ensure_schema(conn)
+        with conn.cursor() as cur:
+            cur.execute(PASSAGE_SCHEMA_SQL)
+        conn.commit()
+        print("[schema] extension, kolonlar ve trigger'lar hazır.", flush=True)
+
+        total = 0
+        for label, sql in (("sreports", BACKFILL_SQL), ("passages", PASSAGE_BACKFILL_SQL)):
+            while True:
+                with conn.cursor() as cur:
+                    cur.execute(sql, (batch_size,))
+                    n = cur.rowcount
+                conn.commit()
+                total += n
+                print(f"[{time.strftime('%H:%M:%S')}] {label} converted: {n} | total: {total}", flush=True)
+                if n < batch_size:
+                    break
+
+        # Index'i backfill'den sonra kurmak çok daha hızlı
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for name, table in (("idx_sreports_embedding_vec", "sreports"),
+                                ("idx_passages_embedding_vec", "sreport_passages")):
+                cur.execute(f"DROP INDEX IF EXISTS {name};")
+                if index == "ivfflat":
+                    cur.execute(
+                        f"CREATE INDEX {name} ON {table} "
+                        "USING ivfflat (embedding_vec vector_cosine_ops) WITH (lists = %s);", (lists,))
+                else:
+                    cur.execute(
+                        f"CREATE INDEX {name} ON {table} "
+                        "USING hnsw (embedding_vec vector_cosine_ops) WITH (m = %s, ef_construction = %s);",
+                        (m, ef_construction))
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_sreports_method ON sreports(method);")
+            cur.execute("ANALYZE sreports;")
+            cur.execute("ANALYZE sreport_passages;")
+    print(f"\nDONE. converted={total} index={index} in {time.time()-t0:.1f}s\n")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--index", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--m", type=int, default=16, help="HNSW m")
+    parser.add_argument("--ef-construction", type=int, default=64, help="HNSW ef_construction")
+    parser.add_argument("--lists", type=int, default=100, help="IVFFlat lists (~rows/1000)")
+    args = parser.parse_args()
+    migrate(batch_size=args.batch_size, index=args.index, m=args.m,
+            ef_construction=args.ef_construction, lists=args.lists)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# scripts/quantize_embeddings.py
+# sreports.embedding_q (ya da --passages ile sreport_passages.embedding_q) kolonunu JSONB embedding'den
+# doldurur (quantize.py). Index yüklemesi (app.py, build_ann_index.py, embedding_snapshot.py) embedding_q
+# varsa JSONB'yi hiç okumaz: int8'de satır başına ~1.5 KB, JSONB ~20-30 KB.
+# Analiz ile eklenen raporlar kolonu kendisi doldurur; ingest_cadors / check_embeddings ile gelenler için
+# bu script (ör. embedding_snapshot.py delta'dan önce) periyodik çalıştırılabilir.
+# Kullanım:
+#   python scripts/quantize_embeddings.py
+#   python scripts/quantize_embeddings.py --mode float16 --all     # kodlama değişti: hepsini yeniden yaz
+#   python scripts/quantize_embeddings.py --passages --batch-size 5000
+#
+# Gerekli env:
+#   DATABASE_URL
+
+import os, sys, json, time, argparse
+import psycopg2
+import psycopg2.extras as extras
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import script_conn as get_conn
+import passages
+import quantize
+
+# keyset: raporlarda id, parçalarda (report_id, ord)
+REPORT_SQL = """
+SELECT id, embedding FROM sreports
+WHERE id > %s AND embedding IS NOT NULL {missing}
+ORDER BY id
+LIMIT %s;
+"""
+
+PASSAGE_SQL = """
+SELECT report_id, ord, embedding FROM sreport_passages
+WHERE (report_id, ord) > (%s, %s) AND embedding IS NOT NULL {missing}
+ORDER BY report_id, ord
+LIMIT %s;
+"""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=quantize.MODES, default=quantize.EMBED_STORAGE)
+    parser.add_argument("--passages", action="store_true", help="sreport_passages.embedding_q")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Batch başına satır")
+    parser.add_argument("--limit", type=int, default=None, help="Bu kadar satırı işle ve çık")
+    parser.add_argument("--all", action="store_true", help="Dolu olanlar dahil hepsini yeniden kodla")
+    args = parser.parse_args()
+
+    missing = "" if args.all else "AND embedding_q IS NULL"
+    sql = (PASSAGE_SQL if args.passages else REPORT_SQL).format(missing=missing)
+    last = ("00000000-0000-0000-0000-000000000000", -1) if args.passages else ("00000000-0000-0000-0000-000000000000",)
+    done = json_bytes = q_bytes = 0
+    t0 = time.time()
+    with get_conn() as conn:
+        if args.passages:
+            passages.ensure_schema(conn)
+        else:
+            quantize.ensure_columns(conn)
+        while args.limit is None or done < args.limit:
+            n = args.batch_size if args.limit is None else min(args.batch_size, args.limit - done)
+            cur = conn.cursor()
+            cur.execute(sql, last + (n,))
+            rows = cur.fetchall()
+            if not rows:
+                cur.close()
+                break
+            values = []
+            for *key, emb in rows:
+                if isinstance(emb, str):
+                    emb = json.loads(emb)
+                blob = quantize.encode(emb, args.mode)
+                json_bytes += len(json.dumps(emb))
+                q_bytes += len(blob)
+                values.append((*key, psycopg2.Binary(blob)))
+            if args.passages:
+                extras.execute_values(cur, """
+                    UPDATE sreport_passages AS p SET embedding_q = v.q
+                    FROM (VALUES %s) AS v(report_id, ord, q)
+                    WHERE p.report_id = v.report_id::uuid AND p.ord = v.ord
+                """, values, page_size=500)
+            else:
+                extras.execute_values(cur, """
+                    UPDATE sreports AS s SET embedding_q = v.q
+                    FROM (VALUES %s) AS v(id, q)
+                    WHERE s.id = v.id::uuid
+                """, values, page_size=500)
+            conn.commit(); cur.close()
+            last = tuple(rows[-1][:-1])
+            done += len(rows)
+            rate = done / max(time.time() - t0, 1e-9)
+            print(f"[{time.strftime('%H:%M:%S')}] satırlar: {done} | {rate:.0f} satır/s", flush=True)
+    ratio = json_bytes / max(q_bytes, 1)
+    print(f"\nDONE. rows={done} in {time.time()-t0:.1f}s | JSON {json_bytes/1e6:.1f} MB -> "
+          f"{args.mode} {q_bytes/1e6:.1f} MB ({ratio:.1f}x)\n")
+
+if __name__ == "__main__":
+    main()
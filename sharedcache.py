@@ -0,0 +1,294 @@
+# sharedcache.py
+# Worker'lar arası paylaşılan cache katmanı (anahtar -> bayt, TTL'li) + sayaçlar.
+# gunicorn -w N ile her worker kendi süreç içi cache'ini tutar; bu katman aynı makinedeki
+# (sqlite) ya da tüm makinelerdeki (postgres) worker'ların ortak ikinci seviyesidir.
+# Kullananlar: pdf_store.py (PDF_STORE_BACKEND=shared), similar_cache.py, embeddings.py.
+#
+# Backend'ler:
+#   memory (varsayılan): süreç içi; shared=False, kullanan modüller ikinci seviyeyi atlar
+#   sqlite: CACHE_SQLITE_PATH'te WAL modunda tek dosya; thread başına bağlantı
+#   postgres: UNLOGGED shared_cache tablosu (WAL yazmaz, crash'te boşalır — cache için yeterli)
+#
+# Env:
+#   CACHE_BACKEND (memory), CACHE_SQLITE_PATH (data/shared_cache.sqlite3)
+#   CACHE_MAX_BYTES (512 MB; sqlite/memory üst sınırı, aşılınca süresi en yakın olanlar silinir)
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import psycopg2
+import psycopg2.extras
+
+from db import get_conn
+
+_PURGE_EVERY = 500  # bu kadar yazmada bir süresi geçenler ve boyut sınırı
+
+
+class MemoryBackend:
+    """Süreç içi; paylaşılmaz. API diğer backend'lerle aynı."""
+    shared = False
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # (ns, key) -> (value, expires_at)
+        self._size = 0
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, ns, key):
+        with self._lock:
+            ent = self._data.get((ns, key))
+            if ent is None:
+                return None
+            if ent[1] < time.time():
+                del self._data[(ns, key)]
+                self._size -= len(ent[0])
+                return None
+            self._data.move_to_end((ns, key))
+            return ent[0]
+
+    def get_many(self, ns, keys):
+        out = {}
+        for k in keys:
+            v = self.get(ns, k)
+            if v is not None:
+                out[k] = v
+        return out
+
+    def set(self, ns, key, value, ttl):
+        with self._lock:
+            old = self._data.pop((ns, key), None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._data[(ns, key)] = (bytes(value), time.time() + ttl)
+            self._size += len(value)
+            while self._size > self.max_bytes and self._data:
+                _, (v, _) = self._data.popitem(last=False)
+                self._size -= len(v)
+
+    def set_many(self, ns, items, ttl):
+        for k, v in items:
+            self.set(ns, k, v, ttl)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def incr(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._counters[name]
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "items": len(self._data), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+class SQLiteBackend:
+    """Aynı makinedeki süreçler arası; tek dosya, WAL (okuyucular yazanı beklemez)."""
+    shared = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache (
+        ns TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value BLOB NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (ns, key)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires_at);
+    CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, n INTEGER NOT NULL);
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        # thread başına bağlantı; fork sonrası (gunicorn) yeniden açılır
+        c = getattr(self._local, "conn", None)
+        if c is None or self._local.pid != os.getpid():
+            c = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            c.execute("PRAGMA journal_mode=WAL;")
+            c.execute("PRAGMA synchronous=NORMAL;")
+            self._local.conn, self._local.pid = c, os.getpid()
+        return c
+
+    def get(self, ns, key):
+        row = self._conn().execute("SELECT value FROM cache WHERE ns=? AND key=? AND expires_at > ?;",
+                                   (ns, key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, ns, keys):
+        keys = list(keys)
+        out, now = {}, time.time()
+        for i in range(0, len(keys), 500):  # SQLITE_MAX_VARIABLE_NUMBER altında
+            part = keys[i:i + 500]
+            q = ",".join("?" * len(part))
+            for k, v in self._conn().execute(f"SELECT key, value FROM cache WHERE ns=? AND expires_at > ? AND key IN ({q});",
+                                             [ns, now] + part):
+                out[k] = v
+        return out
+
+    def set(self, ns, key, value, ttl):
+        self.set_many(ns, [(key, value)], ttl)
+
+    def set_many(self, ns, items, ttl):
+        exp = time.time() + ttl
+        rows = [(ns, k, sqlite3.Binary(v), exp) for k, v in items]
+        if not rows:
+            return
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE;")
+        try:
+            c.executemany("INSERT OR REPLACE INTO cache (ns, key, value, expires_at) VALUES (?,?,?,?);", rows)
+            c.execute("COMMIT;")
+        except Exception:
+            c.execute("ROLLBACK;")
+            raise
+        with self._lock:
+            self._writes += len(rows)
+            purge = self._writes >= _PURGE_EVERY
+            if purge:
+                self._writes = 0
+        if purge:
+            self._purge()
+
+    def _purge(self):
+        c = self._conn()
+        c.execute("DELETE FROM cache WHERE expires_at <= ?;", (time.time(),))
+        total = c.execute("SELECT coalesce(sum(length(value)), 0) FROM cache;").fetchone()[0]
+        if total > self.max_bytes:
+            # süresi en yakın olanlardan başlayarak %10 pay bırakacak kadar sil
+            excess, freed = total - int(self.max_bytes * 0.9), 0
+            victims = []
+            for ns, key, size in c.execute("SELECT ns, key, length(value) FROM cache ORDER BY expires_at;"):
+                victims.append((ns, key))
+                freed += size
+                if freed >= excess:
+                    break
+            c.executemany("DELETE FROM cache WHERE ns=? AND key=?;", victims)
+
+    def counter(self, name):
+        row = self._conn().execute("SELECT n FROM counters WHERE name=?;", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, name):
+        return self._conn().execute("INSERT INTO counters (name, n) VALUES (?, 1) "
+                                    "ON CONFLICT(name) DO UPDATE SET n = n + 1 RETURNING n;", (name,)).fetchone()[0]
+
+    def stats(self):
+        c = self._conn()
+        n, size = c.execute("SELECT count(*), coalesce(sum(length(value)), 0) FROM cache;").fetchone()
+        return {"backend": "sqlite", "path": self.path, "items": n, "bytes": size, "max_bytes": self.max_bytes}
+
+
+class PostgresBackend:
+    """Tüm makineler arası; UNLOGGED tablo. Boyut sınırı yok, süresi geçenler periyodik silinir."""
+    shared = True
+
+    SCHEMA = """
+    CREATE UNLOGGED TABLE IF NOT EXISTS shared_cache (
+        ns TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value BYTEA NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (ns, key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_shared_cache_expires ON shared_cache(expires_at);
+    CREATE UNLOGGED TABLE IF NOT EXISTS shared_counters (name TEXT PRIMARY KEY, n BIGINT NOT NULL);
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._writes = 0
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(self.SCHEMA)
+            conn.commit(); cur.close()
+
+    def _query(self, sql, params, fetch=True):
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall() if fetch else None
+            conn.commit(); cur.close()
+        return rows
+
+    def get(self, ns, key):
+        rows = self._query("SELECT value FROM shared_cache WHERE ns=%s AND key=%s AND expires_at > NOW();", (ns, key))
+        return bytes(rows[0][0]) if rows else None
+
+    def get_many(self, ns, keys):
+        rows = self._query("SELECT key, value FROM shared_cache WHERE ns=%s AND key = ANY(%s) AND expires_at > NOW();",
+                           (ns, list(keys)))
+        return {k: bytes(v) for k, v in rows}
+
+    def set(self, ns, key, value, ttl):
+        self.set_many(ns, [(key, value)], ttl)
+
+    def set_many(self, ns, items, ttl):
+        items = list(items)
+        if not items:
+            return
+        with get_conn() as conn:
+            cur = conn.cursor()
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO shared_cache (ns, key, value, expires_at) VALUES %s
+                ON CONFLICT (ns, key) DO UPDATE SET value=EXCLUDED.value, expires_at=EXCLUDED.expires_at;
+            """, [(ns, k, psycopg2.Binary(v), ttl) for k, v in items],
+                template="(%s, %s, %s, NOW() + make_interval(secs => %s))", page_size=500)
+            conn.commit(); cur.close()
+        with self._lock:
+            self._writes += len(items)
+            purge = self._writes >= _PURGE_EVERY
+            if purge:
+                self._writes = 0
+        if purge:
+            self._query("DELETE FROM shared_cache WHERE expires_at <= NOW();", (), fetch=False)
+
+    def counter(self, name):
+        rows = self._query("SELECT n FROM shared_counters WHERE name=%s;", (name,))
+        return rows[0][0] if rows else 0
+
+    def incr(self, name):
+        return self._query("INSERT INTO shared_counters (name, n) VALUES (%s, 1) "
+                           "ON CONFLICT (name) DO UPDATE SET n = shared_counters.n + 1 RETURNING n;", (name,))[0][0]
+
+    def stats(self):
+        rows = self._query("SELECT count(*), coalesce(sum(length(value)), 0) FROM shared_cache;", ())
+        return {"backend": "postgres", "items": rows[0][0], "bytes": int(rows[0][1])}
+
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_backend():
+    """CACHE_BACKEND'e göre süreç başına tek backend; açılamazsa memory'ye düşer."""
+    global _BACKEND
+    with _BACKEND_LOCK:
+        if _BACKEND is None:
+            kind = os.getenv("CACHE_BACKEND", "memory").lower()
+            max_bytes = int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+            try:
+                if kind == "sqlite":
+                    root = os.path.dirname(os.path.abspath(__file__))
+                    _BACKEND = SQLiteBackend(os.getenv("CACHE_SQLITE_PATH", os.path.join(root, "data", "shared_cache.sqlite3")),
+                                             max_bytes=max_bytes)
+                elif kind == "postgres":
+                    _BACKEND = PostgresBackend()
+            except Exception as e:
+                print(f"[sharedcache] {kind} açılamadı, memory kullanılıyor: {e}", file=sys.stderr, flush=True)
+            if _BACKEND is None:
+                _BACKEND = MemoryBackend(max_bytes=max_bytes)
+        return _BACKEND
@@ -0,0 +1,193 @@
+# similar_cache.py
+# Kayıtlı bir raporun sıralı benzer vaka listesi için süreç içi cache.
+# Aynı liste analyze, similar_cases scope butonları, download_full ve feedback'te tekrar
+# hesaplanmasın diye: anahtar (report_id, scope, k, min_sim[, meta filtreleri]), her kayıt hesaplandığı
+# corpus sürümünü (index version) taşır; sürüm tutmuyorsa kayıt geçersizdir.
+#
+# Yeni vektörler eklendiğinde note_added() kayıtları tek tek kontrol eder: eklenenlerin hiçbiri
+# listeye giremiyorsa (scope dışı ya da benzerliği listenin eşiğinin altında) kayıt yeni sürüme
+# taşınır, girebiliyorsa düşürülür ve sonraki istekte yeniden hesaplanır. Meta filtreli listelerde
+# eklenenlerin meta'sı bilinmez; filtreyi geçtikleri varsayılır (kontrol yine doğru, sadece temkinli).
+# Hibrit (RRF, lexical.py) listelerde sıra kosinüse göre değildir ve eklenenlerin metni bilinmez: anahtardaki
+# eşiği (min_sim) geçen her yeni satır listeye girebilir sayılır.
+#
+# CACHE_BACKEND sqlite/postgres ise listeler worker'lar arası paylaşılan katmana da yazılır
+# (sharedcache.py). Orada anahtar ortak bir nesil sayacını (similar_gen) içerir; bir worker rapor
+# eklediğinde sayacı artırır (bump_shared) ve paylaşılan listelerin hepsi geçersiz olur.
+#
+# Env:
+#   SIMILAR_CACHE_SIZE (1024 kayıt; 0 kapatır), SIMILAR_CACHE_TTL (600 s; paylaşılan katmanda da)
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from sharedcache import get_backend as get_shared_cache
+
+CADORS_METHOD = "Imported (CADORS)"
+# anahtarda bu eleman varsa liste vektör + full-text adaylarının RRF birleşimidir
+FUSED = ("fusion", "rrf")
+
+
+def _unit(vec):
+    v = np.asarray(json.loads(vec) if isinstance(vec, str) else vec, dtype=np.float32)
+    n = float(np.linalg.norm(v))
+    return v / n if n else v
+
+
+def _scope_mask(scope, methods):
+    if scope == "internal":
+        return np.array([m != CADORS_METHOD for m in methods], dtype=bool)
+    if scope == "cadors":
+        return np.array([m == CADORS_METHOD for m in methods], dtype=bool)
+    return np.ones(len(methods), dtype=bool)
+
+
+class SimilarCache:
+    """LRU + TTL; kayıt: [items, sorgu vektörü, listedeki id'ler, sürüm, bitiş zamanı]."""
+
+    def __init__(self, max_items=1024, ttl=600):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0, "stale": 0, "kept": 0, "dropped": 0}
+
+    # ---------- paylaşılan katman ----------
+    @staticmethod
+    def _shared():
+        backend = get_shared_cache()
+        return backend if backend.shared else None
+
+    def shared_gen(self):
+        """Ortak nesil; hesaplamadan önce alınıp get/put'a verilir (arada artarsa sonuç paylaşılmaz)."""
+        backend = self._shared()
+        if backend is None:
+            return None
+        try:
+            return backend.counter("similar_gen")
+        except Exception as e:
+            print(f"[similar_cache] shared: {e}", file=sys.stderr, flush=True)
+            return None
+
+    def bump_shared(self):
+        backend = self._shared()
+        if backend is not None:
+            try:
+                backend.incr("similar_gen")
+            except Exception as e:
+                print(f"[similar_cache] shared: {e}", file=sys.stderr, flush=True)
+
+    @staticmethod
+    def _shared_key(key, gen):
+        return "|".join(str(p) for p in key) + f"|{gen}"
+
+    # ---------- API ----------
+    def get(self, key, version, shared_gen=None):
+        with self._lock:
+            ent = self._mem.get(key)
+            if ent is not None and (ent[3] != version or ent[4] < time.time()):
+                del self._mem[key]
+                self._stats["stale"] += 1
+                ent = None
+            if ent is not None:
+                self._mem.move_to_end(key)
+                self._stats["hits"] += 1
+                return ent[0]
+        if shared_gen is not None:
+            try:
+                raw = self._shared().get("similar", self._shared_key(key, shared_gen))
+            except Exception as e:
+                print(f"[similar_cache] shared: {e}", file=sys.stderr, flush=True)
+                raw = None
+            if raw is not None:
+                data = json.loads(raw)
+                self._remember(key, data["items"], data["q"], version)
+                with self._lock:
+                    self._stats["shared_hits"] += 1
+                return data["items"]
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def _remember(self, key, items, q_emb, version):
+        ent = [items, _unit(q_emb), {str(c["id"]) for c in items}, version, time.time() + self.ttl]
+        with self._lock:
+            self._mem[key] = ent
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+
+    def put(self, key, items, q_emb, version, shared_gen=None):
+        """shared_gen None ise sadece süreç içi (ör. rapor eklenmeden önce hesaplanmış liste)."""
+        if self.max_items <= 0:
+            return
+        self._remember(key, items, q_emb, version)
+        if shared_gen is not None:
+            q = json.loads(q_emb) if isinstance(q_emb, str) else list(q_emb)
+            try:
+                self._shared().set("similar", self._shared_key(key, shared_gen),
+                                   json.dumps({"items": items, "q": q}).encode("utf-8"), self.ttl)
+            except Exception as e:
+                print(f"[similar_cache] shared: {e}", file=sys.stderr, flush=True)
+
+    def note_added(self, old_version, new_version, rows):
+        """rows: [(report_id, method, embedding)] — old_version -> new_version arasında eklenenlerin tamamı."""
+        if old_version == new_version:
+            return
+        rows = [(str(rid), m, e) for rid, m, e in rows if e is not None]
+        with self._lock:
+            live = [(key, ent) for key, ent in self._mem.items() if ent[3] == old_version]
+            if not live:
+                return
+            if rows:
+                rids = np.array([r for r, _, _ in rows], dtype=object)
+                methods = [m for _, m, _ in rows]
+                mat = np.stack([_unit(e) for _, _, e in rows])
+                masks = {s: _scope_mask(s, methods) for s in ("all", "internal", "cadors")}
+            for key, ent in live:
+                rid, scope, k, min_sim = key[:4]
+                fused = FUSED in key[4:]
+                affected = False
+                if rows:
+                    mask = masks.get(scope, masks["all"]) & (rids != rid)
+                    if mask.any():
+                        # listedeki bir raporun vektörü/parçası değiştiyse sıralama da değişebilir
+                        if ent[2].intersection(rids[mask]):
+                            affected = True
+                        else:
+                            items = ent[0]
+                            cutoff = items[-1]["sim"] if len(items) >= k and not fused else min_sim
+                            affected = float((mat[mask] @ ent[1]).max()) >= cutoff
+                if affected:
+                    del self._mem[key]
+                    self._stats["dropped"] += 1
+                else:
+                    ent[3] = new_version
+                    self._stats["kept"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._mem), max_items=self.max_items, ttl=self.ttl)
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = SimilarCache(max_items=int(os.getenv("SIMILAR_CACHE_SIZE", "1024")),
+                                  ttl=float(os.getenv("SIMILAR_CACHE_TTL", "600")))
+        return _CACHE
@@ -0,0 +1,36 @@
+# tests/conftest.py
+# Testler DB / OpenAI gerektirmez. Çalıştırma: python -m pytest -q
+
+import os
+import sys
+import argparse
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "scripts")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """scripts/fake_openai.py sunucusu (rastgele port, thread'de); openai istemcisi ona yönlenir.
+    Dönen nesnenin opts'u (rate_limit_every, token_ms, ...) test içinde değiştirilebilir."""
+    import openai
+    import fake_openai as fake
+
+    opts = argparse.Namespace(dim=8, latency_ms=0, token_ms=0, rate_limit_every=0, verbose=False)
+    handler = type("Handler", (fake.Handler,), {"opts": opts})
+    fake.Handler.counter = 0
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    monkeypatch.setattr(openai, "api_base", f"http://127.0.0.1:{srv.server_address[1]}/v1")
+    monkeypatch.setattr(openai, "api_key", "test")
+    try:
+        yield argparse.Namespace(opts=opts, fake=fake)
+    finally:
+        srv.shutdown()
+        srv.server_close()
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+import activity
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """DB yerine yazılan batch'leri toplar."""
+    out = []
+
+    def write(self, batch):
+        if batch:
+            out.append(list(batch))
+
+    monkeypatch.setattr(activity.ActivityWriter, "_write", write)
+    return out
+
+
+def _row(i):
+    return (i, None, "u", "view", None, None, None, None, None)
+
+
+def _wait(cond, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not cond() and time.monotonic() < end:
+        time.sleep(0.01)
+    return cond()
+
+
+@pytest.fixture
+def writers():
+    made = []
+    yield made
+    for w in made:
+        w.flush(timeout=1.0)
+
+
+def test_flushes_when_batch_is_full(batches, writers):
+    w = activity.ActivityWriter(batch_size=3, flush_seconds=30)
+    writers.append(w)
+    for i in range(7):
+        assert w.submit(_row(i))
+    # süre dolmadan iki tam batch yazılır, artan 1 satır bekler
+    assert _wait(lambda: sum(map(len, batches)) >= 6)
+    assert [len(b) for b in batches] == [3, 3]
+    assert [r[0] for b in batches for r in b] == list(range(6))
+
+
+def test_flushes_partial_batch_on_timeout(batches, writers):
+    w = activity.ActivityWriter(batch_size=100, flush_seconds=0.1)
+    writers.append(w)
+    w.submit(_row(1)); w.submit(_row(2))
+    assert _wait(lambda: batches)
+    assert [r[0] for r in batches[0]] == [1, 2]
+
+
+def test_flush_drains_queue_on_shutdown(batches):
+    w = activity.ActivityWriter(batch_size=100, flush_seconds=30)
+    for i in range(5):
+        w.submit(_row(i))
+        time.sleep(0.02)  # yazıcı thread get() içinde beklerken kapat
+    t = time.monotonic()
+    w.flush(timeout=5.0)
+    # flush_seconds beklenmez; kuyruktaki her satır yazılır
+    assert time.monotonic() - t < 2.0
+    assert not w._thread.is_alive()
+    assert sorted(r[0] for b in batches for r in b) == list(range(5))
+    assert w.stats()["enqueued"] == 5
+
@@ -0,0 +1,101 @@
+# /analyze -> iş kuyruğu -> /jobs/<id>/stream (SSE) uçtan uca; GPT yerine scripts/fake_openai.py akışı.
+# Postgres ister: TEST_DATABASE_URL (ör. postgresql://postgres@/postgres?host=/tmp/pg); yoksa atlanır.
+# Test veritabanında app.init_db şemayı kurar; test kendi satırlarını siler.
+
+import io
+import html
+import os
+import re
+import threading
+import uuid
+
+import fitz
+import pytest
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL yok")
+
+
+@pytest.fixture
+def app_module(fake_openai, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", TEST_DB)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("JOB_AUTOSTART", "0")
+    monkeypatch.setenv("ANALYZE_STREAM", "1")
+    monkeypatch.setenv("EMBED_CACHE_DB", "0")
+    fake_openai.opts.dim = 1536
+    fake_openai.opts.token_ms = 30  # parçalar iş sürerken gelsin (ilk watch DB'ye düşebilir)
+    import openai
+    import app
+    monkeypatch.setattr(openai, "api_key", "test")
+    return app
+
+
+def _pdf():
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "During the take-off roll the crew rejected due to an engine fire warning.")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _events(chunks):
+    """SSE gövdesi -> [(olay, veri)]; keepalive yorumları atlanır."""
+    out = []
+    for block in "".join(chunks).split("\n\n"):
+        lines = [ln for ln in block.split("\n") if ln and not ln.startswith(":")]
+        if not lines:
+            continue
+        event = next(ln[7:] for ln in lines if ln.startswith("event: "))
+        out.append((event, "\n".join(ln[6:] for ln in lines if ln.startswith("data: "))))
+    return out
+
+
+def test_analyze_streams_tokens_then_done(app_module, fake_openai):
+    app = app_module
+    client = app.app.test_client()
+    uid = str(uuid.uuid4())
+    with client.session_transaction() as sess:
+        sess.update({"logged_in": True, "user_id": uid, "username": "stream-test"})
+
+    resp = client.post("/analyze", data={"pdf": (io.BytesIO(_pdf()), "r.pdf"), "method": "Five Whys"},
+                       content_type="multipart/form-data")
+    assert resp.status_code == 200
+    job_id = re.search(r'id="job-([0-9a-f-]{36})"', resp.get_data(as_text=True)).group(1)
+
+    queue = app.get_job_queue()
+    worker = threading.Thread(target=queue.run_one)
+    stream = client.get(f"/jobs/{job_id}/stream", buffered=False)
+    assert stream.mimetype == "text/event-stream"
+    worker.start()
+    events = _events(chunk.decode("utf-8") for chunk in stream.response)
+    worker.join(30)
+    rid = None
+    try:
+        names = [e for e, _ in events]
+        assert names[-1] == "done" and set(names[:-1]) == {"token"} and len(names) > 2
+        streamed = html.unescape("".join(d for e, d in events if e == "token"))
+        canned = fake_openai.fake.CANNED
+        # token'lar sırayla, tekrarsız gelir; son parça(lar) iş bitince sadece "done" bloğunda olabilir
+        assert len(streamed) > 0 and canned.startswith(streamed)
+        assert html.escape(canned.strip(), quote=False) in events[-1][1]
+
+        job = queue.get(job_id)
+        assert job["status"] == "done"
+        rid = job["result"]["report_id"]
+        assert f"/download/report/{rid}" in events[-1][1]
+        from db import get_conn
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT result_text, lang FROM sreports WHERE id=%s;", (rid,))
+            assert cur.fetchone() == (canned.strip(), "English")
+            cur.close()
+    finally:
+        from db import get_conn
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM analysis_jobs WHERE id=%s;", (job_id,))
+            if rid:
+                cur.execute("DELETE FROM sreport_passages WHERE report_id=%s;", (rid,))
+                cur.execute("DELETE FROM sreports WHERE id=%s;", (rid,))
+            conn.commit(); cur.close()
@@ -0,0 +1,50 @@
+import re
+
+import pytest
+
+import chunking
+
+
+@pytest.fixture
+def summarized(monkeypatch):
+    """Özet çağrısı yerine parçayı kaydeder; özet = parçadaki cümle numaraları."""
+    monkeypatch.setattr(chunking, "SUMMARY_CONTEXT_TOKENS", 1500)
+    monkeypatch.setattr(chunking, "MAP_CHUNK_TOKENS", 200)
+    monkeypatch.setattr(chunking, "MAP_MAX_PARTS", 4)
+    calls = []
+
+    def summarize(chunk, i, n, max_tokens):
+        calls.append((chunk, max_tokens))
+        return " ".join(re.findall(r"S\d+", chunk))
+
+    monkeypatch.setattr(chunking, "_summarize", summarize)
+    return calls
+
+
+def _report(n):
+    return "\n\n".join(f"S{i} the crew reported a hydraulic caution during the approach and continued." for i in range(n))
+
+
+def test_summary_call_fits_summary_context(summarized):
+    limit = chunking.summary_chunk_tokens()
+    prompt = chunking.MAP_PROMPT.format(i=4, n=4, words=560, chunk="x " * limit)
+    assert chunking.count_tokens(prompt) + chunking.SUMMARY_MAX_TOKENS <= chunking.SUMMARY_CONTEXT_TOKENS
+
+
+def test_condense_reads_whole_report_when_parts_exceed_cap(summarized):
+    text = _report(400)  # ~8000 token: 4 parça x özet sınırı kapsamaz
+    limit = chunking.summary_chunk_tokens()
+    assert chunking.count_tokens(text) > chunking.MAP_MAX_PARTS * limit
+    out = chunking.condense(text, budget_tokens=3000)
+    seen = {s for chunk, _ in summarized for s in re.findall(r"S\d+", chunk)}
+    assert seen == {f"S{i}" for i in range(400)}
+    assert all(chunking.count_tokens(chunk) <= limit for chunk, _ in summarized)
+    assert all(m <= chunking.SUMMARY_MAX_TOKENS for _, m in summarized)
+    assert chunking.count_tokens(out) <= 3000
+    assert "S399" in out  # kuyruk atılmadı
+
+
+def test_condense_single_round_when_it_fits(summarized):
+    text = _report(60)
+    chunking.condense(text, budget_tokens=300)
+    assert 1 < len(summarized) <= chunking.MAP_MAX_PARTS
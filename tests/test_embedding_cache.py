@@ -0,0 +1,47 @@
+import openai
+import pytest
+
+import embeddings
+
+
+def test_key_ignores_whitespace_differences():
+    h = embeddings.text_hash("Bird strike on  final\n approach")
+    assert embeddings.text_hash("  Bird strike on final approach\t") == h
+    assert embeddings.text_hash("Bird strike on final approach.") != h
+
+
+def test_key_uses_nfc():
+    # "ş" tek kod noktası ve s + birleşen çengel aynı anahtarı verir
+    assert embeddings.text_hash("pi\u015fti") == embeddings.text_hash("pis\u0327ti")
+
+
+def test_cache_is_keyed_per_model():
+    cache = embeddings.EmbeddingCache(max_items=16, use_db=False)
+    cache.put("model-a", "engine fire", [1.0])
+    assert cache.get("model-a", " engine   fire ") == [1.0]
+    assert cache.get("model-b", "engine fire") is None
+    cache.put("model-b", "engine fire", [2.0])
+    assert cache.get_many("model-a", ["engine fire", "x"]) == {0: [1.0]}
+    assert cache.get_many("model-b", ["x", "engine\nfire"]) == {1: [2.0]}
+
+
+@pytest.fixture
+def requests(fake_openai, monkeypatch):
+    monkeypatch.setattr(embeddings, "_CACHE", embeddings.EmbeddingCache(max_items=16, use_db=False))
+    models = []
+    create = openai.Embedding.create
+
+    def counting(*args, **kw):
+        models.append(kw["model"])
+        return create(*args, **kw)
+
+    monkeypatch.setattr(openai.Embedding, "create", counting)
+    return models
+
+
+def test_get_embedding_hits_cache_for_same_model_only(requests):
+    a = embeddings.get_embedding("runway incursion", model="m1")
+    assert embeddings.get_embedding(" runway  incursion ", model="m1") == a
+    assert requests == ["m1"]
+    embeddings.get_embedding("runway incursion", model="m2")
+    assert requests == ["m1", "m2"]
@@ -0,0 +1,55 @@
+import openai
+import pytest
+
+import embeddings
+
+
+@pytest.fixture
+def calls(fake_openai, monkeypatch):
+    """Sunucuya giden her embedding isteğinin girdi sayısı; cache yalnız bellekte ve boş."""
+    monkeypatch.setattr(embeddings, "_CACHE", embeddings.EmbeddingCache(max_items=1024, use_db=False))
+    sizes = []
+    create = openai.Embedding.create
+
+    def counting(*args, **kw):
+        sizes.append(len(kw["input"]))
+        return create(*args, **kw)
+
+    monkeypatch.setattr(openai.Embedding, "create", counting)
+    return sizes
+
+
+def test_batches_and_preserves_order(fake_openai, calls):
+    texts = [f"report {i}" for i in range(10)]
+    out = embeddings.embed_batch(texts, max_inputs=4)
+    assert calls == [4, 4, 2]
+    assert out == [fake_openai.fake.fake_vector(t, 8) for t in texts]
+
+
+def test_token_budget_splits_batches(fake_openai, calls):
+    texts = ["word " * 50] * 2 + ["short"]
+    embeddings.embed_batch([t + str(i) for i, t in enumerate(texts)], max_inputs=10, max_tokens=60)
+    assert len(calls) >= 2
+
+
+def test_bisects_invalid_input_and_returns_none(fake_openai, calls):
+    texts = ["a", "b", "", "d"]  # sahte sunucu boş girdiye 400 döner
+    out = embeddings.embed_batch(texts, max_inputs=10)
+    assert out[2] is None
+    assert [v is not None for v in out] == [True, True, False, True]
+    assert calls[0] == 4 and len(calls) > 1
+
+
+def test_retries_rate_limit(fake_openai, calls):
+    fake_openai.opts.rate_limit_every = 2  # 2. istek 429, tekrarı (3.) geçer
+    out = embeddings.embed_batch(["x", "y"], max_inputs=1, max_retries=3)
+    assert calls == [1, 1, 1]
+    assert out == [fake_openai.fake.fake_vector(t, 8) for t in ["x", "y"]]
+
+
+def test_non_input_errors_are_raised(fake_openai, calls):
+    fake_openai.opts.rate_limit_every = 1  # her istek 429
+    with pytest.raises(openai.error.RateLimitError):
+        embeddings.embed_batch(["x", "y", "z"], max_retries=0)
+    assert calls == [3]  # bölünmedi
+
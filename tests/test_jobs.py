@@ -0,0 +1,31 @@
+import threading
+
+from jobs import JobQueue
+
+
+def _queue(workers):
+    q = JobQueue(workers=workers)
+    gate = threading.Event()
+    q._run = lambda: gate.wait(5)  # DB'siz: thread'ler sadece bekler
+    return q, gate
+
+
+def test_start_tops_up_to_workers():
+    q, gate = _queue(2)
+    try:
+        q.start()
+        assert q._alive() == 2
+        # scripts/job_worker.py --workers 4: app import'undan sonra sayı artırılır
+        q.workers = 4
+        q.start()
+        assert q._alive() == 4
+        q.start()
+        assert q._alive() == 4
+    finally:
+        gate.set()
+
+
+def test_start_without_workers_is_noop():
+    q, gate = _queue(0)
+    q.start()
+    assert q._alive() == 0
@@ -0,0 +1,39 @@
+import numpy as np
+
+import lexical
+from similar_cache import FUSED, SimilarCache
+
+
+def test_rrf_ordering():
+    fused = lexical.rrf([["a", "b", "c"], ["c", "a", "d"]], k=60)
+    ids = [rid for rid, _ in fused]
+    # a: 1/61 + 1/62, c: 1/63 + 1/61, b: 1/62, d: 1/63
+    assert ids == ["a", "c", "b", "d"]
+    assert fused[0][1] == 1 / 61 + 1 / 62
+
+
+def test_rrf_weights():
+    ids = [rid for rid, _ in lexical.rrf([["a", "b"], ["b", "a"]], weights=[1.0, 2.0])]
+    assert ids == ["b", "a"]
+
+
+def test_matched_terms_hide_raw_query():
+    terms = lexical.search_terms("engine <img src=x> C-GABC")
+    assert lexical.matched_terms(terms, range(len(terms))) == ["c-gabc"]
+
+
+def test_exact_terms():
+    assert lexical.exact_terms("C-GABC diverted to CYOW, PW127 fault on 2020-01-02") == ["c-gabc", "cyow", "pw127"]
+    assert lexical.is_exact_query("cyow c-gabc")
+    assert not lexical.is_exact_query("engine fire")
+
+
+def test_fused_cache_list_uses_min_sim():
+    q = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    key = ("q", "all", 2, 0.4, FUSED)  # app._similar_key biçimi
+    cache = SimilarCache(max_items=4, ttl=600)
+    cache.put(key, [{"id": "a", "sim": 0.9}, {"id": "b", "sim": 0.8}], q, version=1)
+    # 0.45 < listenin son kosinüsü ama RRF sırası kosinüse göre değil: min_sim'i geçen her satır girebilir
+    new = np.array([0.5, 1.0, 0.0]) / np.linalg.norm([0.5, 1.0, 0.0])
+    cache.note_added(1, 2, [("new", "Five Whys", new.tolist())])
+    assert cache.get(key, 2) is None
@@ -0,0 +1,73 @@
+import os
+import time
+
+import pdf_store
+
+
+def _key(n):
+    return pdf_store.make_key("r1", "report", pdf_store.content_hash(n))
+
+
+def test_memory_lru_evicts_oldest_by_bytes():
+    store = pdf_store.PdfStore(backend="memory", ttl=60, mem_bytes=25)
+    a, b, c = _key("a"), _key("b"), _key("c")
+    store.put(a, b"a" * 10)
+    store.put(b, b"b" * 10)
+    assert store.get(a) == b"a" * 10  # a en yeni kullanılan olur
+    store.put(c, b"c" * 10)
+    assert store.get(b) is None
+    assert store.get(a) and store.get(c)
+    assert store.stats()["mem_bytes"] == 20
+    store.put(_key("big"), b"x" * 26)  # sınırdan büyük olan bellekte tutulmaz
+    assert store.stats()["mem_items"] == 2
+
+
+def test_memory_entry_expires_after_ttl():
+    store = pdf_store.PdfStore(backend="memory", ttl=0.05)
+    k = _key("a")
+    store.put(k, b"pdf")
+    assert store.get(k) == b"pdf"
+    time.sleep(0.1)
+    assert store.get(k) is None
+    assert store.stats()["mem_items"] == 0
+
+
+def test_disk_survives_new_process_and_expires(tmp_path):
+    k = _key("a")
+    pdf_store.PdfStore(backend="disk", directory=str(tmp_path), ttl=60).put(k, b"pdf")
+    fresh = pdf_store.PdfStore(backend="disk", directory=str(tmp_path), ttl=60)
+    assert fresh.get(k) == b"pdf"
+    assert fresh.stats()["store_hits"] == 1
+
+    old = time.time() - 120
+    os.utime(tmp_path / (k + ".pdf"), (old, old))
+    other = pdf_store.PdfStore(backend="disk", directory=str(tmp_path), ttl=60)
+    assert other.get(k) is None
+    assert not (tmp_path / (k + ".pdf")).exists()
+
+
+def test_sweep_removes_only_expired_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_store, "_SWEEP_EVERY", 3)
+    store = pdf_store.PdfStore(backend="disk", directory=str(tmp_path), ttl=60)
+    stale = [_key(i) for i in range(2)]
+    for k in stale:
+        store.put(k, b"old")
+        old = time.time() - 120
+        os.utime(tmp_path / (k + ".pdf"), (old, old))
+    fresh = _key("fresh")
+    store.put(fresh, b"new")  # 3. put süpürmeyi tetikler
+    assert sorted(os.listdir(tmp_path)) == [fresh + ".pdf"]
+
+
+def test_get_or_render_renders_once(tmp_path):
+    store = pdf_store.PdfStore(backend="disk", directory=str(tmp_path), ttl=60)
+    calls = []
+
+    def render():
+        calls.append(1)
+        return b"pdf"
+
+    k = _key("a")
+    assert store.get_or_render(k, render) == b"pdf"
+    assert store.get_or_render(k, render) == b"pdf"
+    assert len(calls) == 1 and store.stats()["renders"] == 1
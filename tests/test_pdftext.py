@@ -0,0 +1,44 @@
+import fitz
+import pytest
+
+import pdftext
+
+
+def _pdf(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"Page {i} engine fire")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def pool_workers(monkeypatch):
+    monkeypatch.setattr(pdftext, "PDF_WORKERS", 2)
+    monkeypatch.setattr(pdftext, "PDF_PAGES_PER_TASK", 2)
+    yield
+    pool = pdftext._POOL
+    pdftext._reset_pool()
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def test_extract_through_process_pool(pool_workers, tmp_path):
+    data = _pdf(5)
+    serial = pdftext.extract_text(data, parallel_pages=10 ** 6)
+    parallel = pdftext.extract_text(data, parallel_pages=2)
+    assert pdftext._POOL is not None  # sayfalar pool'da okundu
+    assert parallel == serial
+    assert [f"Page {i}" in parallel for i in range(5)] == [True] * 5
+    # diskteki dosya: temp kopya yok, çocuklar aynı yolu açar
+    path = tmp_path / "r.pdf"
+    path.write_bytes(data)
+    assert pdftext.extract_text(str(path), parallel_pages=2) == serial
+
+
+def test_page_and_size_limits():
+    data = _pdf(4)
+    assert "Page 3" not in pdftext.extract_text(data, max_pages=2)
+    with pytest.raises(pdftext.PdfTooLarge):
+        pdftext.extract_text(data, max_bytes=10)
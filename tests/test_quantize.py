@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import quantize
+from bench_quant import synthetic
+from vector_index import EmbeddingIndex
+
+DIM = 64
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """scripts/bench_quant.py'deki kümeli veri (komşu skorları birbirine yakın; int8 hatası görünür)."""
+    return synthetic(400, DIM, 8, seed=0)
+
+
+@pytest.mark.parametrize("mode,tol", [("float32", 1e-7), ("float16", 1e-3), ("int8", 1e-2)])
+def test_encode_decode_round_trip(corpus, mode, tol):
+    for vec in corpus[:20]:
+        blob = quantize.encode(vec, mode)
+        assert len(blob) == quantize.nbytes_per_vector(mode, len(vec)) + 1
+        out = quantize.decode(blob)
+        assert out.dtype == np.float32 and out.shape == vec.shape
+        assert np.abs(out - vec).max() < tol
+
+
+def test_decode_rejects_unknown_tag():
+    assert quantize.decode(b"\xff\x00\x00") is None
+
+
+def test_int8_dot_matches_exact(corpus):
+    codes, scales = quantize.quantize(corpus, "int8")
+    q = corpus[0]
+    assert np.abs(quantize.dot(codes, scales, q) - corpus @ q).max() < 0.02
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        quantize.check_mode("int4")
+
+
+@pytest.mark.parametrize("mode", ["float16", "int8"])
+def test_rerank_returns_exact_order_and_scores(corpus, mode):
+    index = EmbeddingIndex(dim=DIM, quant=mode, rerank=4)
+    index.load([(str(i), "", corpus[i]) for i in range(len(corpus))])
+    q = corpus[11]
+    hits = index.search(q, k=10, min_sim=-1.0, exclude_id="11")
+    exact = corpus @ q
+    exact[11] = -np.inf
+    assert [rid for rid, _ in hits] == [str(i) for i in np.argsort(-exact)[:10]]
+    assert np.allclose([s for _, s in hits], np.sort(exact)[::-1][:10], atol=1e-5)
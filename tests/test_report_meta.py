@@ -0,0 +1,31 @@
+import datetime
+
+import report_meta
+
+
+def test_parse_filters():
+    out = report_meta.parse_filters({"date_from": "2021-03-04", "date_to": "not a date", "aircraft": "  Boeing   737 ",
+                                     "phase": "-", "province": "ONTARIO", "other": "x"})
+    assert out == {"date_from": datetime.date(2021, 3, 4), "aircraft": "boeing 737", "province": "ontario"}
+
+
+def test_parse_filters_truncates_and_skips_empty():
+    out = report_meta.parse_filters({"phase": "x" * 500, "province": ""})
+    assert out == {"phase": "x" * report_meta.MAX_FILTER_CHARS}
+
+
+def test_filters_key_is_order_independent():
+    a = report_meta.filters_key({"phase": "cruise", "province": "ontario"})
+    b = report_meta.filters_key({"province": "ontario", "phase": "cruise"})
+    assert a == b and report_meta.filters_key(None) == ()
+
+
+def test_sql_where_uses_normalized_column():
+    where, params = report_meta.sql_where({"province": "ontario", "aircraft": "50%_off"}, "s.")
+    assert where == [report_meta.NORM_SQL.format(col="s.aircraft") + " LIKE %s",
+                     report_meta.NORM_SQL.format(col="s.province") + " = %s"]
+    assert params == ["%50\\%\\_off%", "ontario"]
+    # index ifadeleri sorgudakiyle birebir aynı olmalı (aksi halde index kullanılmaz)
+    assert report_meta.NORM_SQL.format(col="province") in report_meta.COLUMNS_SQL
+    assert report_meta.NORM_SQL.format(col="phase") in report_meta.TRGM_SQL
+
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+import sharedcache
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return sharedcache.SQLiteBackend(str(tmp_path / "cache.sqlite3"))
+    return sharedcache.MemoryBackend()
+
+
+def test_get_set_and_namespaces(backend):
+    assert backend.get("pdf", "k") is None
+    backend.set("pdf", "k", b"one", ttl=60)
+    backend.set("emb", "k", b"two", ttl=60)
+    assert backend.get("pdf", "k") == b"one"
+    assert backend.get("emb", "k") == b"two"
+    backend.set("pdf", "k", b"three", ttl=60)
+    assert backend.get("pdf", "k") == b"three"
+
+
+def test_many(backend):
+    backend.set_many("ns", [("a", b"1"), ("b", b"2")], ttl=60)
+    assert backend.get_many("ns", ["a", "b", "c"]) == {"a": b"1", "b": b"2"}
+    assert backend.get_many("other", ["a"]) == {}
+
+
+def test_entries_expire(backend):
+    backend.set("ns", "short", b"x", ttl=0.05)
+    backend.set("ns", "long", b"y", ttl=60)
+    time.sleep(0.1)
+    assert backend.get("ns", "short") is None
+    assert backend.get_many("ns", ["short", "long"]) == {"long": b"y"}
+
+
+def test_counters(backend):
+    assert backend.counter("gen") == 0
+    assert backend.incr("gen") == 1
+    assert backend.incr("gen") == 2
+    assert backend.counter("gen") == 2
+
+
+def test_memory_respects_max_bytes():
+    backend = sharedcache.MemoryBackend(max_bytes=10)
+    backend.set("ns", "a", b"x" * 6, ttl=60)
+    backend.set("ns", "b", b"y" * 6, ttl=60)
+    assert backend.get("ns", "a") is None and backend.get("ns", "b") == b"y" * 6
+    assert backend.stats()["bytes"] == 6
+
+
+def test_sqlite_is_shared_between_instances_and_purges(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharedcache, "_PURGE_EVERY", 4)
+    path = str(tmp_path / "cache.sqlite3")
+    one = sharedcache.SQLiteBackend(path, max_bytes=20)
+    two = sharedcache.SQLiteBackend(path, max_bytes=20)
+    one.set("ns", "k", b"v", ttl=60)
+    assert two.get("ns", "k") == b"v"
+    two.incr("gen")
+    assert one.counter("gen") == 1
+
+    one.set("ns", "gone", b"x", ttl=0.01)
+    time.sleep(0.05)
+    one.set("ns", "mid", b"m" * 10, ttl=30)
+    # 4. yazma: süresi geçen silinir, sonra sınır aşıldığı için süresi en yakın olan (mid)
+    one.set("ns", "big", b"z" * 15, ttl=120)
+    assert one.get_many("ns", ["k", "gone", "mid", "big"]) == {"k": b"v", "big": b"z" * 15}
+    assert one.stats()["items"] == 2
+
+
+def test_get_backend_falls_back_to_memory(monkeypatch, tmp_path):
+    monkeypatch.setattr(sharedcache, "_BACKEND", None)
+    monkeypatch.setenv("CACHE_BACKEND", "sqlite")
+    monkeypatch.setenv("CACHE_SQLITE_PATH", str(tmp_path / "f" / "cache.sqlite3"))
+    assert isinstance(sharedcache.get_backend(), sharedcache.SQLiteBackend)
+    monkeypatch.setattr(sharedcache, "_BACKEND", None)
+    monkeypatch.setenv("CACHE_SQLITE_PATH", str(tmp_path))  # dizin: açılamaz
+    assert isinstance(sharedcache.get_backend(), sharedcache.MemoryBackend)
@@ -0,0 +1,60 @@
+import numpy as np
+
+from similar_cache import CADORS_METHOD, SimilarCache
+
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def _cache(key, sims, q):
+    cache = SimilarCache(max_items=16, ttl=600)
+    cache.put(key, [{"id": f"r{i}", "sim": s} for i, s in enumerate(sims)], q, version=1)
+    return cache
+
+
+def test_note_added_keeps_list_when_new_row_cannot_enter():
+    q = _unit([1, 0, 0])
+    key = ("q", "all", 2, 0.5)
+    cache = _cache(key, [0.9, 0.8], q)
+    cache.note_added(1, 2, [("new", "Five Whys", _unit([0.5, 1, 0]).tolist())])  # sim ~0.45 < 0.8
+    assert cache.get(key, 2) is not None
+    assert cache.stats()["kept"] == 1
+
+
+def test_note_added_drops_list_when_new_row_enters():
+    q = _unit([1, 0, 0])
+    key = ("q", "all", 2, 0.5)
+    cache = _cache(key, [0.9, 0.8], q)
+    cache.note_added(1, 2, [("new", "Five Whys", _unit([1, 0.1, 0]).tolist())])
+    assert cache.get(key, 2) is None
+    assert cache.stats()["dropped"] == 1
+
+
+def test_note_added_ignores_rows_outside_scope():
+    q = _unit([1, 0, 0])
+    key = ("q", "internal", 2, 0.5)
+    cache = _cache(key, [0.9, 0.8], q)
+    cache.note_added(1, 2, [("new", CADORS_METHOD, q.tolist())])
+    assert cache.get(key, 2) is not None
+
+
+
+def test_get_misses_on_other_version_and_keeps_lru_bound():
+    q = _unit([1, 0, 0])
+    cache = SimilarCache(max_items=2, ttl=600)
+    for rid in ("a", "b", "c"):
+        cache.put((rid, "all", 2, 0.5), [{"id": "x", "sim": 0.9}], q, version=1)
+    assert cache.get(("a", "all", 2, 0.5), 1) is None  # LRU'dan düştü
+    assert cache.get(("b", "all", 2, 0.5), 2) is None  # başka sürüm
+    assert cache.get(("c", "all", 2, 0.5), 1) is not None
+
+
+def test_note_added_drops_list_containing_updated_row():
+    q = _unit([1, 0, 0])
+    key = ("q", "all", 2, 0.5)
+    cache = _cache(key, [0.9, 0.8], q)
+    # listedeki r1'in vektörü değişti (uzak olsa da sıra değişebilir)
+    cache.note_added(1, 2, [("r1", "Five Whys", _unit([0, 1, 0]).tolist())])
+    assert cache.get(key, 2) is None
@@ -0,0 +1,85 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import report_meta
+from vector_index import CADORS_METHOD, EmbeddingIndex
+
+DIM, N = 32, 120
+
+
+@pytest.fixture
+def vecs():
+    rng = np.random.default_rng(3)
+    mat = rng.normal(size=(N, DIM)).astype(np.float32)
+    return mat / np.linalg.norm(mat, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def index(vecs):
+    idx = EmbeddingIndex(dim=DIM)
+    # her 3. satır kurum içi rapor, gerisi CADORS
+    idx.load([(f"r{i}", "Five Whys" if i % 3 == 0 else CADORS_METHOD, vecs[i].tolist()) for i in range(N)])
+    return idx
+
+
+def _exact(vecs, q, rows, k):
+    rows = np.asarray(rows)
+    return [f"r{rows[j]}" for j in np.argsort(-(vecs[rows] @ q))[:k]]
+
+
+def test_search_matches_exact(index, vecs):
+    q = vecs[7]
+    got = index.search(q, k=5, min_sim=-1.0, exclude_id="r7")
+    assert [rid for rid, _ in got] == _exact(vecs, q, [i for i in range(N) if i != 7], 5)
+    assert all(a >= b for (_, a), (_, b) in zip(got, got[1:]))
+
+
+@pytest.mark.parametrize("scope,keep", [("internal", lambda i: i % 3 == 0), ("cadors", lambda i: i % 3 != 0)])
+def test_search_scope_mask(index, vecs, scope, keep):
+    q = vecs[4]
+    got = [rid for rid, _ in index.search(q, k=8, min_sim=-1.0, scope=scope)]
+    assert got == _exact(vecs, q, [i for i in range(N) if keep(i)], 8)
+
+
+def test_min_sim_cuts_list(index, vecs):
+    assert [rid for rid, _ in index.search(vecs[2], k=10, min_sim=0.99)] == ["r2"]
+
+
+def test_add_replaces_vector(index, vecs):
+    assert index.add("r5", "Five Whys", vecs[9].tolist())
+    assert len(index) == N
+    assert index.similarity(vecs[9], ["r5", "missing"]) == {"r5": pytest.approx(1.0, abs=1e-5)}
+    ids = [rid for rid, _ in index.search(vecs[9], k=N, min_sim=-1.0)]
+    assert ids.count("r5") == 1 and set(ids[:2]) == {"r5", "r9"}
+
+
+def test_rejects_wrong_dimension(index):
+    assert not index.add("bad", "Five Whys", [1.0, 0.0])
+    assert index.search([1.0, 0.0], k=3) == []
+
+
+def test_search_filter_mask():
+    # (gün, eyalet, hava aracı, safha); vektörler sorguya yakınlık sırasıyla
+    rows = [(datetime.date(2020, 3, 1), "Ontario", "Boeing   737-800", "Take-off"),
+            (datetime.date(2020, 5, 1), "Quebec", "Cessna 172", "Landing"),
+            (datetime.date(2021, 1, 1), "  ontario ", "Boeing 737-700", "Cruise"),
+            (None, "Ontario", "Boeing 737-800", "Take-off"),
+            (datetime.date(2020, 4, 1), "Ontario", "Airbus A320", "Take-off")]
+    idx = EmbeddingIndex(dim=4)
+    for i, (day, prov, ac, phase) in enumerate(rows):
+        vec = [1.0, 0.1 * i, 0.0, 0.0]
+        idx.add(f"r{i}", CADORS_METHOD, vec, {"day": day, "province": prov, "aircraft": ac, "phase": phase})
+
+    def ids(**args):
+        return [rid for rid, _ in idx.search([1.0, 0.0, 0.0, 0.0], k=10, min_sim=-1.0,
+                                             filters=report_meta.parse_filters(args))]
+
+    assert ids(province="ONTARIO") == ["r0", "r2", "r3", "r4"]
+    assert ids(aircraft="boeing 737") == ["r0", "r2", "r3"]
+    assert ids(phase="take") == ["r0", "r3", "r4"]
+    # tarihsiz satır date_to'yu geçmez
+    assert ids(date_from="2020-01-01", date_to="2020-12-31") == ["r0", "r1", "r4"]
+    assert ids(province="ontario", aircraft="737-8", date_from="2020-01-01") == ["r0"]
+    assert ids(province="ont") == []
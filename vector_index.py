@@ -0,0 +1,700 @@
+# vector_index.py
+# Process-wide embedding index for similar-case search.
+# Tüm embedding'ler tek bir normalize edilmiş float32 matriste tutulur; top-k
+# tek bir matris-vektör çarpımı + argpartition ile bulunur.
+# Büyük corpus'ta (100k+ CADORS) IVF (inverted file) ile sadece en yakın
+# nprobe kümenin satırları taranır; index diske kaydedilip açılışta okunur.
+#
+# Snapshot (save_snapshot / load_snapshot): matris ayrı bir .npy dosyası olarak yazılır ve
+# worker'lar onu np.memmap ile açar ("base" satırlar); sayfalar OS page cache'inden paylaşılır,
+# makine başına tek fiziksel kopya olur ve açılışta JSON çözülmez. Sonradan eklenen satırlar
+# RAM'deki "tail" matrise gider. Snapshot'tan sonraki satırlar delta log'a eklenebilir
+# (append_delta); okuyucu sadece delta.json'da kayıtlı satır sayısı kadarını okur.
+# Üretmek için: scripts/embedding_snapshot.py
+#
+# Kuantizasyon (quantize.py): quant="float16" | "int8" ile satırlar RAM'de (ve snapshot'ta) 2x / ~4x
+# küçük tutulur, skorlar kuantize vektörler üzerinden hesaplanır. rerank=N ise en iyi k*N aday exact
+# float32 vektörlerle yeniden sıralanır: base satırlar için snapshot'taki exact.npy (memmap; sadece
+# aday satırların sayfaları okunur), tail satırlar için RAM'deki float32 kopya.
+#
+# Meta filtreleri (report_meta.py): satır başına olay günü ve kategorik alanlar (province, aircraft,
+# phase, aerodrome) kod dizileri olarak tutulur; search(filters=...) önce maskeyi kurar, seçilen satır
+# sayısı küçükse sadece onlar skorlanır (tam matris çarpımı yerine).
+
+import os
+import json
+import time
+import shutil
+import threading
+import numpy as np
+
+import quantize
+import report_meta
+
+CADORS_METHOD = "Imported (CADORS)"
+SNAPSHOT_DTYPES = quantize.MODES
+META_FIELDS = report_meta.FIELDS
+_NO_DAY = np.iinfo(np.int32).min
+_EPOCH = 719163  # date(1970, 1, 1).toordinal()
+
+
+def _as_vector(emb):
+    """JSONB / str / list embedding'i float32 vektöre çevirir (bozuksa None)."""
+    if emb is None:
+        return None
+    if isinstance(emb, (bytes, memoryview)):
+        return quantize.decode(emb)   # embedding_q (BYTEA)
+    if isinstance(emb, str):
+        try:
+            emb = json.loads(emb)
+        except ValueError:
+            return None
+    vec = np.asarray(emb, dtype=np.float32)
+    if vec.ndim != 1 or vec.size == 0:
+        return None
+    return vec
+
+
+def _normalize(vec):
+    norm = float(np.linalg.norm(vec)) or 1e-9
+    return vec / norm
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _delta_state(path):
+    try:
+        with open(os.path.join(path, "delta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"rows": 0, "bytes": 0, "watermark": None}
+
+
+def _read_delta(path, dim):
+    """-> (delta.json, [(id, method, vec, meta)]) — sadece kayıtlı (commit edilmiş) satırlar."""
+    state = _delta_state(path)
+    n = state["rows"]
+    if not n:
+        return state, []
+    vecs = np.fromfile(os.path.join(path, "delta_vectors.bin"), dtype=np.float32, count=n * dim).reshape(n, dim)
+    with open(os.path.join(path, "delta_ids.jsonl"), "rb") as f:
+        lines = f.read(state["bytes"]).decode("utf-8").splitlines()
+    rows = []
+    for line, vec in zip(lines, vecs):
+        rid, method, *meta = json.loads(line)
+        rows.append((rid, method, vec, meta[0] if meta else None))
+    return state, rows
+
+
+class EmbeddingIndex:
+    """Pre-normalized (optionally quantized) matrix with parallel id / method arrays."""
+
+    def __init__(self, dim=1536, quant="float32", rerank=0):
+        self.dim = dim
+        self.quant = quantize.check_mode(quant)
+        self.rerank = int(rerank or 0)   # kuantize skorlarda en iyi k*rerank aday exact ile yeniden sıralanır
+        self._lock = threading.RLock()
+        # tail: satır _nb + i (kodlar self.quant tipinde; int8 ise _scale, rerank açıksa _exact)
+        self._mat = np.zeros((0, dim), dtype=quant)
+        self._scale = None
+        self._exact = None
+        self._base = None             # snapshot'tan memmap (salt okunur), satır 0.._nb-1
+        self._base_scale = None
+        self._base_exact = None       # exact.npy memmap (kuantize snapshot'ta)
+        self._nb = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._dead = 0
+        self._ids = np.empty(0, dtype=object)
+        self._methods = np.empty(0, dtype=object)
+        self._is_cadors = np.zeros(0, dtype=bool)
+        # meta: gün (1970'ten beri; bilinmiyorsa _NO_DAY) + alan başına kod (0 = boş) ve sözlük
+        self._day = np.zeros(0, dtype=np.int32)
+        self._cat = {f: np.zeros(0, dtype=np.int32) for f in META_FIELDS}
+        self._vocab = {f: [""] for f in META_FIELDS}
+        self._vocab_pos = {f: {"": 0} for f in META_FIELDS}
+        self._pos = {}  # id -> row
+        self._n = 0
+        self.loaded = False
+        self.version = 0
+        # IVF
+        self._centroids = None        # (nlist, dim)
+        self._lists = []              # küme başına satır numaraları (np.int64)
+        self._trained_n = 0           # train anındaki satır sayısı; sonrası "tail" olarak tam taranır
+
+    def __len__(self):
+        return self._n
+
+    def _grow(self, need):
+        cap = len(self._ids)
+        if need > cap:
+            new_cap = max(need, cap * 2, 64)
+            ids = np.empty(new_cap, dtype=object)
+            ids[:self._n] = self._ids[:self._n]
+            methods = np.empty(new_cap, dtype=object)
+            methods[:self._n] = self._methods[:self._n]
+            is_cadors = np.zeros(new_cap, dtype=bool)
+            is_cadors[:self._n] = self._is_cadors[:self._n]
+            alive = np.zeros(new_cap, dtype=bool)
+            alive[:self._n] = self._alive[:self._n]
+            self._ids, self._methods, self._is_cadors, self._alive = ids, methods, is_cadors, alive
+            day = np.full(new_cap, _NO_DAY, dtype=np.int32)
+            day[:self._n] = self._day[:self._n]
+            self._day = day
+            for f, codes in self._cat.items():
+                grown = np.zeros(new_cap, dtype=np.int32)
+                grown[:self._n] = codes[:self._n]
+                self._cat[f] = grown
+        tail, tcap = self._n - self._nb, self._mat.shape[0]
+        if need - self._nb > tcap:
+            new_cap = max(need - self._nb, tcap * 2, 64)
+            mat = np.zeros((new_cap, self.dim), dtype=self._mat.dtype)
+            mat[:tail] = self._mat[:tail]
+            self._mat = mat
+            if self.quant == "int8":
+                scale = np.ones(new_cap, dtype=np.float32)
+                if self._scale is not None:
+                    scale[:tail] = self._scale[:tail]
+                self._scale = scale
+            if self.quant != "float32" and self.rerank:
+                exact = np.zeros((new_cap, self.dim), dtype=np.float32)
+                if self._exact is not None:
+                    exact[:tail] = self._exact[:tail]
+                self._exact = exact
+
+    def _reset(self):
+        self._n = 0
+        self._pos = {}
+        self._base, self._base_scale, self._base_exact, self._nb, self._dead = None, None, None, 0, 0
+        self._mat = np.zeros((0, self.dim), dtype=self.quant)
+        self._scale = self._exact = None
+        self._vocab = {f: [""] for f in META_FIELDS}
+        self._vocab_pos = {f: {"": 0} for f in META_FIELDS}
+        self._drop_ivf()
+
+    def _tail(self):
+        t = self._n - self._nb
+        return self._mat[:t], (self._scale[:t] if self._scale is not None else None)
+
+    def _set_tail(self, start, vecs):
+        """Normalize float32 satırları tail'e (start'tan itibaren) kodlayarak yazar."""
+        codes, scales = quantize.quantize(vecs, self.quant)
+        self._mat[start:start + len(vecs)] = codes
+        if scales is not None:
+            self._scale[start:start + len(vecs)] = scales
+        if self._exact is not None:
+            self._exact[start:start + len(vecs)] = vecs
+
+    def _gather(self, rows):
+        """Satır numaraları -> float32 vektörler (kuantize ise yaklaşık; base/tail karışık olabilir)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        in_base = rows < self._nb
+        if in_base.any():
+            r = rows[in_base]
+            out[in_base] = quantize.dequantize(self._base[r], None if self._base_scale is None else self._base_scale[r])
+        if (~in_base).any():
+            r = rows[~in_base] - self._nb
+            out[~in_base] = quantize.dequantize(self._mat[r], None if self._scale is None else self._scale[r])
+        return out
+
+    def _exact_sources(self):
+        """(base, tail) exact float32 kaynakları; olmayan None. float32 saklamada kodların kendisi."""
+        base = self._base if self._base is not None and self._base.dtype == np.float32 else self._base_exact
+        tail = self._mat if self.quant == "float32" else self._exact
+        return base, tail
+
+    def _has_exact(self):
+        base, tail = self._exact_sources()
+        return (self._nb == 0 or base is not None) and (self._n == self._nb or tail is not None)
+
+    def _exact_rows(self, rows):
+        """Satırların exact float32 vektörleri (_has_exact() True olmalı)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        base, tail = self._exact_sources()
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        in_base = rows < self._nb
+        if in_base.any():
+            out[in_base] = base[rows[in_base]]
+        if (~in_base).any():
+            out[~in_base] = tail[rows[~in_base] - self._nb]
+        return out
+
+    def _matrix(self):
+        """Tüm satırlar tek float32 matris (train/save için); exact kopya varsa o, yoksa kodlardan."""
+        t = self._n - self._nb
+        if self._has_exact():
+            base, tail = self._exact_sources()
+            tail = tail[:t] if tail is not None else np.zeros((0, self.dim), dtype=np.float32)
+        else:
+            base = None if self._base is None else quantize.dequantize(self._base, self._base_scale)
+            tail = quantize.dequantize(*self._tail())
+        if self._base is None:
+            return tail
+        return np.concatenate([np.asarray(base, dtype=np.float32), tail])
+
+    def _dot_all(self, q):
+        codes, scales = self._tail()
+        sims = quantize.dot(codes, scales, q)
+        if self._base is None:
+            return sims
+        return np.concatenate([quantize.dot(self._base, self._base_scale, q), sims])
+
+    def load(self, rows):
+        """rows: (id, method, embedding[, meta]) demetleri. Mevcut içeriği değiştirir."""
+        with self._lock:
+            self._reset()
+            for r in rows:
+                self._add_locked(*r)
+            self.loaded = True
+            self.version += 1
+
+    def add(self, rid, method, emb, meta=None):
+        """Tek satır ekler (aynı id varsa vektörü günceller). meta: report_meta.row_meta biçimi."""
+        with self._lock:
+            ok = self._add_locked(rid, method, emb, meta)
+            if ok:
+                self.version += 1
+            return ok
+
+    def _code(self, field, value):
+        value = report_meta.norm(value)
+        code = self._vocab_pos[field].get(value)
+        if code is None:
+            code = self._vocab_pos[field][value] = len(self._vocab[field])
+            self._vocab[field].append(value)
+        return code
+
+    def _set_meta(self, row, meta):
+        meta = meta or {}
+        day = meta.get("day")
+        if isinstance(day, str):
+            day = report_meta.parse_date(day)
+        self._day[row] = day.toordinal() - _EPOCH if day else _NO_DAY
+        for f in META_FIELDS:
+            self._cat[f][row] = self._code(f, meta.get(f))
+
+    def _add_locked(self, rid, method, emb, meta=None):
+        vec = _as_vector(emb)
+        if vec is None or vec.shape[0] != self.dim:
+            return False
+        rid = str(rid)
+        row = self._pos.get(rid)
+        if row is not None and (row < self._trained_n or row < self._nb):
+            # kümesi değişebilir (ya da memmap salt okunur): yeni satır olarak ekle, eskisini sil
+            self._ids[row] = None
+            self._alive[row] = False
+            self._dead += 1
+            row = None
+        if row is None:
+            self._grow(self._n + 1)
+            row = self._n
+            self._n += 1
+            self._pos[rid] = row
+        self._set_tail(row - self._nb, _normalize(vec)[None, :])
+        self._alive[row] = True
+        self._ids[row] = rid
+        self._methods[row] = method or ""
+        self._is_cadors[row] = (str(method or "") == CADORS_METHOD)
+        self._set_meta(row, meta)
+        return True
+
+    def _filter_mask(self, filters):
+        """report_meta.parse_filters çıktısı -> satır maskesi (filtre yoksa None)."""
+        n = self._n
+        mask = None
+
+        def both(m):
+            return m if mask is None else (mask & m)
+
+        if filters.get("date_from"):
+            mask = both(self._day[:n] >= filters["date_from"].toordinal() - _EPOCH)
+        if filters.get("date_to"):
+            day = self._day[:n]
+            mask = both((day <= filters["date_to"].toordinal() - _EPOCH) & (day != _NO_DAY))
+        for f in report_meta.FILTER_FIELDS:
+            want = filters.get(f)
+            if want:
+                codes = [c for c, v in enumerate(self._vocab[f]) if v and report_meta.matches(f, want, v)]
+                mask = both(np.isin(self._cat[f][:n], codes))
+        return mask
+
+    def _scope_mask(self, scope, exclude_id, filters=None):
+        n = self._n
+        mask = None
+        if scope == "internal":
+            mask = ~self._is_cadors[:n]
+        elif scope == "cadors":
+            mask = self._is_cadors[:n].copy()
+        if filters:
+            fmask = self._filter_mask(filters)
+            if fmask is not None:
+                mask = fmask if mask is None else (mask & fmask)
+        if self._dead:
+            mask = self._alive[:n].copy() if mask is None else (mask & self._alive[:n])
+        if exclude_id is not None:
+            row = self._pos.get(str(exclude_id))
+            if row is not None:
+                if mask is None:
+                    mask = np.ones(n, dtype=bool)
+                mask[row] = False
+        return mask
+
+    # ---------- IVF ----------
+    def _drop_ivf(self):
+        self._centroids = None
+        self._lists = []
+        self._trained_n = 0
+
+    @property
+    def trained(self):
+        return self._centroids is not None
+
+    def train(self, nlist=None, iters=10, sample=50000, seed=0):
+        """Spherical k-means ile IVF kümelerini kurar. nlist verilmezse ~4*sqrt(n)."""
+        with self._lock:
+            n = self._n
+            if n == 0:
+                self._drop_ivf()
+                return
+            nlist = int(nlist or max(1, min(4 * int(np.sqrt(n)), n // 8 or 1)))
+            mat = self._matrix()
+            rng = np.random.default_rng(seed)
+            train_rows = rng.choice(n, size=min(n, sample), replace=False)
+            xs = mat[train_rows]
+            cents = xs[rng.choice(len(xs), size=min(nlist, len(xs)), replace=False)].copy()
+            for _ in range(iters):
+                assign = self._assign(xs, cents)
+                order = np.argsort(assign, kind="stable")
+                used, starts = np.unique(assign[order], return_index=True)
+                # boş kalan kümeler eski merkezini korur
+                cents[used] = np.add.reduceat(xs[order], starts, axis=0)
+                cents /= (np.linalg.norm(cents, axis=1, keepdims=True) + 1e-9)
+            assign = self._assign(mat, cents)
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(cents) + 1))
+            self._centroids = cents
+            self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(cents))]
+            self._trained_n = n
+            self.version += 1
+
+    @staticmethod
+    def _assign(mat, cents, block=8192):
+        out = np.empty(len(mat), dtype=np.int64)
+        for i in range(0, len(mat), block):
+            out[i:i + block] = np.argmax(mat[i:i + block] @ cents.T, axis=1)
+        return out
+
+    def needs_retrain(self, ratio=0.2):
+        """Train sonrası eklenen satırlar corpus'un ratio'sunu geçtiyse True."""
+        return self.trained and (self._n - self._trained_n) > ratio * max(self._trained_n, 1)
+
+    def _candidates(self, q, nprobe):
+        """IVF: en yakın nprobe kümenin satırları + train sonrası eklenen tail satırlar."""
+        probe = np.argsort(-(self._centroids @ q))[:nprobe]
+        parts = [self._lists[c] for c in probe]
+        if self._n > self._trained_n:
+            parts.append(np.arange(self._trained_n, self._n))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    # ---------- Persist ----------
+    def _meta_arrays(self, n):
+        out = {"day": self._day[:n].copy()}
+        for f in META_FIELDS:
+            out[f"cat_{f}"] = self._cat[f][:n].copy()
+            out[f"vocab_{f}"] = np.array(self._vocab[f], dtype=str)
+        return out
+
+    def _restore_meta(self, arrays, n):
+        """_meta_arrays() çıktısını geri yükler (kilit tutulurken; _grow(n) sonrası)."""
+        if "day" not in arrays:
+            raise ValueError("meta dizileri yok (eski format); yeniden kurulmalı")
+        self._day[:n] = arrays["day"]
+        for f in META_FIELDS:
+            self._vocab[f] = arrays[f"vocab_{f}"].tolist()
+            self._vocab_pos[f] = {v: i for i, v in enumerate(self._vocab[f])}
+            self._cat[f][:n] = arrays[f"cat_{f}"]
+
+    def save(self, path, meta=None):
+        """Index'i .npz olarak atomik yazar (tmp + os.replace)."""
+        with self._lock:
+            n = self._n
+            alive = np.array([rid is not None for rid in self._ids[:n]], dtype=bool)
+            data = {
+                "mat": self._matrix(),
+                "ids": np.array([rid or "" for rid in self._ids[:n]], dtype=str),
+                "methods": np.array([m or "" for m in self._methods[:n]], dtype=str),
+                "alive": alive,
+                "trained_n": np.int64(self._trained_n),
+                "meta": np.array(json.dumps(meta or {}, default=str)),
+                **self._meta_arrays(n),
+            }
+            if self.trained:
+                data["centroids"] = self._centroids
+                data["list_sizes"] = np.array([len(l) for l in self._lists], dtype=np.int64)
+                data["list_rows"] = np.concatenate(self._lists) if self._lists else np.empty(0, dtype=np.int64)
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, "wb") as f:
+            np.savez(f, **data)
+        os.replace(tmp, path)
+
+    def load_file(self, path):
+        """save() ile yazılmış index'i okur; meta sözlüğünü döner."""
+        with np.load(path, allow_pickle=False) as z:
+            mat = z["mat"].astype(np.float32, copy=False)
+            ids, methods, alive = z["ids"], z["methods"], z["alive"]
+            trained_n = int(z["trained_n"])
+            meta = json.loads(str(z["meta"]))
+            centroids = z["centroids"] if "centroids" in z.files else None
+            if centroids is not None:
+                sizes, rows = z["list_sizes"], z["list_rows"]
+            arrays = {k: z[k] for k in z.files if k == "day" or k.startswith(("cat_", "vocab_"))}
+        if mat.shape[1] != self.dim:
+            raise ValueError(f"index dim {mat.shape[1]} != {self.dim}")
+        n = len(mat)
+        with self._lock:
+            self._reset()
+            self._grow(n)
+            self._set_tail(0, mat)
+            self._ids[:n] = [rid if ok else None for rid, ok in zip(ids.tolist(), alive.tolist())]
+            self._alive[:n] = alive
+            self._dead = int(n - alive.sum())
+            self._methods[:n] = methods.tolist()
+            self._is_cadors[:n] = (methods == CADORS_METHOD)
+            self._restore_meta(arrays, n)
+            self._n = n
+            self._pos = {rid: i for i, rid in enumerate(self._ids[:n]) if rid is not None}
+            if centroids is not None:
+                self._centroids = centroids.astype(np.float32, copy=False)
+                self._lists = np.split(rows, np.cumsum(sizes)[:-1])
+                self._trained_n = trained_n
+            self.loaded = True
+            self.version += 1
+        return meta
+
+    # ---------- Snapshot (memmap) ----------
+    # <dir>/CURRENT -> "snap-<ts>"; snap-<ts>/ içinde:
+    #   vectors.npy (normalize, float32|float16|int8 kodlar), scales.npy (int8), exact.npy (kuantize ise,
+    #   rerank için float32), ids.npy, methods.npy, alive.npy, meta_arrays.npz (gün / alan kodları), meta.json
+    #   centroids.npy, list_sizes.npy, list_rows.npy (eğitilmişse)
+    #   delta_vectors.bin (ham float32), delta_ids.jsonl, delta.json {"rows", "bytes", "watermark", "recent"}
+    @staticmethod
+    def snapshot_path(directory):
+        """CURRENT'ın gösterdiği snapshot klasörü (yoksa None)."""
+        try:
+            with open(os.path.join(directory, "CURRENT"), encoding="utf-8") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        path = os.path.join(directory, name)
+        return path if name and os.path.isdir(path) else None
+
+    def save_snapshot(self, directory, meta=None, dtype="float32", keep=2, exact=True):
+        """Yeni snap-<ts>/ yazar, CURRENT'ı atomik çevirir; en yeni keep snapshot dışındakileri siler.
+
+        Açık memmap'ler eski dosyaları tutmaya devam eder (silinse de inode yaşar).
+        exact: dtype kuantize ise rerank için float32 kopyayı da yazar (sadece diskte; okunan aday sayfaları)."""
+        quantize.check_mode(dtype)
+        os.makedirs(directory, exist_ok=True)
+        name, seq = time.strftime("snap-%Y%m%d-%H%M%S"), 0
+        while os.path.exists(os.path.join(directory, f"{name}-{seq:03d}")):
+            seq += 1
+        name = f"{name}-{seq:03d}"
+        tmp = os.path.join(directory, name + ".tmp")
+        os.makedirs(tmp)
+        with self._lock:
+            n = self._n
+            mat = self._matrix()
+            codes, scales = quantize.quantize(mat, dtype)
+            np.save(os.path.join(tmp, "vectors.npy"), codes)
+            if scales is not None:
+                np.save(os.path.join(tmp, "scales.npy"), scales)
+            if exact and dtype != "float32":
+                np.save(os.path.join(tmp, "exact.npy"), mat)
+            del mat, codes
+            np.save(os.path.join(tmp, "ids.npy"), np.array([rid or "" for rid in self._ids[:n]], dtype=str))
+            np.save(os.path.join(tmp, "methods.npy"), np.array([m or "" for m in self._methods[:n]], dtype=str))
+            np.save(os.path.join(tmp, "alive.npy"), self._alive[:n].copy())
+            np.savez(os.path.join(tmp, "meta_arrays.npz"), **self._meta_arrays(n))
+            if self.trained:
+                np.save(os.path.join(tmp, "centroids.npy"), self._centroids)
+                np.save(os.path.join(tmp, "list_sizes.npy"), np.array([len(l) for l in self._lists], dtype=np.int64))
+                np.save(os.path.join(tmp, "list_rows.npy"),
+                        np.concatenate(self._lists) if self._lists else np.empty(0, dtype=np.int64))
+            info = dict(meta or {}, n=n, dim=self.dim, dtype=dtype, trained_n=self._trained_n,
+                        exact=bool(exact and dtype != "float32"))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(info, f, default=str)
+        os.replace(tmp, os.path.join(directory, name))
+        _write_atomic(os.path.join(directory, "CURRENT"), name)
+        old = sorted(d for d in os.listdir(directory) if d.startswith("snap-") and d != name)
+        for d in old[:max(0, len(old) - (keep - 1))]:
+            shutil.rmtree(os.path.join(directory, d), ignore_errors=True)
+        return os.path.join(directory, name)
+
+    def load_snapshot(self, directory):
+        """CURRENT snapshot'ı memmap ile açar, delta log'u tail'e ekler; meta döner (watermark delta'dan günceldir)."""
+        path = self.snapshot_path(directory)
+        if path is None:
+            raise FileNotFoundError(f"{directory}: snapshot yok")
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        base = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        if base.ndim != 2 or base.shape[1] != self.dim:
+            raise ValueError(f"snapshot dim {base.shape[-1]} != {self.dim}")
+        ids = np.load(os.path.join(path, "ids.npy"))
+        methods = np.load(os.path.join(path, "methods.npy"))
+        alive = np.load(os.path.join(path, "alive.npy"))
+        meta_path = os.path.join(path, "meta_arrays.npz")
+        if not os.path.exists(meta_path):
+            raise ValueError(f"{path}: meta_arrays.npz yok (eski snapshot); yeniden build edin")
+        with np.load(meta_path) as z:
+            arrays = {k: z[k] for k in z.files}
+        scales = np.load(os.path.join(path, "scales.npy")) if base.dtype == np.int8 else None
+        exact = None
+        if base.dtype != np.float32 and os.path.exists(os.path.join(path, "exact.npy")):
+            exact = np.load(os.path.join(path, "exact.npy"), mmap_mode="r")
+        has_ivf = os.path.exists(os.path.join(path, "centroids.npy"))
+        if has_ivf:
+            centroids = np.load(os.path.join(path, "centroids.npy")).astype(np.float32, copy=False)
+            sizes = np.load(os.path.join(path, "list_sizes.npy"))
+            rows = np.load(os.path.join(path, "list_rows.npy"))
+        delta, delta_rows = _read_delta(path, self.dim)
+        n = len(base)
+        with self._lock:
+            self._reset()
+            self._base, self._base_scale, self._base_exact, self._nb = base, scales, exact, n
+            self._grow(n)
+            self._ids[:n] = [rid if ok else None for rid, ok in zip(ids.tolist(), alive.tolist())]
+            self._alive[:n] = alive
+            self._dead = int(n - alive.sum())
+            self._methods[:n] = methods.tolist()
+            self._is_cadors[:n] = (methods == CADORS_METHOD)
+            self._restore_meta(arrays, n)
+            self._n = n
+            self._pos = {rid: i for i, rid in enumerate(self._ids[:n]) if rid is not None}
+            if has_ivf:
+                self._centroids = centroids
+                self._lists = np.split(rows, np.cumsum(sizes)[:-1])
+                self._trained_n = int(meta.get("trained_n", n))
+            for rid, method, vec, row_meta in delta_rows:
+                self._add_locked(rid, method, vec, row_meta)
+            self.loaded = True
+            self.version += 1
+        if delta.get("watermark"):
+            meta["watermark"] = delta["watermark"]
+        meta["delta_rows"] = delta.get("rows", 0)
+        return meta
+
+    @staticmethod
+    def append_delta(directory, rows, watermark, dim=1536, recent=None):
+        """Snapshot'tan sonraki satırları (id, method, embedding[, meta]) CURRENT'ın delta log'una ekler.
+        recent: okuyanın tekrar kontrolü için delta.json'a yazılan {id: damga} (watermark.py OVERLAP penceresi).
+
+        Tek yazar varsayılır (CLI). Önce veri dosyaları yazılır, sonra delta.json atomik güncellenir;
+        yarıda kalan yazma okuyucuya görünmez ve bir sonraki append'te kesilip atılır."""
+        path = EmbeddingIndex.snapshot_path(directory)
+        if path is None:
+            raise FileNotFoundError(f"{directory}: snapshot yok")
+        state = _delta_state(path)
+        vec_path = os.path.join(path, "delta_vectors.bin")
+        ids_path = os.path.join(path, "delta_ids.jsonl")
+        added = 0
+        with open(vec_path, "ab") as fv, open(ids_path, "ab") as fi:
+            fv.truncate(state["rows"] * dim * 4)
+            fi.truncate(state["bytes"])
+            for rid, method, emb, *row_meta in rows:
+                vec = _as_vector(emb)
+                if vec is None or vec.shape[0] != dim:
+                    continue
+                fv.write(_normalize(vec).astype(np.float32).tobytes())
+                line = [str(rid), method or "", (row_meta or [None])[0]]
+                fi.write((json.dumps(line, default=str) + "\n").encode("utf-8"))
+                added += 1
+            fv.flush(); fi.flush()
+            os.fsync(fv.fileno()); os.fsync(fi.fileno())
+            size = fi.tell()
+        state = {"rows": state["rows"] + added, "bytes": size,
+                 "watermark": str(watermark) if watermark else state.get("watermark"),
+                 "recent": recent if recent is not None else state.get("recent", {})}
+        _write_atomic(os.path.join(path, "delta.json"), json.dumps(state))
+        return added
+
+    def _prefilter_limit(self, nprobe):
+        """Filtreden geçen satır sayısı bunun altındaysa sadece onlar skorlanır.
+        Tam taramada satırların yarısı (gather + çarpım, akan matris çarpımının ~2 katı maliyet);
+        IVF'de beklenen aday sayısının birkaç katı (filtreli IVF'nin k'yı dolduramaması da önlenir)."""
+        if not nprobe:
+            return self._n // 2
+        expected = self._trained_n * nprobe / max(len(self._lists), 1) + (self._n - self._trained_n)
+        return int(4 * expected)
+
+    @property
+    def quantized(self):
+        return self.quant != "float32" or (self._base is not None and self._base.dtype != np.float32)
+
+    def search(self, q_emb, k=10, min_sim=0.60, scope="all", exclude_id=None, nprobe=None, rerank=None,
+               filters=None):
+        """[(id, sim), ...] — benzerliğe göre azalan, en fazla k adet.
+
+        IVF kuruluysa nprobe küme taranır (recall/latency ayarı); nprobe=0 ya da
+        index eğitilmemişse tam tarama yapılır. filters (report_meta.parse_filters) seçici ise
+        sadece eşleşen satırlar (tam, IVF'siz) skorlanır. Kuantize index'te rerank (varsayılan self.rerank)
+        > 0 ise en iyi k*rerank aday exact float32 ile yeniden skorlanır; dönen skorlar o zaman exact'tir.
+        """
+        q = _as_vector(q_emb)
+        if q is None or q.shape[0] != self.dim:
+            return []
+        q = _normalize(q)
+        rerank = self.rerank if rerank is None else int(rerank)
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return []
+            mask = self._scope_mask(scope, exclude_id, filters)
+            ids = self._ids[:n]
+            ivf = self.trained and nprobe != 0
+            selected = np.flatnonzero(mask) if filters and mask is not None else None
+            if selected is not None and len(selected) <= self._prefilter_limit((nprobe or 8) if ivf else 0):
+                rows, mask = selected, None
+                sims = self._gather(rows) @ q
+            elif ivf:
+                rows = self._candidates(q, nprobe or 8)
+                sims = self._gather(rows) @ q
+            else:
+                rows = None
+                sims = self._dot_all(q)
+            if mask is not None:
+                sims = np.where(mask[rows] if rows is not None else mask, sims, -np.inf)
+            if len(sims) == 0:
+                return []
+            rerank = rerank if rerank > 0 and self.quantized and self._has_exact() else 0
+            kk = min(k * rerank if rerank else k, len(sims))
+            top = np.argpartition(-sims, kk - 1)[:kk]
+            hits = rows[top] if rows is not None else top
+            scores = sims[top]
+            if rerank:
+                scores = np.where(np.isneginf(scores), -np.inf, self._exact_rows(hits) @ q)
+        order = np.argsort(-scores)[:k]
+        pairs = ((ids[hits[i]], scores[i]) for i in order)
+        return [(rid, float(sim)) for rid, sim in pairs if sim >= min_sim and rid is not None]
+
+    def similarity(self, q_emb, rids):
+        """{id: kosinüs} — verilen id'ler için (index'te olmayanlar atlanır); exact kopya varsa exact skor.
+        Hibrit aramada sözcüksel adayların vektör skoru (app.find_similar)."""
+        q = _as_vector(q_emb)
+        if q is None or q.shape[0] != self.dim:
+            return {}
+        q = _normalize(q)
+        with self._lock:
+            found = [(str(rid), self._pos.get(str(rid))) for rid in rids]
+            found = [(rid, row) for rid, row in found if row is not None and self._ids[row] is not None]
+            if not found:
+                return {}
+            rows = [row for _, row in found]
+            vecs = self._exact_rows(rows) if self._has_exact() else self._gather(rows)
+        return {rid: float(sim) for (rid, _), sim in zip(found, vecs @ q)}
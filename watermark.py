@@ -0,0 +1,84 @@
+# watermark.py
+# Index senkronu için "embedding ne zaman yazıldı" damgası: sreports.embedded_at / sreport_passages.embedded_at.
+# created_at yetmez: toplu COPY ile gelen CADORS satırları (ingest_cadors --bulk) embedding'i sonradan alır
+# (check_embeddings --backfill, ingest_cadors --reembed); created_at watermark'ı bu satırları hiç görmez.
+# Trigger embedding (raporda meta kolonları da) yazıldığında damgayı clock_timestamp() ile günceller.
+#
+# Geç commit: damga commit'ten önce atılır; watermark'tan sonra commit edilen bir satırın damgası watermark'ın
+# gerisinde kalabilir. Okuyanlar (app.py _sync, embedding_snapshot.py delta) bu yüzden OVERLAP kadar geriden
+# okur ve aynı (id, damga) çiftini ikinci kez uygulamaz (recent).
+#
+# Env:
+#   INDEX_SYNC_OVERLAP (300 s; en uzun embedding yazan transaction'dan uzun olmalı)
+#
+# Şema bir kez kurulur: backfill UPDATE'i tüm tabloyu tarar, DROP/CREATE TRIGGER tabloyu ACCESS EXCLUSIVE kilitler.
+# ensure_schema katalogdan (fonksiyon yorumu SCHEMA_VERSION + iki trigger) kontrol eder; kuruluysa hiçbir şey yapmaz.
+# Trigger tanımı değişirse SCHEMA_VERSION artırılır, bir sonraki açılış şemayı yeniden kurar.
+
+import os
+import datetime
+
+OVERLAP = datetime.timedelta(seconds=float(os.getenv("INDEX_SYNC_OVERLAP", "300")))
+# npz / snapshot meta'sında; yoksa watermark created_at'tendir ve dosya yeniden kurulur
+KIND = "embedded_at"
+SCHEMA_VERSION = "watermark v1"
+
+SCHEMA_SQL = """
+ALTER TABLE sreports ADD COLUMN IF NOT EXISTS embedded_at TIMESTAMP;
+ALTER TABLE sreport_passages ADD COLUMN IF NOT EXISTS embedded_at TIMESTAMP;
+UPDATE sreports SET embedded_at = created_at WHERE embedded_at IS NULL AND embedding IS NOT NULL;
+UPDATE sreport_passages SET embedded_at = created_at WHERE embedded_at IS NULL AND embedding IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_sreports_embedded_at ON sreports (embedded_at);
+CREATE INDEX IF NOT EXISTS idx_passages_embedded_at ON sreport_passages (embedded_at);
+
+CREATE OR REPLACE FUNCTION touch_embedded_at() RETURNS trigger AS $$
+BEGIN
+    NEW.embedded_at := clock_timestamp();
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_sreports_embedded_at ON sreports;
+CREATE TRIGGER trg_sreports_embedded_at
+    BEFORE INSERT OR UPDATE OF embedding, occurred_on, aerodrome, province, aircraft, phase ON sreports
+    FOR EACH ROW WHEN (NEW.embedding IS NOT NULL) EXECUTE PROCEDURE touch_embedded_at();
+
+DROP TRIGGER IF EXISTS trg_passages_embedded_at ON sreport_passages;
+CREATE TRIGGER trg_passages_embedded_at
+    BEFORE INSERT OR UPDATE OF embedding ON sreport_passages
+    FOR EACH ROW WHEN (NEW.embedding IS NOT NULL) EXECUTE PROCEDURE touch_embedded_at();
+
+COMMENT ON FUNCTION touch_embedded_at() IS '{version}';
+""".format(version=SCHEMA_VERSION)
+
+# Kurulu mu: fonksiyon yorumu sürümle aynı ve iki trigger da duruyor
+INSTALLED_SQL = """
+SELECT obj_description(to_regprocedure('touch_embedded_at()'), 'pg_proc') = %s
+   AND (SELECT count(*) FROM pg_trigger
+         WHERE tgname IN ('trg_sreports_embedded_at', 'trg_passages_embedded_at') AND NOT tgisinternal) = 2;
+"""
+
+
+def ensure_schema(conn):
+    """sreports meta kolonları (report_meta) ve sreport_passages (passages) önceden oluşturulmuş olmalı."""
+    cur = conn.cursor()
+    cur.execute(INSTALLED_SQL, (SCHEMA_VERSION,))
+    if not cur.fetchone()[0]:
+        cur.execute(SCHEMA_SQL)
+    conn.commit(); cur.close()
+
+
+def since(watermark):
+    """Okuma alt sınırı: watermark - OVERLAP (None -> None, tam yükleme)."""
+    if watermark is None:
+        return None
+    if isinstance(watermark, str):
+        watermark = datetime.datetime.fromisoformat(watermark)
+    return watermark - OVERLAP
+
+
+def prune(recent, watermark):
+    """recent {id: damga} içinden OVERLAP penceresinin dışında kalanları atar."""
+    low = since(watermark)
+    if low is None:
+        return {}
+    return {rid: ts for rid, ts in recent.items() if ts > low}